@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""usage: {} [FUNCTIONS]
+
+Parses FUNCTIONS copies of a small program and reports how many bytes
+each AST node takes, both as Node objects and as the string-tagged
+tuples the parser used to build.  Strings and numbers held by the
+tree are shared with the tokens and aren't counted.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from lexer import lex
+from parser import NODES, Node, Parser
+
+
+PROGRAM = """
+int gcd{0}(int a, int b) {{
+    while (a != b) {{
+        if (a > b) a -= b;
+        else       b -= a;
+    }}
+
+    return a;
+}}
+
+int fib{0}(int n) {{
+    if (n < 2) return n;
+    return fib{0}(n - 1) + fib{0}(n - 2);
+}}
+
+void main{0}() {{
+    int i = 0;
+    int s = 0;
+
+    while (i < 100) {{
+        s = s + gcd{0}(i * 3, 12) * fib{0}(i % 10) - (i << 2);
+        i = i + 1;
+    }}
+
+    print(s, "done", 'c');
+}}
+"""
+
+
+def as_tuple(node):
+    "Converts a node to the equivalent string-tagged tuple."
+    if not isinstance(node, Node):
+        if isinstance(node, tuple):
+            return tuple(as_tuple(child) for child in node)
+        return node
+
+    values = [NODES[node.kind]]
+
+    for _, value in node.fields:
+        if isinstance(value, tuple) and not isinstance(value, Node):
+            values.extend(as_tuple(child) for child in value)
+        else:
+            values.append(as_tuple(value))
+
+    return tuple(values)
+
+
+def walk(root):
+    "Yields every container reachable from root: nodes and tuples."
+    stack, seen = [root], set()
+
+    while stack:
+        value = stack.pop()
+
+        if id(value) in seen:
+            continue
+
+        seen.add(id(value))
+
+        if isinstance(value, Node):
+            yield value
+
+            if isinstance(value, tuple):
+                stack.extend(value)
+            else:
+                stack.extend(child for _, child in value.fields)
+        elif isinstance(value, tuple):
+            yield value
+            stack.extend(value)
+
+
+def main(args):
+    functions = int(args[1]) if len(args) > 1 else 2000
+    success, tokens = lex("".join(PROGRAM.format(i) for i in range(functions)))
+    assert success, tokens
+
+    start = time.time()
+    tree = tuple(Parser(tokens).parse())
+    elapsed = time.time() - start
+
+    nodes = sum(1 for value in walk(tree) if isinstance(value, Node))
+    after = sum(sys.getsizeof(value) for value in walk(tree))
+    before = sum(sys.getsizeof(value) for value in walk(as_tuple(tree)))
+
+    print "{} tokens, {} nodes, parsed in {:.3f}s".format(
+        len(tokens), nodes, elapsed
+    )
+    print "{:>8} {:>12} {:>10}".format("form", "bytes", "bytes/node")
+    print "{:>8} {:>12} {:>10.1f}".format("tuples", before, float(before) / nodes)
+    print "{:>8} {:>12} {:>10.1f}".format("nodes", after, float(after) / nodes)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
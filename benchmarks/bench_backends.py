@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""usage: {} [FUNCTIONS...]
+
+Times compiling modules made up of FUNCTIONS functions end to end, from
+source to code object, through the ast backend and through the bytecode
+backend, and reports the speedup.  Then times a loop-heavy kernel
+compiled by either backend.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from codegen import BytecodeCodegen, Codegen
+from lexer import lex
+from parser import Parser
+
+
+FUNCTION = """
+int f{0}(int a, int b) {{
+    int i = 0;
+    int s = 0;
+
+    while (i < a) {{
+        if (i % 3 == 0) s += i * b - (a << 2);
+        else if (i % 3 == 1) s -= f{0}(i, b) / 2;
+        else s = s + -i;
+        i = i + 1;
+    }}
+
+    for (i = 0; i < b; i++) {{
+        if (!(i & 1) && s != 0) continue;
+        s -= i;
+    }}
+
+    print(s, "done", 'c', a > b && b > 0 || !a);
+    return s;
+}}
+"""
+
+KERNEL = """
+int kernel(int n) {
+    int s = 0;
+    int i = 0;
+    int j;
+
+    while (i < n) {
+        for (j = 0; j < 100; j++) {
+            if (j % 7 == 0) continue;
+            if (!(i & j)) s += j;
+            else s -= 1;
+        }
+        i++;
+    }
+
+    return s;
+}
+"""
+
+
+def compile_source(backend, source):
+    "Compile source into a module code object the way cobra does."
+    success, tokens = lex(source)
+    assert success, tokens
+
+    return backend(Parser(tokens)).gen_code("<bench>")
+
+
+def best(function, repeat=3):
+    "The best time of repeat calls to function, and its last result."
+    fastest = None
+
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+
+        if fastest is None or elapsed < fastest:
+            fastest = elapsed
+
+    return fastest, result
+
+
+def bench_compile(functions):
+    source = "".join(FUNCTION.format(i) for i in range(functions))
+
+    slow, _ = best(lambda: compile_source(Codegen, source))
+    fast, _ = best(lambda: compile_source(BytecodeCodegen, source))
+    return slow, fast
+
+
+def bench_kernel(backend, n=2000):
+    namespace = {}
+    exec compile_source(backend, KERNEL) in namespace
+    return best(lambda: namespace["kernel"](n))
+
+
+def main(args):
+    sizes = map(int, args[1:]) or [50, 200, 500]
+
+    print "{:>10} {:>10} {:>10} {:>10}".format(
+        "functions", "ast", "bytecode", "speedup"
+    )
+
+    for functions in sizes:
+        slow, fast = bench_compile(functions)
+        print "{:>10} {:>10.4f} {:>10.4f} {:>9.1f}x".format(
+            functions, slow, fast, slow / fast
+        )
+
+    slow, expected = bench_kernel(Codegen)
+    fast, result = bench_kernel(BytecodeCodegen)
+    assert result == expected
+
+    print
+    print "{:>10} {:>10.4f} {:>10.4f} {:>9.2f}x".format(
+        "kernel", slow, fast, slow / fast
+    )
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""usage: {} [FUNCTIONS...]
+
+Times Codegen.gen_module over modules made up of FUNCTIONS functions
+and reports its throughput in AST nodes per second, which should stay
+flat as modules grow.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from codegen import Codegen
+from lexer import lex
+from parser import Node, Parser
+
+
+FUNCTION = """
+int f{0}(int a, int b) {{
+    int i = 0;
+    int s = 0;
+
+    while (i < a) {{
+        if (i % 3 == 0) s += i * b - (a << 2);
+        else if (i % 3 == 1) s -= f{0}(i, b) / 2;
+        else s = s + -i;
+        i = i + 1;
+    }}
+
+    print(s, "done", 'c', a > b && b > 0 || !a);
+    return s;
+}}
+"""
+
+
+class Tree(object):
+    "Stands in for a Parser, replaying an already parsed tree."
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def parse(self):
+        return iter(self.nodes)
+
+
+def count(nodes):
+    "Counts the Nodes in a tree."
+    total, stack = 0, list(nodes)
+
+    while stack:
+        value = stack.pop()
+
+        if isinstance(value, Node):
+            total += 1
+            stack.extend(child for _, child in value.fields)
+        elif isinstance(value, tuple):
+            stack.extend(value)
+
+    return total
+
+
+def bench(functions, repeat=3):
+    success, tokens = lex("".join(FUNCTION.format(i) for i in range(functions)))
+    assert success, tokens
+
+    nodes = tuple(Parser(tokens).parse())
+    best = None
+
+    for _ in range(repeat):
+        start = time.time()
+        Codegen(Tree(nodes)).gen_module()
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return count(nodes), best
+
+
+def main(args):
+    sizes = map(int, args[1:]) or [250, 500, 1000, 2000, 4000]
+
+    print "{:>10} {:>10} {:>10} {:>12}".format(
+        "functions", "nodes", "seconds", "nodes/second"
+    )
+
+    for functions in sizes:
+        nodes, elapsed = bench(functions)
+        print "{:>10} {:>10} {:>10.4f} {:>12.0f}".format(
+            functions, nodes, elapsed, nodes / elapsed
+        )
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""usage: {} [N...]
+
+Times a call-heavy loop over N iterations, once with called globals
+bound to locals on function entry and once looked up on every call, and
+reports the speedup.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from codegen import Codegen
+from lexer import lex
+from parser import Parser
+
+
+PROGRAM = """
+int step(int x) {
+    if (x % 2 == 0) return x / 2;
+    return 3 * x + 1;
+}
+
+int clamp(int x, int high) {
+    if (x > high) return high;
+    return x;
+}
+
+int kernel(int n) {
+    int i = 0;
+    int s = 0;
+
+    while (i < n) {
+        s = clamp(s + step(i) + step(step(i)), 1000000);
+        i = i + 1;
+    }
+
+    return s;
+}
+"""
+
+
+def build(hoist):
+    success, tokens = lex(PROGRAM)
+    assert success, tokens
+
+    namespace = {}
+    module = Codegen(Parser(tokens), hoist=hoist).gen_module()
+    exec compile(module, "<bench>", "exec") in namespace
+    return namespace["kernel"]
+
+
+def bench(kernel, n, repeat=5):
+    best = None
+
+    for _ in range(repeat):
+        start = time.time()
+        kernel(n)
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main(args):
+    sizes = map(int, args[1:]) or [10000, 100000, 1000000]
+    hoisted, looked_up = build(True), build(False)
+
+    print "{:>10} {:>10} {:>10} {:>8}".format("n", "globals", "locals", "speedup")
+
+    for n in sizes:
+        assert hoisted(n) == looked_up(n)
+
+        slow, fast = bench(looked_up, n), bench(hoisted, n)
+        print "{:>10} {:>10.4f} {:>10.4f} {:>7.2f}x".format(
+            n, slow, fast, slow / fast
+        )
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""usage: {} [STATEMENTS...]
+
+Times Parser.parse over a single function made up of STATEMENTS copies
+of a postfix increment (`i++;`) and of an expression-heavy statement.
+Time per statement should stay flat as the input grows.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from lexer import lex
+from parser import Parser
+
+
+WORKLOADS = (
+    ("postfix",    "i++;"),
+    ("expression", "x = (a + b * c - d / e) << 2 || f(g, -h) && !k;"),
+)
+
+
+def source(statement, statements):
+    return "void main() {\n    int i = 0;\n" + \
+           "    {}\n".format(statement) * statements + \
+           "}\n"
+
+
+def bench(statement, statements, repeat=3):
+    success, tokens = lex(source(statement, statements))
+    assert success, tokens
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.time()
+        list(Parser(tokens).parse())
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main(args):
+    sizes = map(int, args[1:]) or [1000, 2000, 4000, 8000, 16000]
+
+    print "{:>10} {:>10} {:>10} {:>12}".format(
+        "workload", "statements", "seconds", "us/statement"
+    )
+
+    for name, statement in WORKLOADS:
+        for statements in sizes:
+            elapsed = bench(statement, statements)
+            print "{:>10} {:>10} {:>10.4f} {:>12.2f}".format(
+                name, statements, elapsed, elapsed / statements * 1e6
+            )
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,145 @@
+"""On-disk cache of compiled code objects.
+
+Entries are marshalled code objects named after a hash of everything
+that went into them: the source text plus whatever the caller salts
+the key with (cobra's version, compile options, the file name).  The
+interpreter's bytecode magic is always part of the key, so an edited
+file or an upgraded cobra or Python simply misses and never needs
+explicit invalidation.  Old entries are evicted least recently used
+first once the cache grows past its size cap.
+"""
+
+import hashlib
+import imp
+import marshal
+import os
+import tempfile
+
+# Where entries live unless told otherwise.
+CACHE_DIR = os.environ.get("COBRA_CACHE") or os.path.join(
+    os.path.expanduser("~"), ".cache", "cobra"
+)
+
+# Maximum total size of the cache in bytes.
+CACHE_SIZE = 64 * 1024 * 1024
+
+_CHUNK_SIZE = 64 * 1024
+_SUFFIX = ".cbc"
+
+
+def source_key(file_, *salts):
+    """Hash the contents of file_ together with salts.  The file is read
+    in chunks from its current position and left at EOF."""
+    digest = hashlib.sha1(imp.get_magic())
+    for salt in salts:
+        digest.update(repr(salt))
+        digest.update("\0")
+
+    for chunk in iter(lambda: file_.read(_CHUNK_SIZE), ""):
+        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class Cache(object):
+    """A directory of marshalled code objects.
+
+    The cache is best effort: any I/O error while reading or writing an
+    entry is treated as a miss, so a read-only or full disk never stops
+    a program from running.
+    """
+
+    def __init__(self, path=CACHE_DIR, max_size=CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+    def entry(self, key):
+        return os.path.join(self.path, key + _SUFFIX)
+
+    def get(self, key):
+        "Return the code object stored under key or None."
+        entry = self.entry(key)
+        try:
+            with open(entry, "rb") as file_:
+                code = marshal.load(file_)
+        except (IOError, OSError):
+            return None
+        except (EOFError, ValueError, TypeError):
+            self.discard(entry)
+            return None
+
+        try:
+            # Bump the access time used for LRU eviction.
+            os.utime(entry, None)
+        except OSError:
+            pass
+
+        return code
+
+    def put(self, key, code):
+        """Store code under key.  The entry is written to a temporary
+        file and renamed into place so concurrent readers never see a
+        partial entry."""
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+
+            fd, temp = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        except (IOError, OSError):
+            return False
+
+        try:
+            with os.fdopen(fd, "wb") as file_:
+                marshal.dump(code, file_)
+
+            os.rename(temp, self.entry(key))
+        except (IOError, OSError):
+            self.discard(temp)
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        "Remove least recently used entries until the cache fits max_size."
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+
+        entries, size = [], 0
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+
+            entry = os.path.join(self.path, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            size += stat.st_size
+
+        entries.sort()
+        for _, entry_size, entry in entries:
+            if size <= self.max_size:
+                break
+
+            self.discard(entry)
+            size -= entry_size
+
+    def clear(self):
+        "Remove every entry."
+        max_size, self.max_size = self.max_size, -1
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
+
+    @staticmethod
+    def discard(entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
@@ -1 +1,2 @@
 from .codegen import *
+from .bytecode import *
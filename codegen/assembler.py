@@ -0,0 +1,444 @@
+"""Assembly of CPython 2.7 code objects.
+
+Instructions are built up symbolically: jumps target Labels, constants
+and names are given by value, and the LOAD and STORE pseudo-ops name a
+variable without saying where it lives.  assemble resolves all of that,
+once every instruction is known, into a code object.
+"""
+
+import opcode
+import types
+
+
+CO_OPTIMIZED = 0x01
+CO_NEWLOCALS = 0x02
+CO_NOFREE = 0x40
+
+# Instructions that never fall through to the next one.
+TERMINATORS = frozenset(("RETURN_VALUE", "JUMP_ABSOLUTE", "JUMP_FORWARD"))
+
+# Unconditional jumps, and every jump.
+JUMPS = frozenset(("JUMP_ABSOLUTE", "JUMP_FORWARD"))
+BRANCHES = frozenset(opcode.opname[op] for op in opcode.hasjrel + opcode.hasjabs)
+
+# {conditional jump: the jump taken in the opposite case}
+INVERSES = {
+    "POP_JUMP_IF_FALSE": "POP_JUMP_IF_TRUE",
+    "POP_JUMP_IF_TRUE":  "POP_JUMP_IF_FALSE",
+}
+
+# {instruction: stack effect} for instructions whose effect doesn't
+# depend on their argument.
+EFFECTS = {
+    "POP_TOP":           -1,
+    "ROT_TWO":           0,
+    "ROT_THREE":         0,
+    "ROT_FOUR":          0,
+    "DUP_TOP":           1,
+    "UNARY_POSITIVE":    0,
+    "UNARY_NEGATIVE":    0,
+    "UNARY_NOT":         0,
+    "UNARY_INVERT":      0,
+    "STORE_SUBSCR":      -3,
+    "GET_ITER":          0,
+    "RETURN_VALUE":      -1,
+    "LOAD_CONST":        1,
+    "LOAD":              1,
+    "STORE":             -1,
+    "COMPARE_OP":        -1,
+    "IMPORT_NAME":       -1,
+    "IMPORT_FROM":       1,
+    "JUMP_ABSOLUTE":     0,
+    "JUMP_FORWARD":      0,
+    "POP_JUMP_IF_FALSE": -1,
+    "POP_JUMP_IF_TRUE":  -1,
+}
+EFFECTS.update((op, -1) for op in opcode.opmap
+               if op.startswith("BINARY_") or op.startswith("INPLACE_"))
+
+# {instruction: stack effect given its argument}
+ARGUMENT_EFFECTS = {
+    "CALL_FUNCTION":   lambda arg: -arg,
+    "BUILD_LIST":      lambda arg: 1 - arg,
+    "BUILD_TUPLE":     lambda arg: 1 - arg,
+    "DUP_TOPX":        lambda arg: arg,
+    "MAKE_FUNCTION":   lambda arg: -arg,
+    "UNPACK_SEQUENCE": lambda arg: arg - 1,
+}
+
+# {instruction: (effect when falling through, effect when jumping)} for
+# jumps whose effect depends on whether they are taken.
+BRANCH_EFFECTS = {
+    "FOR_ITER":             (1, -1),
+    "JUMP_IF_FALSE_OR_POP": (-1, 0),
+    "JUMP_IF_TRUE_OR_POP":  (-1, 0),
+}
+
+# Instructions whose argument is a name.
+NAMED = frozenset(("LOAD_NAME", "STORE_NAME", "LOAD_GLOBAL", "STORE_GLOBAL",
+                   "IMPORT_NAME", "IMPORT_FROM"))
+
+
+def _key(value):
+    """A key telling apart constants that compare equal but aren't
+    interchangeable, like 0, 0.0, -0.0 and False."""
+    if isinstance(value, tuple):
+        return tuple, tuple(map(_key, value))
+    if isinstance(value, float):
+        return float, repr(value)
+    if isinstance(value, types.CodeType):
+        return types.CodeType, id(value)
+    return type(value), value
+
+
+class Label(object):
+    "A position among the instructions, for jumps to target."
+    __slots__ = ("position",)
+
+    def __init__(self):
+        self.position = None
+
+
+class Assembler(object):
+    """Collects the instructions of a function, or of a module when
+    function is False, and assembles them into a code object named name.
+
+    Instructions are kept as parallel lists of operation names and
+    arguments.  LOAD and STORE are resolved the way the compiler scopes
+    names: in a function, the parameters and every name it stores to are
+    fast locals and any other name is a global, while a module looks
+    every name up by name.
+    """
+
+    def __init__(self, name, filename, parameters=(), function=True):
+        self.name = name
+        self.filename = filename
+        self.parameters = tuple(parameters)
+        self.function = function
+
+        self.ops = []
+        self.args = []
+
+        # The positions of the jumps, and every label marked.
+        self.jumps = []
+        self.labels = []
+
+        # (position, line) for each line the instructions from position
+        # on were generated from.
+        self.lines = []
+
+    def emit(self, op, arg=None):
+        self.ops.append(op)
+        self.args.append(arg)
+
+    def jump(self, op, label):
+        "Emit the jump op to label."
+        self.jumps.append(len(self.ops))
+        self.ops.append(op)
+        self.args.append(label)
+
+    def mark(self, label):
+        "Put label at the current position."
+        label.position = len(self.ops)
+        self.labels.append(label)
+
+    def line(self, line):
+        "Say the instructions emitted from now on come from line."
+        self.lines.append((len(self.ops), line))
+
+    def prepend(self, instructions):
+        "Insert the (op, arg) pairs in instructions before all the others."
+        count = len(instructions)
+
+        for label in self.labels:
+            label.position += count
+        self.jumps = [position + count for position in self.jumps]
+        self.lines = [(position + count, line) for position, line in self.lines]
+
+        self.ops[:0] = [op for op, _ in instructions]
+        self.args[:0] = [arg for _, arg in instructions]
+
+    def variables(self):
+        "The names of the function's fast locals, parameters first."
+        names = list(self.parameters)
+        seen = set(names)
+
+        for op, arg in zip(self.ops, self.args):
+            if op == "STORE" and arg not in seen:
+                seen.add(arg)
+                names.append(arg)
+
+        return names
+
+    def names(self):
+        "Every variable name LOAD and STORE refer to, parameters included."
+        names = set(self.parameters)
+        names.update(arg for op, arg in zip(self.ops, self.args)
+                     if op == "LOAD" or op == "STORE")
+        return names
+
+    def assemble(self, firstlineno=1):
+        self.thread()
+        depths, stacksize = self.flow()
+        kept = self.kept(depths)
+
+        varnames = self.variables() if self.function else []
+        consts, names, code, lnotab = self.resolve(kept, varnames, firstlineno)
+
+        flags = CO_NOFREE
+        if self.function:
+            flags |= CO_OPTIMIZED | CO_NEWLOCALS
+
+        return types.CodeType(
+            len(self.parameters), len(varnames), stacksize, flags, code,
+            tuple(consts), tuple(names), tuple(varnames),
+            self.filename, self.name, firstlineno, lnotab,
+        )
+
+    def thread(self):
+        """Thread jumps to unconditional jumps through to their final
+        target, and turn conditional jumps over an unconditional jump
+        into one conditional jump the other way."""
+        ops, args = self.ops, self.args
+        end = len(ops)
+
+        for position in self.jumps:
+            label, seen = args[position], set()
+
+            while (label.position < end and ops[label.position] in JUMPS and
+                   label not in seen):
+                seen.add(label)
+                label = args[label.position]
+
+                # The final target may be behind a forward jump.
+                if ops[position] == "JUMP_FORWARD":
+                    ops[position] = "JUMP_ABSOLUTE"
+
+            args[position] = label
+
+        # `if (c) break;` jumps over the jump out of the loop when c is
+        # false; it may as well jump out when c is true.  The jump left
+        # behind goes to the next instruction, so it is dropped later.
+        for position in self.jumps:
+            op = ops[position]
+
+            if (op in INVERSES and position + 1 < end and
+                    ops[position + 1] in JUMPS and
+                    args[position].position == position + 2):
+                ops[position] = INVERSES[op]
+                args[position], args[position + 1] = (args[position + 1],
+                                                      args[position])
+
+    def flow(self):
+        """Follow every path through the instructions, returning the
+        depth of the stack before each one, None for the ones no path
+        reaches, and the deepest the stack gets."""
+        ops, args = self.ops, self.args
+        end = len(ops)
+        depths = [None] * end
+        pending = [(0, 0)]
+        deepest = 0
+
+        while pending:
+            position, depth = pending.pop()
+
+            while position < end and depths[position] is None:
+                depths[position] = depth
+                op = ops[position]
+
+                if op in EFFECTS:
+                    effect = jumped = EFFECTS[op]
+                elif op in BRANCH_EFFECTS:
+                    effect, jumped = BRANCH_EFFECTS[op]
+                else:
+                    effect = ARGUMENT_EFFECTS[op](args[position])
+
+                if op in BRANCHES:
+                    jumped += depth
+                    deepest = max(deepest, jumped)
+                    pending.append((args[position].position, jumped))
+
+                depth += effect
+                if depth > deepest:
+                    deepest = depth
+
+                if op in TERMINATORS:
+                    break
+                position += 1
+
+        return depths, deepest
+
+    def kept(self, depths):
+        """The positions of the instructions worth keeping: the reachable
+        ones, but for unconditional jumps to the next of those."""
+        ops, args = self.ops, self.args
+        following = len(ops)
+        kept = []
+
+        for position in xrange(len(ops) - 1, -1, -1):
+            if depths[position] is None:
+                continue
+            if ops[position] in JUMPS and args[position].position == following:
+                continue
+
+            kept.append(position)
+            following = position
+
+        kept.reverse()
+        return kept
+
+    def resolve(self, kept, varnames, firstlineno):
+        """Number the constants and names used by the instructions at the
+        positions in kept and lay those instructions out as bytecode.
+        Returns the constants, the names, the bytecode and its line number
+        table."""
+        ops, args = self.ops, self.args
+        function = self.function
+
+        consts, names = [], []
+        const_indices, name_indices = {}, {}
+        fast = dict((name, i) for i, name in enumerate(varnames))
+
+        # Functions reserve their first constant for their docstring,
+        # which is always None.
+        if function:
+            consts.append(None)
+            const_indices[_key(None)] = 0
+
+        # {old position: position among the kept instructions}, where
+        # dropped instructions are replaced by the kept one after them.
+        positions, count = [], 0
+        kept_set = set(kept)
+
+        for position in xrange(len(ops) + 1):
+            positions.append(count)
+            count += position in kept_set
+
+        codes, arguments = [], []
+        opmap = opcode.opmap
+
+        for position in kept:
+            op, arg = ops[position], args[position]
+
+            if op == "LOAD" or op == "STORE":
+                if not function:
+                    op += "_NAME"
+                elif arg in fast:
+                    op, arg = op + "_FAST", fast[arg]
+                else:
+                    op += "_GLOBAL"
+
+            if op == "LOAD_CONST":
+                key = _key(arg)
+                if key not in const_indices:
+                    const_indices[key] = len(consts)
+                    consts.append(arg)
+                arg = const_indices[key]
+            elif op in BRANCHES:
+                arg = positions[arg.position]
+            elif op == "COMPARE_OP":
+                arg = opcode.cmp_op.index(arg)
+            elif op in NAMED:
+                if arg not in name_indices:
+                    name_indices[arg] = len(names)
+                    names.append(arg)
+                arg = name_indices[arg]
+
+            codes.append(opmap[op])
+            arguments.append(arg)
+
+        code, offsets = self.encode(codes, arguments)
+        lnotab = self.line_table(positions, offsets, firstlineno)
+
+        return consts, names, code, lnotab
+
+    def line_table(self, positions, offsets, firstlineno):
+        """The co_lnotab giving the lines of the instructions, where
+        positions maps the position of an instruction to its position
+        among the kept ones and offsets maps that to its offset.  CPython
+        2 can't encode a line lower than the one before it, so the
+        instructions of such a line are put on the line before instead."""
+        table = []
+        last_offset, last_line = 0, firstlineno
+
+        for position, line in self.lines:
+            if line <= last_line:
+                continue
+
+            offset = offsets[positions[position]]
+            offset_delta, line_delta = offset - last_offset, line - last_line
+
+            while offset_delta > 0xFF:
+                table.append("\xff\x00")
+                offset_delta -= 0xFF
+
+            while line_delta > 0xFF:
+                table.append(chr(offset_delta) + "\xff")
+                offset_delta, line_delta = 0, line_delta - 0xFF
+
+            table.append(chr(offset_delta) + chr(line_delta))
+            last_offset, last_line = offset, line
+
+        return "".join(table)
+
+    @staticmethod
+    def encode(codes, arguments):
+        """Lay instructions out as bytecode, giving the ones whose argument
+        doesn't fit in 16 bits an EXTENDED_ARG.  Jump arguments are the
+        positions of their targets, which are turned into offsets here.
+        Returns the bytecode and the offset of each instruction, and of
+        the end."""
+        have_argument = opcode.HAVE_ARGUMENT
+        relative = frozenset(opcode.hasjrel)
+        branches = relative.union(opcode.hasjabs)
+        extended = set()
+
+        while True:
+            offsets, offset = [], 0
+
+            for position, code in enumerate(codes):
+                offsets.append(offset)
+
+                if code < have_argument:
+                    offset += 1
+                elif position in extended:
+                    offset += 6
+                else:
+                    offset += 3
+            offsets.append(offset)
+
+            resolved = []
+
+            for position, code in enumerate(codes):
+                arg = arguments[position]
+
+                if code in branches:
+                    arg = offsets[arg]
+                    if code in relative:
+                        arg -= offsets[position + 1]
+
+                resolved.append(arg)
+
+            grown = set(position for position, arg in enumerate(resolved)
+                        if arg > 0xFFFF)
+
+            if grown <= extended:
+                break
+            extended |= grown
+
+        bytecode = []
+
+        for position, code in enumerate(codes):
+            if code < have_argument:
+                bytecode.append(chr(code))
+                continue
+
+            arg = resolved[position]
+
+            if position in extended:
+                bytecode.append(chr(opcode.EXTENDED_ARG) +
+                                chr((arg >> 16) & 0xFF) + chr(arg >> 24))
+
+            bytecode.append(chr(code) + chr(arg & 0xFF) + chr((arg >> 8) & 0xFF))
+
+        return "".join(bytecode), offsets
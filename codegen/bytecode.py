@@ -0,0 +1,817 @@
+"""Bytecode backend.
+
+Generates code objects straight from the cobra AST, without building a
+Python AST for compile() to walk again.  Knowing the C behind the code
+lets it lay that code out better than the compiler can:
+
+* Conditions compile to compare-and-branch: `!`, `&&` and `||` become
+  jumps rather than values, and testing a number against 0 becomes
+  testing the number itself.
+* Loops test their condition at the bottom, so every iteration ends
+  in one conditional jump back to the top rather than in a jump to a
+  test that jumps out.  continue jumps straight to the loop's step, and
+  break out of the loop, without any SETUP_LOOP block.
+* `++`, `--` and the compound assignments become in-place operations,
+  on array elements too.
+"""
+
+import gc
+
+from optimizer import memoizable
+from parser import *
+
+from .assembler import Assembler, Label
+from .codegen import Codegen
+
+
+class BytecodeCodegen(Codegen):
+    """A Codegen whose gen_code assembles code objects directly.  Typing,
+    inlining, memoization, tail calls and hoisting are shared with the
+    ast backend and generate code that behaves the same.
+
+    self.steps holds a (continue label, break label, iterating) triple
+    for every loop enclosing the current statement, iterating being
+    whether the loop keeps an iterator on the stack.
+    """
+
+    BINARY_OPCODES = {
+        "+":  "BINARY_ADD",
+        "-":  "BINARY_SUBTRACT",
+        "*":  "BINARY_MULTIPLY",
+        "/":  "BINARY_DIVIDE",
+        "%":  "BINARY_MODULO",
+        "&":  "BINARY_AND",
+        "|":  "BINARY_OR",
+        "^":  "BINARY_XOR",
+
+        "<<": "BINARY_LSHIFT",
+        ">>": "BINARY_RSHIFT",
+    }
+
+    INPLACE_OPCODES = {
+        "+=": "INPLACE_ADD",
+        "-=": "INPLACE_SUBTRACT",
+        "*=": "INPLACE_MULTIPLY",
+        "/=": "INPLACE_DIVIDE",
+        "++": "INPLACE_ADD",
+        "--": "INPLACE_SUBTRACT",
+    }
+
+    UNARY_OPCODES = {
+        "+": "UNARY_POSITIVE",
+        "-": "UNARY_NEGATIVE",
+        "!": "UNARY_NOT",
+        "~": "UNARY_INVERT",
+    }
+
+    # Types whose values are false exactly when they equal 0.
+    NUMBERS = frozenset(("int", "float"))
+
+    def __init__(self, parser, inline=0, hoist=False, memoize=None,
+                 instrument=False):
+        # Counters are only inserted into generated ASTs.
+        if instrument:
+            raise ValueError("the bytecode backend can't instrument code")
+
+        super(BytecodeCodegen, self).__init__(parser, inline, hoist, memoize)
+
+        # The code of the function being generated, the label its self
+        # tail calls jump to and how many loops enclose the current node.
+        self.code = None
+        self.start = None
+        self.looping = 0
+
+        # [(position of the LOAD, whether it's in a loop)] for every
+        # function the current function calls, for hoisting.
+        self.callees = []
+
+    def gen_function(self, node, filename):
+        self.inference.run(node)
+        self.types = self.inference.types
+        self.steps = []
+        self.function = node
+        self.callees = []
+
+        self.code = code = Assembler(node.name, filename, node.parameters.names)
+        self.start = Label()
+
+        code.mark(self.start)
+        self.gen_statement(node.body)
+        code.emit("LOAD_CONST", None)
+        code.emit("RETURN_VALUE")
+
+        if self.hoist:
+            self.hoist_callees()
+
+        return code.assemble(node.line or 1)
+
+    def hoist_callees(self):
+        """Bind the globals the function calls in a loop or more than once
+        to locals on entry, named like hoist_globals names them."""
+        code = self.code
+        names, assigned = code.names(), set(code.variables())
+
+        # {global name: [positions of the LOADs calling it]} and the
+        # globals that are called inside a loop.
+        calls, hot = {}, set()
+
+        for position, looping in self.callees:
+            name = code.args[position]
+            calls.setdefault(name, []).append(position)
+
+            if looping:
+                hot.add(name)
+
+        bindings = []
+
+        for name, uses in sorted(calls.items()):
+            if name in assigned or (len(uses) < 2 and name not in hot):
+                continue
+
+            alias = "_" + name
+            while alias in names:
+                alias = "_" + alias
+            names.add(alias)
+
+            for use in uses:
+                code.args[use] = alias
+
+            bindings.append(("LOAD", name))
+            bindings.append(("STORE", alias))
+
+        code.prepend(bindings)
+
+    def gen_code(self, filename, main=False):
+        # Only the cobra AST is built, but it is still acyclic.
+        collecting = gc.isenabled()
+        gc.disable()
+
+        try:
+            with nesting():
+                functions = []
+                nodes = self.parser.parse()
+
+                if self.inline or self.memoize is not None:
+                    nodes = list(nodes)
+
+                if self.inline:
+                    self.inlines = self.find_inlines(nodes)
+
+                if self.memoize is not None:
+                    self.memoized = memoizable(nodes)
+
+                for node in nodes:
+                    if node.kind == NFUNDECL:
+                        functions.append(
+                            (node.name, self.gen_function(node, filename))
+                        )
+                    elif node.kind == NFWDDECL:
+                        self.inference.run(node)
+        finally:
+            if collecting:
+                gc.enable()
+
+        return self.gen_definitions(functions, filename, main)
+
+    def gen_unit(self, node, filename):
+        self.arrays = False
+
+        if node.kind != NFUNDECL:
+            self.inference.run(node)
+            return None
+
+        with nesting():
+            function = self.gen_function(node, filename)
+        return self.gen_definitions([(node.name, function)], filename)
+
+    def gen_definitions(self, functions, filename, main=False):
+        """Assemble the module defining every function in functions, a
+        list of (name, code) pairs, and calling main if main."""
+        module = Assembler("<module>", filename, function=False)
+
+        if any(name in self.memoized for name, _ in functions):
+            self.gen_import(module, "runtime", "memoize", self.MEMOIZE)
+
+        if self.arrays:
+            self.gen_import(module, "array", "array", self.ARRAY)
+
+        for name, code in functions:
+            module.line(code.co_firstlineno)
+
+            if name in self.memoized:
+                module.emit("LOAD", self.MEMOIZE)
+                module.emit("LOAD_CONST", name)
+                module.emit("LOAD_CONST", self.memoize)
+                module.emit("CALL_FUNCTION", 2)
+
+            module.emit("LOAD_CONST", code)
+            module.emit("MAKE_FUNCTION", 0)
+
+            if name in self.memoized:
+                module.emit("CALL_FUNCTION", 1)
+
+            module.emit("STORE", name)
+
+        if main:
+            module.emit("LOAD", "main")
+            module.emit("CALL_FUNCTION", 0)
+            module.emit("POP_TOP")
+
+        module.emit("LOAD_CONST", None)
+        module.emit("RETURN_VALUE")
+
+        return module.assemble()
+
+    @staticmethod
+    def gen_import(module, package, name, alias):
+        "`from package import name as alias`, as Python 2 does it."
+        module.emit("LOAD_CONST", -1)
+        module.emit("LOAD_CONST", (name,))
+        module.emit("IMPORT_NAME", package)
+        module.emit("IMPORT_FROM", name)
+        module.emit("STORE", alias)
+        module.emit("POP_TOP")
+
+    def gen_callee(self, name):
+        "Load the function name for a call."
+        self.callees.append((len(self.code.ops), self.looping > 0))
+        self.code.emit("LOAD", name)
+
+    def gen_coerced(self, node, target):
+        "Generate node converted to type target, as Codegen.coerce does."
+        source = self.ctype(node)
+
+        if (source == target or source not in self.CONVERSIONS or
+                target not in self.CONVERSIONS):
+            return self.gen(node)
+
+        if node.kind == NNUMBER:
+            self.code.emit("LOAD_CONST", self.CONVERSIONS[target](node.value))
+            return
+
+        self.gen_callee(target)
+        self.gen(node)
+        self.code.emit("CALL_FUNCTION", 1)
+
+    """
+    Statements
+    """
+    def gen_statement(self, node):
+        kind = node.kind
+
+        if node.line is not None:
+            self.code.line(node.line)
+
+        if kind in self.STATEMENT_GENERATORS:
+            return self.STATEMENT_GENERATORS[kind](self, node)
+
+        if (kind == NLUNARY or kind == NRUNARY) and node.op in self.INCREMENTS:
+            return self.gen_update(node.operand, self.INPLACE_OPCODES[node.op])
+
+        if kind == NBINARY and node.op in self.ASSIGNMENTS:
+            return self.gen_assign(node)
+
+        self.gen(node)
+        self.code.emit("POP_TOP")
+
+    def gen_block(self, node):
+        for statement in node.statements:
+            self.gen_statement(statement)
+
+    def gen_declaration(self, node):
+        if node.size is not None:
+            self.gen_array(node)
+        elif node.value is None:
+            self.code.emit("LOAD_CONST", None)
+        else:
+            self.gen_coerced(node.value, node.type_)
+
+        self.code.emit("STORE", node.name)
+
+    def gen_array(self, node):
+        "Allocate the zeroed storage for an array, as transform_array does."
+        code, element = self.code, node.type_[:-2]
+
+        if element == "char":
+            self.gen_callee("bytearray")
+            self.gen(node.size)
+            code.emit("CALL_FUNCTION", 1)
+            return
+
+        if element in self.ARRAYS:
+            self.arrays = True
+            typecode, zero = self.ARRAYS[element]
+
+            self.gen_callee(self.ARRAY)
+            code.emit("LOAD_CONST", typecode)
+            code.emit("LOAD_CONST", zero)
+            code.emit("BUILD_LIST", 1)
+            code.emit("CALL_FUNCTION", 2)
+        else:
+            code.emit("LOAD_CONST", None)
+            code.emit("BUILD_LIST", 1)
+
+        self.gen(node.size)
+        code.emit("BINARY_MULTIPLY")
+
+    def gen_if(self, node):
+        """Generate an if statement and its chain of else ifs, with a loop
+        rather than recursion, however long the chain is."""
+        code, end = self.code, None
+
+        while True:
+            orelse = Label()
+            self.gen_branch(node.condition, False, orelse)
+
+            if node.body is not None:
+                self.gen_statement(node.body)
+
+            if node.orelse is None:
+                code.mark(orelse)
+                break
+
+            end = end or Label()
+            code.jump("JUMP_FORWARD", end)
+            code.mark(orelse)
+            node = node.orelse
+
+            if node.kind != NELIF:
+                self.gen_statement(node)
+                break
+
+            if node.line is not None:
+                code.line(node.line)
+
+        if end is not None:
+            code.mark(end)
+
+    def gen_else(self, node):
+        self.gen_statement(node.body)
+
+    def gen_for(self, node):
+        match = self.match_range(node)
+
+        if match is not None:
+            return self.gen_range_for(node, *match)
+
+        if node.init is not None:
+            self.gen_statement(node.init)
+
+        self.gen_loop(node.condition, node.body, node.step)
+
+    def gen_while(self, node):
+        self.gen_loop(node.condition, node.body)
+
+    def gen_loop(self, condition, body, step=None):
+        """Generate a loop testing condition, if any, once on entry and
+        then after every iteration, which runs body then step."""
+        code = self.code
+        top, next_, end = Label(), Label(), Label()
+
+        self.looping += 1
+
+        if condition is not None:
+            self.gen_branch(condition, False, end)
+
+        code.mark(top)
+        self.gen_loop_body(body, next_, end)
+        code.mark(next_)
+
+        if step is not None:
+            self.gen_statement(step)
+
+        if condition is None:
+            code.jump("JUMP_ABSOLUTE", top)
+        else:
+            self.gen_branch(condition, True, top)
+
+        self.looping -= 1
+        code.mark(end)
+
+    def gen_loop_body(self, node, next_, end, iterating=False):
+        if node is None:
+            return
+
+        self.steps.append((next_, end, iterating))
+
+        try:
+            self.gen_statement(node)
+        finally:
+            self.steps.pop()
+
+    def gen_range_for(self, node, name, op, bound):
+        "Generate the loop transform_range_for would, with the same fixup."
+        code = self.code
+        increment, adjust = self.RANGES[op]
+        step = 1 if increment == "++" else -1
+        start = node.init.right
+
+        if start.kind == NNUMBER and bound.kind == NNUMBER:
+            values = xrange(start.value, bound.value + adjust, step)
+
+            def stop():
+                code.emit("LOAD_CONST", bound.value + adjust)
+        else:
+            values = None
+
+            def stop():
+                self.gen(bound)
+
+                if adjust:
+                    code.emit("LOAD_CONST", 1)
+                    code.emit("BINARY_ADD" if adjust > 0 else "BINARY_SUBTRACT")
+
+        self.gen_statement(node.init)
+        self.looping += 1
+
+        if values is not None and len(values) <= self.SMALL_RANGE:
+            code.emit("LOAD_CONST", tuple(values))
+        else:
+            self.gen_callee("xrange")
+            code.emit("LOAD", name)
+            stop()
+
+            if step < 0:
+                code.emit("LOAD_CONST", step)
+                code.emit("CALL_FUNCTION", 3)
+            else:
+                code.emit("CALL_FUNCTION", 2)
+
+        top, done, end = Label(), Label(), Label()
+
+        code.emit("GET_ITER")
+        code.mark(top)
+        code.jump("FOR_ITER", done)
+        code.emit("STORE", name)
+        self.gen_loop_body(node.body, top, end, iterating=True)
+        code.jump("JUMP_ABSOLUTE", top)
+        code.mark(done)
+
+        # Breaks skip the fixup, like they skip a for loop's else.
+        self.gen_branch(node.condition, False, end)
+        stop()
+        code.emit("STORE", name)
+
+        self.looping -= 1
+        code.mark(end)
+
+    def gen_return(self, node):
+        code = self.code
+
+        if node.value is None:
+            code.emit("LOAD_CONST", None)
+        elif self.is_tail_call(node.value):
+            return self.gen_tail_call(node.value)
+        else:
+            self.gen_coerced(node.value, self.function.type_)
+
+        code.emit("RETURN_VALUE")
+
+    def gen_tail_call(self, node):
+        "Rebind the parameters to the call's arguments and start over."
+        self.gen_arguments(node)
+
+        for name in reversed(self.function.parameters.names):
+            self.code.emit("STORE", name)
+
+        self.code.jump("JUMP_ABSOLUTE", self.start)
+
+    def gen_break(self, node):
+        _, end, iterating = self.steps[-1]
+
+        if iterating:
+            self.code.emit("POP_TOP")
+        self.code.jump("JUMP_ABSOLUTE", end)
+
+    def gen_continue(self, node):
+        self.code.jump("JUMP_ABSOLUTE", self.steps[-1][0])
+
+    """
+    Conditions
+    """
+    def gen_branch(self, node, when, label):
+        """Jump to label if node's truth is when, without computing the
+        truth of the `!`, `&&` and `||` in node as a value.  Those nest as
+        deep as the C does, so they are followed with a stack of (node,
+        when, label) branches still to generate, and of labels to mark,
+        rather than by recursing."""
+        code, stack = self.code, [(node, when, label)]
+
+        while stack:
+            item = stack.pop()
+
+            if isinstance(item, Label):
+                code.mark(item)
+                continue
+
+            node, when, label = item
+            kind = node.kind
+
+            if kind == NLUNARY and node.op == "!":
+                stack.append((node.operand, not when, label))
+                continue
+
+            if kind == NBINARY and node.op in ("&&", "||"):
+                if (node.op == "&&") != when:
+                    # Either operand decides: `a && b` is false if a is.
+                    stack.append((node.right, when, label))
+                    stack.append((node.left, when, label))
+                else:
+                    skip = Label()
+                    stack.append(skip)
+                    stack.append((node.right, when, label))
+                    stack.append((node.left, not when, skip))
+                continue
+
+            if kind == NNUMBER:
+                if bool(node.value) == when:
+                    code.jump("JUMP_ABSOLUTE", label)
+                continue
+
+            if kind == NBINARY and node.op in ("==", "!="):
+                operand = self.match_zero_test(node)
+
+                if operand is not None:
+                    self.gen(operand)
+                    if (node.op == "!=") == when:
+                        code.jump("POP_JUMP_IF_TRUE", label)
+                    else:
+                        code.jump("POP_JUMP_IF_FALSE", label)
+                    continue
+
+            self.gen(node)
+            code.jump("POP_JUMP_IF_TRUE" if when else "POP_JUMP_IF_FALSE",
+                      label)
+
+    def match_zero_test(self, node):
+        """The number node compares against 0, if it compares a number
+        against 0, whose truth tells the same."""
+        for operand, other in ((node.left, node.right), (node.right, node.left)):
+            if (other.kind == NNUMBER and other.value == 0 and
+                    self.ctype(operand) in self.NUMBERS):
+                return operand
+
+        return None
+
+    """
+    Expressions
+    """
+    def gen_call(self, node):
+        inline = self.inlines.get(node.name)
+
+        if inline is not None and self.can_inline(inline, node):
+            return self.gen_inline(inline, node)
+
+        self.gen_callee(node.name)
+        self.gen_arguments(node)
+        self.code.emit("CALL_FUNCTION", len(node.arguments))
+
+    def gen_arguments(self, node):
+        "Generate the arguments of call node in its parameters' types."
+        function = self.inference.functions.get(node.name)
+        types = function[1] if function is not None and function[1] else ()
+
+        for i, argument in enumerate(node.arguments):
+            if i < len(types):
+                self.gen_coerced(argument, types[i])
+            else:
+                self.gen(argument)
+
+    def gen_inline(self, inline, node):
+        "Generate inline's body with its parameters bound to node's arguments."
+        parameters, condition, value, alternative, ctypes = inline
+
+        code, type_ = self.code, self.ctype(node)
+        self.inference.ctypes.update(ctypes)
+
+        bindings, self.bindings = self.bindings, dict(zip(parameters, node.arguments))
+
+        try:
+            if condition is None:
+                return self.gen_coerced(value, type_)
+
+            orelse, end = Label(), Label()
+
+            self.gen_branch(condition, False, orelse)
+            self.gen_coerced(value, type_)
+            code.jump("JUMP_FORWARD", end)
+            code.mark(orelse)
+            self.gen_coerced(alternative, type_)
+            code.mark(end)
+        finally:
+            self.bindings = bindings
+
+    def gen_lunary(self, node):
+        op, operand = node.op, node.operand
+
+        if op in self.INCREMENTS:
+            # Like the ast backend, ++x as a value doesn't write x.
+            self.gen(operand)
+            self.code.emit("LOAD_CONST", 1)
+            self.code.emit(self.BINARY_OPCODES[op[0]])
+            return
+
+        # Operators like - - - x chain as deep as the C does, so the ones
+        # under node are followed down in a loop rather than recursed into.
+        ops = []
+
+        while operand.kind == NLUNARY and operand.op not in self.INCREMENTS:
+            ops.append(op)
+            op, operand = operand.op, operand.operand
+
+        if op == "-" and operand.kind == NNUMBER:
+            self.code.emit("LOAD_CONST", -operand.value)
+        else:
+            self.gen(operand)
+            self.code.emit(self.UNARY_OPCODES[op])
+
+        for op in reversed(ops):
+            self.code.emit(self.UNARY_OPCODES[op])
+
+    def gen_runary(self, node):
+        self.gen(node.operand)
+
+    def gen_binary(self, node):
+        """Operators nest as deep as the C does, so rather than recursing
+        into the operators under node, this follows a stack of the
+        operands still to generate and of the steps still to take between
+        them, (method, arguments) pairs, in reverse order."""
+        stack = [node]
+
+        while stack:
+            item = stack.pop()
+
+            if not isinstance(item, Node):
+                method, arguments = item
+                method(*arguments)
+            elif item.kind == NBINARY:
+                stack.extend(reversed(self.binary_steps(item)))
+            else:
+                self.gen(item)
+
+    def binary_steps(self, node):
+        "The operands of the operator node and the steps that apply it."
+        code, op, left, right = self.code, node.op, node.left, node.right
+
+        # The parser only lets statements be assignments.
+        if op in self.ASSIGNMENTS:
+            raise SyntaxError("assignment used as a value")
+
+        if self.ctype(left) == self.ctype(right) == "int" and op in ("/", "%"):
+            return self.int_division_steps(op, left, right)
+
+        if op in self.COMPARISONS:
+            return [left, right, (code.emit, ("COMPARE_OP", op))]
+
+        if op in self.BOOLEAN_OPERATORS:
+            end = Label()
+            jump = ("JUMP_IF_FALSE_OR_POP" if op == "&&" else
+                    "JUMP_IF_TRUE_OR_POP")
+            return [left, (code.jump, (jump, end)), right, (code.mark, (end,))]
+
+        return [left, right, (code.emit, (self.BINARY_OPCODES[op],))]
+
+    def int_division_steps(self, op, left, right):
+        "The steps dividing two ints the way transform_int_division does."
+        emit = self.code.emit
+        power = (right.kind == NNUMBER and right.value > 0 and
+                 not right.value & (right.value - 1))
+
+        if op == "/" and power:
+            return [left, (emit, ("LOAD_CONST", right.value.bit_length() - 1)),
+                    (emit, ("BINARY_RSHIFT",))]
+        if op == "/":
+            return [left, right, (emit, ("BINARY_FLOOR_DIVIDE",))]
+        if power:
+            return [left, (emit, ("LOAD_CONST", right.value - 1)),
+                    (emit, ("BINARY_AND",))]
+        return [left, right, (emit, ("BINARY_MODULO",))]
+
+    def gen_assign(self, node):
+        """Generate the assignment statement node, converting the value
+        like transform_assign does."""
+        code, op, e1, e2 = self.code, node.op, node.left, node.right
+        target, source = self.ctype(e1), self.ctype(e2)
+
+        if op == "=":
+            self.gen_coerced(e2, target)
+            return self.gen_store(e1)
+
+        inplace = self.INPLACE_OPCODES[op]
+
+        if target == source == "int" and op == "/=":
+            inplace = "INPLACE_FLOOR_DIVIDE"
+
+        # An int updated with a float has to be truncated back to an int.
+        if target == "int" and source == "float":
+            if e1.kind != NIDENTIFIER:
+                return self.gen_update(e1, self.BINARY_OPCODES[op[0]], e2,
+                                       truncate=True)
+
+            self.gen_callee("int")
+            self.gen(e1)
+            self.gen(e2)
+            code.emit(self.BINARY_OPCODES[op[0]])
+            code.emit("CALL_FUNCTION", 1)
+            return self.gen_store(e1)
+
+        self.gen_update(e1, inplace, e2)
+
+    def gen_update(self, target, inplace, operand=None, truncate=False):
+        """Update target in place by operand, or by 1 for increments, with
+        the in-place operation inplace, truncating the result to an int if
+        truncate is true.  Subscripts are only evaluated once, just like
+        in C."""
+        code = self.code
+
+        if target.kind == NINDEX:
+            self.gen(target.array)
+            self.gen(target.index)
+            code.emit("DUP_TOPX", 2)
+            code.emit("BINARY_SUBSCR")
+        else:
+            self.gen(target)
+
+        if operand is None:
+            code.emit("LOAD_CONST", 1)
+        else:
+            self.gen(operand)
+
+        code.emit(inplace)
+
+        if truncate:
+            self.gen_callee("int")
+            code.emit("ROT_TWO")
+            code.emit("CALL_FUNCTION", 1)
+
+        if target.kind != NINDEX:
+            return self.gen_store(target)
+
+        code.emit("ROT_THREE")
+        code.emit("STORE_SUBSCR")
+
+    def gen_store(self, target):
+        "Store the value on top of the stack in target."
+        if target.kind == NIDENTIFIER:
+            self.code.emit("STORE", target.name)
+        elif target.kind == NINDEX:
+            self.gen(target.array)
+            self.gen(target.index)
+            self.code.emit("STORE_SUBSCR")
+        else:
+            raise SyntaxError("can't assign to {!r}".format(target))
+
+    def gen_index(self, node):
+        self.gen(node.array)
+        self.gen(node.index)
+        self.code.emit("BINARY_SUBSCR")
+
+    def gen_identifier(self, node):
+        name = node.name
+
+        if name in self.bindings:
+            # Arguments belong to the caller, so they see no bindings.
+            bindings, self.bindings = self.bindings, {}
+            argument = bindings[name]
+
+            try:
+                return self.gen_coerced(argument, self.ctype(node))
+            finally:
+                self.bindings = bindings
+
+        self.code.emit("LOAD", name)
+
+    def gen_constant(self, node):
+        self.code.emit("LOAD_CONST", node.value)
+
+    # {node kind: generator} for statements that aren't expressions.
+    STATEMENT_GENERATORS = {
+        NBLOCK:    gen_block,
+        NDECL:     gen_declaration,
+        NIF:       gen_if,
+        NELIF:     gen_if,
+        NELSE:     gen_else,
+        NFOR:      gen_for,
+        NWHILE:    gen_while,
+        NRETURN:   gen_return,
+        NBREAK:    gen_break,
+        NCONTINUE: gen_continue,
+    }
+
+    # {node kind: generator} for expressions, which leave their value on
+    # the stack.
+    GENERATORS = {
+        NCALL:       gen_call,
+        NLUNARY:     gen_lunary,
+        NRUNARY:     gen_runary,
+        NBINARY:     gen_binary,
+        NINDEX:      gen_index,
+
+        NIDENTIFIER: gen_identifier,
+        NNUMBER:     gen_constant,
+        NCHARACTER:  gen_constant,
+        NSTRING:     gen_constant,
+    }
+
+    def gen(self, node):
+        return self.GENERATORS[node.kind](self, node)
@@ -3,168 +3,940 @@ TODO: Make assignment an expression.
 """
 
 import ast
+import gc
 
 from lexer import *
+from optimizer import TypeInference, memoizable
 from parser import *
 
 
 class Codegen(object):
-    def __init__(self, parser):
+    # Operators and expression contexts carry no state, so every
+    # generated node shares the same instances.
+    LOAD = ast.Load()
+    STORE = ast.Store()
+    PARAM = ast.Param()
+
+    # {operator: ast operator (None for plain assignment)}
+    ASSIGNMENTS = {
+        "=":  None,
+        "+=": ast.Add(),
+        "-=": ast.Sub(),
+        "*=": ast.Mult(),
+        "/=": ast.Div(),
+    }
+
+    BINARY_OPERATORS = {
+        "+": ast.Add(),
+        "-": ast.Sub(),
+        "*": ast.Mult(),
+        "/": ast.Div(),
+        "%": ast.Mod(),
+        "&": ast.BitAnd(),
+        "|": ast.BitOr(),
+        "^": ast.BitXor(),
+
+        "<<": ast.LShift(),
+        ">>": ast.RShift(),
+    }
+
+    COMPARISONS = {
+        "==": ast.Eq(),
+        "!=": ast.NotEq(),
+        ">=": ast.GtE(),
+        "<=": ast.LtE(),
+
+        "<": ast.Lt(),
+        ">": ast.Gt(),
+    }
+
+    BOOLEAN_OPERATORS = {
+        "&&": ast.And(),
+        "||": ast.Or(),
+    }
+
+    UNARY_OPERATORS = {
+        "+": ast.UAdd(),
+        "-": ast.USub(),
+        "!": ast.Not(),
+        "~": ast.Invert(),
+    }
+
+    # {operator: ast operator} for prefix increments and decrements.
+    INCREMENTS = {
+        "++": ast.Add(),
+        "--": ast.Sub(),
+    }
+
+    # Operators whose result is an int when both operands are.
+    INT_OPERATORS = frozenset(("+", "-", "*", "/", "%",
+                               "<<", ">>", "&", "|", "^"))
+
+    # {comparison: (increment, stop adjustment)} for the conditions of
+    # for loops that can run over an xrange.
+    RANGES = {
+        "<":  ("++", 0),
+        "<=": ("++", 1),
+        ">":  ("--", 0),
+        ">=": ("--", -1),
+    }
+
+    # {C type: Python type} for the types values are converted between
+    # when they cross an assignment, argument or return.
+    CONVERSIONS = {
+        "int":   int,
+        "float": float,
+    }
+
+    # {element type: (array typecode, zero)} for arrays kept in an
+    # array.array.  char arrays are bytearrays and any others lists.
+    ARRAYS = {
+        "int":   ("i", 0),
+        "float": ("d", 0.0),
+    }
+
+    # The name generated modules import array.array as.
+    ARRAY = "_cobra_array"
+
+    # What instrumented modules import the runtime's counters as, and
+    # the name their counts go by, which their functions also take as a
+    # hidden last parameter defaulting to them.
+    COUNTERS = "_cobra_counters"
+    COUNTS = "_cobra_counts"
+
+    # What the runtime's memoize decorator is imported as.
+    MEMOIZE = "_cobra_memoize"
+
+    # The local an index is kept in while the int it selects is updated
+    # with a float.
+    INDEX = "_cobra_index"
+
+    # Loops over at most this many values known at compile time iterate
+    # over a tuple of them.
+    SMALL_RANGE = 16
+
+    # How deep generated trees may nest.  compile() recurses in C once
+    # per level and, on an 8MB stack, crashes past about 20000 levels of
+    # else ifs.
+    MAX_DEPTH = 20000
+
+    # Generated nodes that don't need wrapping in an ast.Expr.
+    STATEMENTS = (ast.Assign, ast.AugAssign, ast.If, ast.For, ast.While,
+                  ast.Return, ast.Break, ast.Continue, ast.Pass)
+
+    # Size, in AST nodes, of the largest function worth inlining by
+    # default.
+    INLINE_SIZE = 24
+
+    # Nodes that are cheap enough to evaluate more than once.
+    ATOMS = frozenset((NIDENTIFIER, NNUMBER, NCHARACTER, NSTRING))
+
+    # Operators that can't raise on numbers, and the size of the largest
+    # argument made of them and ATOMS that is still cheaper to evaluate
+    # again than to pass in a call.  Division is safe by a literal other
+    # than zero.
+    SAFE_OPERATORS = frozenset(("+", "-", "*", "&", "|", "^", "!", "~"))
+    SAFE_DIVISIONS = frozenset(("/", "%"))
+    SAFE_SIZE = 5
+
+    def __init__(self, parser, inline=0, hoist=False, memoize=None,
+                 instrument=False):
+        """inline is the size of the largest function whose calls are
+        replaced by its body; 0 disables inlining.  hoist binds the
+        functions a function calls to locals on entry, see hoist_globals.
+        memoize is the number of results the pure functions of the module
+        remember, 0 for all of them, or None not to memoize any.
+        instrument counts calls, loop iterations and branches taken, see
+        counter."""
         self.parser = parser
+        self.inline = inline
+        self.hoist = hoist
+        self.memoize = memoize
+        self.instrument = instrument
+
+        # The functions whose results get memoized.
+        self.memoized = set()
+
+        # {function name: (parameters, condition, value, alternative,
+        # ctypes)} for functions whose calls get inlined, where ctypes
+        # maps the expressions of the body to their types.
+        self.inlines = {}
+
+        # {parameter: argument} while an inlined body is generated.
+        self.bindings = {}
+
+        # Whether the module needs array.array.
+        self.arrays = False
+
+        # (kind, function, line, parent) for every counter of an
+        # instrumented module, see counter.
+        self.sites = []
+
+        # Types every function's expressions as it is generated.
+        self.inference = TypeInference()
+
+        # {name: declared type} for the function being generated.
+        self.types = {}
+
+        # The step of every loop enclosing the current statement, or None
+        # for loops whose continue needs no step run first.
+        self.steps = []
+
+        # The function being generated and whether any of its self tail
+        # calls were turned into jumps.
+        self.function = None
+        self.jumps = False
 
     """
     NFUNDECL
     NFWDDECL
     """
-    def transform_function_declaration(self, children):
-        (_, name, params), body = children[:3], children[3]
+    def transform_function_declaration(self, node):
+        self.inference.run(node)
+        self.types = self.inference.types
+        self.steps = []
+        self.function = node
+        self.jumps = False
 
-        params = self.transform(params)
-        body = self.transform(body)
+        params = self.transform(node.parameters)
 
-        return ast.FunctionDef(
-            name, params, body, []
-        )
+        if self.instrument:
+            params.args.append(ast.Name(self.COUNTS, self.PARAM))
+            params.defaults.append(ast.Name(self.COUNTS, self.LOAD))
+            calls = self.counter("call", node)
+
+        body = self.transform(node.body)
+
+        if self.instrument:
+            # Inside the loop, self tail calls become jumps, so they count
+            # as loop iterations too.
+            body.insert(0, self.count(calls))
+
+        if self.jumps:
+            # Self tail calls rebind the parameters and continue from the
+            # top, so falling off the end must leave the loop.
+            if not isinstance(body[-1], ast.Return):
+                body.append(ast.Return())
+
+            body = [ast.While(ast.Num(1), body, [])]
+
+        function = self.locate(ast.FunctionDef(
+            node.name, params, body, []
+        ), node)
+
+        if node.name in self.memoized:
+            function.decorator_list.append(ast.Call(
+                ast.Name(self.MEMOIZE, self.LOAD),
+                [ast.Str(node.name), ast.Num(self.memoize)], [], None, None
+            ))
+
+        if self.hoist:
+            self.hoist_globals(function)
+
+        return function
+
+    def hoist_globals(self, function):
+        """Bind the globals function calls in a loop or more than once to
+        locals on entry, so the calls load them with LOAD_FAST instead of
+        LOAD_GLOBAL.  Each local is named after its global with leading
+        underscores added until it clashes with no other name in the
+        function."""
+        names, assigned = set(), set()
+
+        # {global name: [ast.Name nodes calling it]} and the globals that
+        # are called inside a loop.
+        calls, hot = {}, set()
+
+        stack = [(statement, False) for statement in function.body]
+        stack.extend((argument, False) for argument in function.args.args)
+
+        while stack:
+            node, looping = stack.pop()
+
+            if isinstance(node, ast.Name):
+                names.add(node.id)
+
+                if not isinstance(node.ctx, ast.Load):
+                    assigned.add(node.id)
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                calls.setdefault(node.func.id, []).append(node.func)
+
+                if looping:
+                    hot.add(node.func.id)
+
+            looping = looping or isinstance(node, (ast.For, ast.While))
+            stack.extend((child, looping) for child in ast.iter_child_nodes(node))
+
+        bindings = []
+
+        for name, uses in sorted(calls.items()):
+            if name in assigned or (len(uses) < 2 and name not in hot):
+                continue
+
+            alias = "_" + name
+            while alias in names:
+                alias = "_" + alias
+            names.add(alias)
+
+            for use in uses:
+                use.id = alias
+
+            bindings.append(ast.Assign(
+                [ast.Name(alias, self.STORE)], ast.Name(name, self.LOAD)
+            ))
+
+        function.body[:0] = bindings
+
+    def transform_forward_declaration(self, node):
+        """Forward declarations have no runtime representation, but they
+        do type calls made to the function."""
+        self.inference.run(node)
+        return None
+
+    def ctype(self, node):
+        "The type of the expression node, as worked out by type inference."
+        return self.inference.ctypes.get(node)
+
+    def coerce(self, value, source, target):
+        """Convert value, generated from an expression of type source, to
+        type target the way C converts between int and float.  Values of
+        any other or unknown type are left alone, as are values that
+        already have the right type, so no conversion is ever checked
+        for at runtime."""
+        if (source == target or source not in self.CONVERSIONS or
+                target not in self.CONVERSIONS):
+            return value
+
+        if isinstance(value, ast.Num):
+            return ast.Num(self.CONVERSIONS[target](value.n))
+
+        return ast.Call(ast.Name(target, self.LOAD), [value], [], None, None)
 
     """
     NPLIST
     """
-    def transform_parameter_list(self, children):
+    def transform_parameter_list(self, node):
         return ast.arguments(
-            map(lambda name: self.transform_identifier([name], param=True), children),
+            map(lambda name: ast.Name(name, self.PARAM), node.names),
             None, None, [],
         )
 
     """
     NBLOCK
     """
-    def transform_statement(self, children):
-        if isinstance(children[0], tuple):
-            return self.transform(children[1])
-        node = self.transform(children)
+    def transform_statement(self, node):
+        """Transform node into a statement or a list of statements, placed
+        at node's position in the C source."""
+        if node.kind in (NLUNARY, NRUNARY) and node.op in self.INCREMENTS:
+            statement = self.transform_increment(node)
+        else:
+            statement = self.transform(node)
+
+            if not (isinstance(statement, list) or
+                    isinstance(statement, self.STATEMENTS)):
+                statement = ast.Expr(statement)
+
+        return self.locate(statement, node)
+
+    def transform_statements(self, node):
+        "Transform node like transform_statement, into a list of statements."
+        statement = self.transform_statement(node)
+
+        if isinstance(statement, list):
+            return statement
+        return [statement]
+
+    @staticmethod
+    def locate(statement, node):
+        """Give statement, or each statement in a list of them, node's
+        position unless it has one already.  Expressions are left to
+        inherit the position of their statement."""
+        if node.line is None:
+            return statement
+
+        for each in statement if isinstance(statement, list) else (statement,):
+            if not hasattr(each, "lineno"):
+                each.lineno, each.col_offset = node.line, node.column
+
+        return statement
+
+    def transform_increment(self, node):
+        "Transform `++x` or `x--` used as a statement."
+        name = self.transform(node.operand)
+        name.ctx = self.STORE
+
+        return ast.AugAssign(name, self.INCREMENTS[node.op], ast.Num(1))
 
-        if isinstance(node, ast.Assign) or \
-           isinstance(node, ast.If) or \
-           isinstance(node, ast.While) or \
-           isinstance(node, ast.Return):
-            return node
+    def transform_block(self, node):
+        statements = []
+
+        for statement in node.statements:
+            statements.extend(self.transform_statements(statement))
+
+        return statements
+
+    def transform_loop_body(self, loop, step=None):
+        """Transform the body of the loop node loop, whose continue
+        statements must run step first."""
+        if self.instrument:
+            runs = self.counter("loop", loop)
+
+        if loop.body is None:
+            body = [ast.Pass()]
         else:
-            return ast.Expr(node)
+            self.steps.append(step)
+
+            try:
+                body = self.transform(loop.body)
+            finally:
+                self.steps.pop()
 
-    def transform_block(self, children):
-        return map(self.transform_statement, children)
+        if self.instrument:
+            body.insert(0, self.count(runs))
+
+        return body
 
     """
     NDECL
     """
-    def transform_variable_declaration(self, children):
-        name = self.transform_identifier(children, store=True)
-        return ast.Assign([name], self.transform_identifier(["None"], load=True))
+    def transform_variable_declaration(self, node):
+        name = ast.Name(node.name, self.STORE)
+
+        if node.size is not None:
+            return ast.Assign([name], self.transform_array(node))
+
+        if node.value is None:
+            return ast.Assign([name], ast.Name("None", self.LOAD))
+
+        value = self.coerce(
+            self.transform(node.value), self.ctype(node.value), node.type_
+        )
+        return ast.Assign([name], value)
+
+    def transform_array(self, node):
+        """Allocate the zeroed storage for an array: an array.array for
+        ints and floats, a bytearray for chars and a list otherwise."""
+        element, size = node.type_[:-2], self.transform(node.size)
+
+        if element == "char":
+            return ast.Call(
+                ast.Name("bytearray", self.LOAD), [size], [], None, None
+            )
+
+        if element in self.ARRAYS:
+            self.arrays = True
+            typecode, zero = self.ARRAYS[element]
+
+            storage = ast.Call(ast.Name(self.ARRAY, self.LOAD), [
+                ast.Str(typecode), ast.List([ast.Num(zero)], self.LOAD)
+            ], [], None, None)
+        else:
+            storage = ast.List([ast.Name("None", self.LOAD)], self.LOAD)
+
+        return ast.BinOp(storage, self.BINARY_OPERATORS["*"], size)
 
     """
     NIF
     NELIF
     """
-    def transform_if(self, children):
-        (cond, body), orelse = children[:2], children[2:]
+    def transform_if(self, node):
+        """Transform an if statement and its chain of else ifs, with a loop
+        rather than recursion, however long the chain is.  When
+        instrumenting, each branch, else ifs and else included, counts the
+        times it is taken under the counter of the if statement, and so
+        does the else it lacks."""
+        chain = self.counter("if", node) if self.instrument else None
+
+        # [(else if, condition, body)] for the if and every else if.
+        links = []
+
+        while True:
+            cond = self.transform(node.condition)
 
-        cond = self.transform(cond)
-        body = self.transform(body)
+            if node.body is None:
+                body = [ast.Pass()]
+            else:
+                body = self.transform(node.body)
 
-        if orelse:
-            orelse = self.transform(orelse[0])
+            links.append((node, cond, self.branch(body, node, chain)))
 
-            if isinstance(orelse, ast.If):
-                orelse = [orelse]
+            if node.body is None or node.orelse is None:
+                orelse = self.branch([], node, chain, "none")
+                break
 
-            return ast.If(cond, body, orelse)
-        return ast.If(cond, body, [])
+            if node.orelse.kind != NELIF:
+                orelse = self.branch(self.transform(node.orelse), node.orelse,
+                                     chain)
+                break
+
+            node = node.orelse
+
+        for node, cond, body in reversed(links):
+            orelse = [self.locate(ast.If(cond, body, orelse), node)]
+
+        return orelse[0]
+
+    def branch(self, body, node, chain, kind="branch"):
+        """Have body count its runs as a branch of kind at node under
+        chain, unless chain is None."""
+        if chain is not None:
+            body.insert(0, self.count(self.counter(kind, node, chain)))
+
+        return body
 
     """
     NELSE
     """
-    def transform_else(self, children):
-        return self.transform(children[0])
+    def transform_else(self, node):
+        return self.transform(node.body)
 
     """
     NFOR
     """
-    def transform_for(self, children):
-        init, cond, term, body = children
+    def transform_for(self, node):
+        match = self.match_range(node)
+
+        if match is not None:
+            return self.transform_range_for(node, *match)
+
+        statements = []
+
+        if node.init is not None:
+            statements.extend(self.transform_statements(node.init))
+
+        if node.condition is None:
+            cond = ast.Num(1)
+        else:
+            cond = self.transform(node.condition)
+
+        body = self.transform_loop_body(node, node.step)
+
+        if node.step is not None:
+            body.extend(self.transform_statements(node.step))
+
+        statements.append(ast.While(cond, body, []))
+        return statements
+
+    def transform_range_for(self, node, name, op, bound):
+        """Transform `for (i = a; i < b; i++)` into `for i in xrange(i, b)`.
+        Loops between two literals that run at most SMALL_RANGE times
+        iterate over a constant tuple instead, which spares them the
+        xrange call.
+
+        C leaves i one step past the last iteration, where Python leaves
+        it on the last one, so a loop that runs to completion finishes by
+        moving i on to the stop value."""
+        increment, adjust = self.RANGES[op]
+        step = 1 if increment == "++" else -1
+        start = node.init.right
+
+        if start.kind == NNUMBER and bound.kind == NNUMBER:
+            stop = lambda: ast.Num(bound.value + adjust)
+            values = xrange(start.value, bound.value + adjust, step)
+        else:
+            values = None
 
-        init = self.transform(init)
-        cond = self.transform(cond)
-        term = self.transform(term)
-        body = self.transform(body)
+            def stop():
+                stop = self.transform(bound)
 
-        print init
-        print cond
-        print term
-        print body
+                if adjust > 0:
+                    return ast.BinOp(stop, self.BINARY_OPERATORS["+"], ast.Num(1))
+                if adjust < 0:
+                    return ast.BinOp(stop, self.BINARY_OPERATORS["-"], ast.Num(1))
+                return stop
+
+        if values is not None and len(values) <= self.SMALL_RANGE:
+            iterable = ast.Tuple(map(ast.Num, values), self.LOAD)
+        else:
+            arguments = [ast.Name(name, self.LOAD), stop()]
+
+            if step < 0:
+                arguments.append(ast.Num(step))
+
+            iterable = ast.Call(
+                ast.Name("xrange", self.LOAD), arguments, [], None, None
+            )
+
+        fixup = ast.If(
+            self.transform(node.condition),
+            [ast.Assign([ast.Name(name, self.STORE)], stop())], []
+        )
+
+        return [self.transform_statement(node.init), ast.For(
+            ast.Name(name, self.STORE), iterable,
+            self.transform_loop_body(node),
+            [fixup],
+        )]
+
+    def match_range(self, node):
+        """Match for loops of the form `for (i = a; i < b; i++)` (or with
+        <=, > and >= and a matching step) where i is an int the body never
+        writes and b is an int expression the body can't change.  Returns
+        an (i, comparison, b) triple or None."""
+        init, cond, step = node.init, node.condition, node.step
+
+        if init is None or cond is None or step is None:
+            return None
+
+        if (init.kind != NBINARY or init.op != "=" or
+                init.left.kind != NIDENTIFIER):
+            return None
+
+        name = init.left.name
+
+        if (cond.kind != NBINARY or cond.op not in self.RANGES or
+                cond.left.kind != NIDENTIFIER or cond.left.name != name):
+            return None
+
+        if self.step_increment(step, name) != self.RANGES[cond.op][0]:
+            return None
+
+        if self.types.get(name) != "int" or not self.is_int(init.right):
+            return None
+
+        bound = cond.right
+        if not self.is_int(bound):
+            return None
+
+        written = set() if node.body is None else assigned_names(node.body)
+        read = set(child.name for child in walk(bound)
+                   if child.kind == NIDENTIFIER)
+
+        if name in written or name in read or read & written:
+            return None
+
+        return name, cond.op, bound
+
+    def step_increment(self, node, name):
+        """Return "++" or "--" if node steps name by one, like `i++` or
+        `i -= 1` do."""
+        kind = node.kind
+
+        if kind == NLUNARY or kind == NRUNARY:
+            if node.op in self.INCREMENTS and node.operand.kind == NIDENTIFIER:
+                if node.operand.name == name:
+                    return node.op
+        elif kind == NBINARY and node.op in ("+=", "-="):
+            if (node.left.kind == NIDENTIFIER and node.left.name == name and
+                    node.right.kind == NNUMBER and node.right.value == 1 and
+                    type(node.right.value) is int):
+                return "++" if node.op == "+=" else "--"
+
+        return None
+
+    def is_int(self, node):
+        "Whether node is an int expression without side effects."
+        kind = node.kind
+
+        if kind == NNUMBER:
+            return type(node.value) in (int, long)
+        if kind == NIDENTIFIER:
+            return self.types.get(node.name) == "int"
+        if kind == NBINARY:
+            return (node.op in self.INT_OPERATORS and
+                    self.is_int(node.left) and self.is_int(node.right))
+        if kind == NLUNARY:
+            return node.op in ("+", "-", "~") and self.is_int(node.operand)
+
+        return False
 
     """
     NWHILE
     """
-    def transform_while(self, children):
-        cond, body = children
-        cond = self.transform(cond)
-        body = self.transform(body)
-        return ast.While(cond, body, [])
+    def transform_while(self, node):
+        cond = self.transform(node.condition)
+
+        return ast.While(cond, self.transform_loop_body(node), [])
 
     """
     NRETURN
     """
-    def transform_return(self, children):
-        if children:
-            return ast.Return(self.transform(children[0]))
-        return ast.Return()
+    def transform_return(self, node):
+        if node.value is None:
+            return ast.Return()
+
+        if self.is_tail_call(node.value):
+            return self.transform_tail_call(node.value)
+
+        value = node.value
+
+        return ast.Return(self.coerce(
+            self.transform(value), self.ctype(value), self.function.type_
+        ))
+
+    def is_tail_call(self, node):
+        """Whether returning node is a self tail call that can jump back
+        to the top of the function.  Calls made inside loops can't, since
+        the continue would belong to the loop."""
+        function = self.function
+
+        return (node.kind == NCALL and not self.steps and
+                function is not None and node.name == function.name and
+                len(node.arguments) == len(function.parameters.names))
+
+    def transform_tail_call(self, node):
+        "Rebind the parameters to the call's arguments and start over."
+        self.jumps = True
+
+        names = self.function.parameters.names
+        arguments = self.transform_arguments(node)
+
+        if len(names) == 1:
+            return [ast.Assign(
+                [ast.Name(names[0], self.STORE)], arguments[0]
+            ), ast.Continue()]
+
+        if names:
+            return [ast.Assign(
+                [ast.Tuple([ast.Name(name, self.STORE) for name in names],
+                           self.STORE)],
+                ast.Tuple(arguments, self.LOAD)
+            ), ast.Continue()]
+
+        return ast.Continue()
+
+    """
+    NBREAK
+    NCONTINUE
+    """
+    def transform_break(self, node):
+        return ast.Break()
+
+    def transform_continue(self, node):
+        step = self.steps[-1] if self.steps else None
+
+        if step is None:
+            return ast.Continue()
+        return self.transform_statements(step) + [ast.Continue()]
 
     """
     NCALL
     """
-    def transform_function_call(self, children):
-        name, arguments = children[0], children[1:]
-        name = self.transform_identifier([name], load=True)
-        arguments = map(self.transform, arguments)
+    def transform_function_call(self, node):
+        inline = self.inlines.get(node.name)
+
+        if inline is not None and self.can_inline(inline, node):
+            return self.transform_inline(inline, node)
+
+        name = ast.Name(node.name, self.LOAD)
+        arguments = self.transform_arguments(node)
 
         return ast.Call(
             name, arguments,
             [], None, None
         )
 
+    def transform_arguments(self, node):
+        "Transform the arguments of call node into its parameters' types."
+        arguments = map(self.transform, node.arguments)
+        function = self.inference.functions.get(node.name)
+
+        if function is None or not function[1]:
+            return arguments
+
+        types = function[1]
+        sources = [self.ctype(argument) for argument in node.arguments]
+
+        return [self.coerce(argument, source, target)
+                for argument, source, target
+                in zip(arguments, sources, types)] + arguments[len(types):]
+
+    def find_inlines(self, nodes):
+        """Find the functions among nodes whose calls can be replaced by
+        their body: leaf functions no bigger than self.inline that return
+        an expression of their parameters, possibly picked by an if."""
+        counts = {}
+        for node in nodes:
+            if node.kind == NFUNDECL:
+                counts[node.name] = counts.get(node.name, 0) + 1
+
+        inlines = {}
+
+        for node in nodes:
+            if node.kind != NFUNDECL or counts[node.name] > 1:
+                continue
+
+            # Typed up front, so that inlined parameters know their types.
+            self.inference.run(node)
+
+            parameters = node.parameters.names
+            inline = self.match_inline(node.body)
+
+            if inline is None or len(set(parameters)) != len(parameters):
+                continue
+
+            parts = [part for part in inline if part is not None]
+            names = set(child.name for part in parts for child in walk(part)
+                        if child.kind == NIDENTIFIER)
+            size = sum(1 for part in parts for _ in walk(part))
+
+            if (size <= self.inline and names <= set(parameters) and
+                    all(map(is_pure, parts))):
+                ctypes = self.inference.ctypes
+                inlines[node.name] = (parameters,) + inline + (dict(
+                    (child, ctypes[child]) for part in parts
+                    for child in walk(part)
+                ),)
+
+        return inlines
+
+    def match_inline(self, body):
+        """Match function bodies of the form `return v;`, `if (c) return v;
+        else return w;` or `if (c) return v; return w;`.  Returns a
+        (condition, value, alternative) triple, with a None condition and
+        alternative for a lone return, or None."""
+        def returned(block):
+            if (block is not None and len(block) == 1 and
+                    block[0].kind == NRETURN):
+                return block[0].value
+
+        statements = body.statements
+
+        if len(statements) == 1 and statements[0].kind == NRETURN:
+            if statements[0].value is not None:
+                return None, statements[0].value, None
+            return None
+
+        if not statements or statements[0].kind != NIF:
+            return None
+
+        if len(statements) == 1 and statements[0].orelse is not None:
+            orelse = statements[0].orelse
+            alternative = returned(orelse.body if orelse.kind == NELSE else None)
+        elif len(statements) == 2 and statements[0].orelse is None:
+            alternative = returned(statements[1:])
+        else:
+            return None
+
+        value = returned(statements[0].body)
+
+        if value is None or alternative is None:
+            return None
+
+        return statements[0].condition, value, alternative
+
+    def is_safe(self, node):
+        "Whether node is a small expression that can't fail or write anything."
+        size = 0
+
+        for child in walk(node):
+            size += 1
+
+            if child.kind in self.ATOMS:
+                continue
+            if child.kind not in (NBINARY, NLUNARY) or size > self.SAFE_SIZE:
+                return False
+
+            if child.op in self.SAFE_DIVISIONS:
+                if child.right.kind != NNUMBER or not child.right.value:
+                    return False
+            elif child.op not in self.SAFE_OPERATORS:
+                return False
+
+        return size <= self.SAFE_SIZE
+
+    def can_inline(self, inline, node):
+        """Whether the arguments of call node can be substituted into the
+        body of inline.  Variables, literals and small arithmetic that
+        can't fail always can.  Any other argument must be pure and its
+        parameter used exactly once where it is always evaluated, so it
+        runs exactly as often as it would have as an argument."""
+        parameters, condition, value, alternative, _ = inline
+
+        if len(node.arguments) != len(parameters):
+            return False
+
+        if all(map(self.is_safe, node.arguments)):
+            return True
+
+        # [(node, whether it is only evaluated conditionally)]
+        stack = [(value, condition is not None)]
+        if condition is not None:
+            stack += [(condition, False), (alternative, True)]
+
+        # {parameter: (uses, whether any use is conditional)}
+        uses = {}
+
+        while stack:
+            child, conditional = stack.pop()
+            kind = child.kind
+
+            if kind == NIDENTIFIER:
+                count, anywhere = uses.get(child.name, (0, False))
+                uses[child.name] = count + 1, anywhere or conditional
+            elif kind == NBINARY:
+                stack.append((child.left, conditional))
+                stack.append((child.right, conditional or child.op in ("&&", "||")))
+            elif kind == NLUNARY or kind == NRUNARY:
+                stack.append((child.operand, conditional))
+
+        for name, argument in zip(parameters, node.arguments):
+            if self.is_safe(argument):
+                continue
+
+            # Functions that get inlined are pure by construction.
+            if not is_pure(argument, self.inlines):
+                return False
+            if uses.get(name) != (1, False):
+                return False
+
+        return True
+
+    def transform_inline(self, inline, node):
+        "Generate inline's body with its parameters bound to node's arguments."
+        parameters, condition, value, alternative, ctypes = inline
+
+        type_ = self.ctype(node)
+        self.inference.ctypes.update(ctypes)
+
+        def coerced(part):
+            return self.coerce(self.transform(part), self.ctype(part), type_)
+
+        bindings, self.bindings = self.bindings, dict(zip(parameters, node.arguments))
+
+        try:
+            if condition is None:
+                return coerced(value)
+
+            return ast.IfExp(
+                self.transform(condition), coerced(value), coerced(alternative)
+            )
+        finally:
+            self.bindings = bindings
+
     """
     NLUNARY
     """
-    def transform_lunary(self, children):
-        op, e = children
-        bop = {
-            "++": ast.Add,
-            "--": ast.Sub,
-        }
-        uop = {
-            "+": ast.UAdd,
-            "-": ast.USub,
-            "!": ast.Not,
-            "~": ast.Invert,
-        }
-
-        if op in bop:
-            name = self.transform(e)
+    def transform_lunary(self, node):
+        op, e = node.op, node.operand
+
+        if op in self.INCREMENTS:
             namer = self.transform(e)
-            name.ctx = ast.Store()
-            namer.ctx = ast.Load()
+            namer.ctx = self.LOAD
+
+            return ast.BinOp(namer, self.INCREMENTS[op], ast.Num(1))
+
+        # Operators like - - - x chain as deep as the C does, so the ones
+        # under node are followed down in a loop rather than recursed into.
+        ops = [op]
+
+        while e.kind == NLUNARY and e.op not in self.INCREMENTS:
+            ops.append(e.op)
+            e = e.operand
+
+        value = self.transform(e)
 
-            return ast.BinOp(namer, bop[op](), ast.Num(1))
+        for op in reversed(ops):
+            value = ast.UnaryOp(self.UNARY_OPERATORS[op], value)
 
-        return ast.UnaryOp(uop[op](), self.transform(e))
+        return value
 
     """
     NRUNARY
     """
-    def transform_runary(self, children):
-        op, e = children
-        name = self.transform(e)
-        name.ctx = ast.Load()
+    def transform_runary(self, node):
+        name = self.transform(node.operand)
+        name.ctx = self.LOAD
 
         return name
 
@@ -172,142 +944,431 @@ class Codegen(object):
     NBINARY
     """
     def transform_assign(self, op, e1, e2):
-        op = {
-            "=":  None,
-            "+=": ast.Add,
-            "-=": ast.Sub,
-            "*=": ast.Mult,
-            "/=": ast.Div,
-        }[op]
+        target, source = self.ctype(e1), self.ctype(e2)
+        op = self.ASSIGNMENTS[op]
 
         name = self.transform(e1)
-        name.ctx = ast.Store()
+        name.ctx = self.STORE
         expression = self.transform(e2)
 
         if op is None:
-            return ast.Assign([name], expression)
-
-        namer = self.transform(e1)
-        namer.cts = ast.Load()
-
-        return ast.Assign([name], ast.BinOp(namer, op(), expression))
-
-    def transform_op(self, op, e1, e2):
-        binop = {
-            "+": ast.Add,
-            "-": ast.Sub,
-            "*": ast.Mult,
-            "/": ast.Div,
-            "%": ast.Mod,
-            "&": ast.BitAnd,
-            "|": ast.BitOr,
-            "^": ast.BitXor,
-
-            "<<": ast.LShift,
-            ">>": ast.RShift,
-        }
-        cmpop = {
-            "==": ast.Eq,
-            "!=": ast.NotEq,
-            ">=": ast.GtE,
-            "<=": ast.LtE,
-
-            "<": ast.Lt,
-            ">": ast.Gt,
-        }
-        boolop = {
-            "&&": ast.And,
-            "||": ast.Or,
-        }
-
-        if op in binop:
-            return ast.BinOp(
-                self.transform(e1), binop[op](), self.transform(e2))
-
-        if op in cmpop:
-            return ast.Compare(
-                self.transform(e1), [cmpop[op]()], [self.transform(e2)])
-
-        if op in boolop:
-            return ast.BoolOp(
-                self.transform(e1), boolop[op](), self.transform(e2))
-
-    def transform_binary(self, children):
-        op, e1, e2 = children
+            return ast.Assign([name], self.coerce(expression, source, target))
 
-        try:
-            return self.transform_assign(op, e1, e2)
-        except KeyError:
-            return self.transform_op(op, e1, e2)
+        if target == source == "int" and isinstance(op, ast.Div):
+            op = ast.FloorDiv()
+
+        # An int updated with a float has to be truncated back to an int,
+        # which AugAssign can't do.  An index that isn't cheap to evaluate
+        # again is bound to a local first, so it's still evaluated once.
+        if target == "int" and source == "float":
+            statements = []
+            value = self.transform(e1)
+
+            if e1.kind == NINDEX and e1.index.kind not in self.ATOMS:
+                statements.append(ast.Assign(
+                    [ast.Name(self.INDEX, self.STORE)], value.slice.value
+                ))
+                value.slice.value = ast.Name(self.INDEX, self.LOAD)
+                name.slice.value = ast.Name(self.INDEX, self.LOAD)
+
+            value = ast.BinOp(value, op, expression)
+            statements.append(
+                ast.Assign([name], self.coerce(value, source, target))
+            )
+            return statements if len(statements) > 1 else statements[0]
+
+        # Subscripts are only evaluated once, just like in C.
+        return ast.AugAssign(name, op, expression)
+
+    def transform_op(self, op, e1, e2, left, right):
+        "Apply op to left and right, transformed from e1 and e2."
+        if self.ctype(e1) == self.ctype(e2) == "int" and op in ("/", "%"):
+            return self.transform_int_division(op, e2, left, right)
+
+        if op in self.BINARY_OPERATORS:
+            return ast.BinOp(left, self.BINARY_OPERATORS[op], right)
+
+        if op in self.COMPARISONS:
+            return ast.Compare(left, [self.COMPARISONS[op]], [right])
+
+        return ast.BoolOp(self.BOOLEAN_OPERATORS[op], [left, right])
+
+    def transform_int_division(self, op, e2, left, right):
+        """Divide two ints.  Division floors, like the rest of the arithmetic,
+        so dividing by a power of two is a shift and taking the remainder
+        a mask, which are cheaper."""
+        power = e2.kind == NNUMBER and e2.value > 0 and not e2.value & (e2.value - 1)
+
+        if op == "/" and power:
+            return ast.BinOp(left, ast.RShift(), ast.Num(e2.value.bit_length() - 1))
+        if op == "/":
+            return ast.BinOp(left, ast.FloorDiv(), right)
+        if power:
+            return ast.BinOp(left, ast.BitAnd(), ast.Num(e2.value - 1))
+        return ast.BinOp(left, ast.Mod(), right)
+
+    def transform_binary(self, node):
+        if node.op in self.ASSIGNMENTS:
+            return self.transform_assign(node.op, node.left, node.right)
+
+        # Operators nest as deep as the C does, so the ones under node are
+        # transformed bottom up, each after its operands, rather than by
+        # recursing into them.
+        nested = [node]
+
+        for each in nested:
+            nested.extend(operand for operand in (each.left, each.right)
+                          if operand.kind == NBINARY and
+                          operand.op not in self.ASSIGNMENTS)
+
+        # {operator node: its transform}
+        done = {}
+
+        for each in reversed(nested):
+            left, right = [done.pop(operand) if operand in done else
+                           self.transform(operand)
+                           for operand in (each.left, each.right)]
+            done[each] = self.transform_op(each.op, each.left, each.right,
+                                           left, right)
+
+        return done[node]
+
+    """
+    NINDEX
+    """
+    def transform_index(self, node):
+        return ast.Subscript(
+            self.transform(node.array),
+            ast.Index(self.transform(node.index)),
+            self.LOAD,
+        )
 
     """
-    TIDENTIFIER
+    NIDENTIFIER
     """
-    def transform_identifier(self, children, param=False, load=False, store=False):
-        name = children[0]
+    def transform_identifier(self, node, param=False, load=False, store=False):
+        name = node.name
+
+        if name in self.bindings:
+            # Arguments belong to the caller, so they see no bindings.
+            bindings, self.bindings = self.bindings, {}
+            argument = bindings[name]
+
+            try:
+                return self.coerce(self.transform(argument),
+                                   self.ctype(argument), self.ctype(node))
+            finally:
+                self.bindings = bindings
 
         if param:
-            return ast.Name(name, ast.Param())
+            return ast.Name(name, self.PARAM)
 
         if store:
-            return ast.Name(name, ast.Store())
+            return ast.Name(name, self.STORE)
 
-        return ast.Name(name, ast.Load())
+        return ast.Name(name, self.LOAD)
 
     """
-    TNUMBER
+    NNUMBER
     """
-    def transform_number(self, children):
-        return ast.Num(children[0])
+    def transform_number(self, node):
+        return ast.Num(node.value)
 
     """
-    TCHARACTER
-    TSTRING
+    NCHARACTER
+    NSTRING
     """
-    def transform_string(self, children):
-        return ast.Str(children[0])
+    def transform_string(self, node):
+        return ast.Str(node.value)
+
+    # {node kind: transformer}
+    TRANSFORMS = {
+        NFUNDECL:    transform_function_declaration,
+        NFWDDECL:    transform_forward_declaration,
+        NPLIST:      transform_parameter_list,
+        NBLOCK:      transform_block,
+        NDECL:       transform_variable_declaration,
+        NIF:         transform_if,
+        NELIF:       transform_if,
+        NELSE:       transform_else,
+        NFOR:        transform_for,
+        NWHILE:      transform_while,
+        NRETURN:     transform_return,
+        NBREAK:      transform_break,
+        NCONTINUE:   transform_continue,
+        NCALL:       transform_function_call,
+        NLUNARY:     transform_lunary,
+        NRUNARY:     transform_runary,
+        NBINARY:     transform_binary,
+        NINDEX:      transform_index,
+
+        NIDENTIFIER: transform_identifier,
+        NNUMBER:     transform_number,
+        NCHARACTER:  transform_string,
+        NSTRING:     transform_string,
+    }
 
     def transform(self, node):
-        kind, children = node[0], node[1:]
-
-        return {
-            NFUNDECL:    self.transform_function_declaration,
-            NFWDDECL:    self.transform_function_declaration,
-            NPLIST:      self.transform_parameter_list,
-            NBLOCK:      self.transform_block,
-            NDECL:       self.transform_variable_declaration,
-            NIF:         self.transform_if,
-            NELIF:       self.transform_if,
-            NELSE:       self.transform_else,
-            NFOR:        self.transform_for,
-            NWHILE:      self.transform_while,
-            NRETURN:     self.transform_return,
-            NCALL:       self.transform_function_call,
-            NLUNARY:     self.transform_lunary,
-            NRUNARY:     self.transform_runary,
-            NBINARY:     self.transform_binary,
-
-            TIDENTIFIER: self.transform_identifier,
-            TNUMBER:     self.transform_number,
-            TCHARACTER:  self.transform_string,
-            TSTRING:     self.transform_string,
-        }[kind](children)
+        return self.TRANSFORMS[node.kind](self, node)
 
     def gen_module(self, main=False):
-        nodes = self.parser.parse()
-        module = []
+        # The trees built here are acyclic, so collections triggered by
+        # the sheer number of allocations only cost time on big modules.
+        collecting = gc.isenabled()
+        gc.disable()
 
-        for node in nodes:
-            module.append(self.transform(node))
+        try:
+            with nesting():
+                module = []
+                nodes = self.parser.parse()
+
+                if self.inline or self.memoize is not None:
+                    nodes = list(nodes)
+
+                if self.inline:
+                    self.inlines = self.find_inlines(nodes)
+
+                if self.memoize is not None:
+                    self.memoized = memoizable(nodes)
+
+                for node in nodes:
+                    node = self.transform(node)
+
+                    if node is not None:
+                        module.append(node)
+        finally:
+            if collecting:
+                gc.enable()
+
+        module[:0] = self.imports(bool(self.memoized)) + self.counters()
 
         if main:
             module.append(ast.Expr(ast.Call(
-                self.transform_identifier(["main"], load=True),
+                ast.Name("main", self.LOAD),
                 [], [], None, None,
             )))
 
-        module = ast.Module(module)
+        return self.finish_module(module)
+
+    def finish_module(self, body):
+        module = ast.Module(body)
         module.lineno = 1
         module.col_offset = 0
 
-        return ast.fix_missing_locations(module)
+        self.fix_missing_locations(module)
+        self.clamp_lines(module.body, 1)
+        return module
+
+    @classmethod
+    def fix_missing_locations(cls, module):
+        """Give every node of module without a position the position of its
+        parent, like ast.fix_missing_locations does, but without recursing,
+        since generated trees nest as deep as the C does.  Trees deeper
+        than MAX_DEPTH raise a NestingError."""
+        stack = [(module, 1, 0, 0)]
+
+        while stack:
+            node, line, column, depth = stack.pop()
+
+            if depth > cls.MAX_DEPTH:
+                raise NestingError("nested too deeply to compile")
+
+            if "lineno" in node._attributes:
+                if hasattr(node, "lineno"):
+                    line, column = node.lineno, node.col_offset
+                else:
+                    node.lineno, node.col_offset = line, column
+
+            stack.extend((child, line, column, depth + 1)
+                         for child in ast.iter_child_nodes(node))
+
+    @classmethod
+    def clamp_lines(cls, statements, line):
+        """Keep the lines of statements from going down in the order they
+        are compiled in, starting from line, and return the last one.
+        CPython 2 can't encode a line lower than the one before it, so a
+        for loop's step, which is compiled after its body, is put on the
+        body's last line instead of the for's.  Nested statements are
+        followed with a stack, since else ifs nest as deep as their chain
+        is long."""
+        stack = [iter(statements)]
+
+        while stack:
+            for statement in stack[-1]:
+                line = statement.lineno = max(statement.lineno, line)
+
+                if isinstance(statement, ast.FunctionDef):
+                    cls.clamp_lines(statement.body, line)
+                    continue
+
+                stack.append(iter(getattr(statement, "body", []) +
+                                  getattr(statement, "orelse", [])))
+                break
+            else:
+                stack.pop()
+
+        return line
+
+    """
+    Instrumentation
+
+    Instrumented modules count how many times each function is called,
+    each loop body runs and each if statement takes each of its
+    branches.  The counts live in one list per module, allocated up
+    front by runtime.counters, which reports them when the program
+    exits, and each site increments its own element:
+
+        _cobra_counts = _cobra_counters(((kind, function, line, parent),
+                                         ...))
+
+        def f(n, _cobra_counts=_cobra_counts):
+            _cobra_counts[0] += 1
+            ...
+
+    Passing the counts to functions as a default spares them a global
+    lookup per count, and keeps modules linked into one namespace from
+    counting into each other's arrays.
+    """
+    def counter(self, kind, node, parent=None):
+        """Allocate the next counter, for a site of kind at node in the
+        function being generated, and return its index.  Kinds are "call",
+        "loop", "if", "branch" and "none", the missing else of an if,
+        whose parent is the counter of their if statement.  An if
+        statement's own counter stays at 0, since it runs as many times
+        as its branches and "none" are taken together."""
+        self.sites.append((kind, self.function.name, node.line, parent))
+        return len(self.sites) - 1
+
+    def count(self, index):
+        "The statement incrementing the counter index."
+        return ast.AugAssign(
+            ast.Subscript(
+                ast.Name(self.COUNTS, self.LOAD),
+                ast.Index(ast.Num(index)), self.STORE
+            ),
+            self.BINARY_OPERATORS["+"], ast.Num(1)
+        )
+
+    def counters(self):
+        """The statements allocating the counters of the sites generated
+        so far, if any."""
+        if not self.sites:
+            return []
+
+        sites = ast.Tuple([
+            ast.Tuple([
+                ast.Str(kind), ast.Str(function), ast.Num(line or 0),
+                ast.Name("None", self.LOAD) if parent is None else
+                ast.Num(parent)
+            ], self.LOAD)
+            for kind, function, line, parent in self.sites
+        ], self.LOAD)
+
+        return [
+            ast.ImportFrom(
+                "runtime", [ast.alias("counters", self.COUNTERS)], 0
+            ),
+            ast.Assign(
+                [ast.Name(self.COUNTS, self.STORE)],
+                ast.Call(ast.Name(self.COUNTERS, self.LOAD), [sites],
+                         [], None, None)
+            ),
+        ]
+
+    def imports(self, memoizing):
+        """The imports of the runtime support the code generated so far
+        uses: array.array if it has arrays and memoize if memoizing."""
+        imports = []
+
+        if memoizing:
+            imports.append(ast.ImportFrom(
+                "runtime", [ast.alias("memoize", self.MEMOIZE)], 0
+            ))
+
+        if self.arrays:
+            imports.append(ast.ImportFrom(
+                "array", [ast.alias("array", self.ARRAY)], 0
+            ))
+
+        return imports
+
+    def gen_code(self, filename, main=False):
+        "Generate the module and compile it into a code object."
+        with nesting():
+            return compile(self.gen_module(main), filename, "exec")
+
+    """
+    Streaming
+
+    Rather than generating the whole module at once, the top-level nodes
+    can be declared and generated one at a time as they are parsed:
+
+        for node in parser.parse():
+            codegen.declare(node)
+            code = codegen.gen_unit(node, filename)
+
+    Only the functions declared so far are known then, so calls are only
+    inlined, and functions only memoized together, if the functions they
+    involve come first in the file, as C wants them to anyway.
+    """
+    def declare(self, node):
+        """Take in what generating the nodes after the top-level node
+        needs to know about it: its signature, whether calls to it get
+        inlined and whether it gets memoized."""
+        with nesting():
+            self.inference.run(node)
+
+            if node.kind != NFUNDECL:
+                return
+
+            # Functions defined again are taken as they are now.
+            self.inlines.pop(node.name, None)
+            self.memoized.discard(node.name)
+
+            if self.inline:
+                self.inlines.update(self.find_inlines([node]))
+
+            if self.memoize is not None:
+                self.memoized |= memoizable([node], self.memoized)
+
+    def declarations(self, node):
+        """What generating the declared node needs to know about the
+        functions declared so far, for another Codegen to learn: the
+        signatures of node and the functions it calls, the ones among them
+        whose calls get inlined and whether node gets memoized."""
+        names = set(child.name for child in walk(node) if child.kind == NCALL)
+        names.add(node.name)
+
+        functions = self.inference.functions
+
+        return (
+            dict((name, functions[name]) for name in names if name in functions),
+            dict((name, self.inlines[name]) for name in names
+                 if name in self.inlines),
+            self.memoized & names,
+        )
+
+    def learn(self, declarations):
+        "Take in declarations made by another Codegen's declarations."
+        functions, inlines, memoized = declarations
+
+        self.inference.functions.update(functions)
+        self.inlines.update(inlines)
+        self.memoized |= memoized
+
+    def gen_unit(self, node, filename):
+        """Generate the declared top-level node on its own, compiled into
+        a code object that defines its function when run in the module's
+        namespace, or None if it defines nothing."""
+        self.arrays = False
+        self.sites = []
+
+        with nesting():
+            function = self.transform(node)
+
+        if function is None:
+            return None
+
+        module = (self.imports(bool(function.decorator_list)) +
+                  self.counters() + [function])
+        return compile(self.finish_module(module), filename, "exec")
@@ -0,0 +1,4 @@
+from .pipeline import *
+from .objects import *
+from .stats import *
+from .profiler import *
@@ -0,0 +1,296 @@
+"""Separate compilation.
+
+Every C file of a program compiles on its own into an Object: a module
+code object defining the file's functions, along with the signature of
+every function it exports, by defining it, and of every function it
+imports, by declaring a prototype for it without defining it.  Files
+don't depend on each other until they are linked, so they can be
+compiled in any order, by as many worker processes as there are cores.
+
+Linking checks that every prototype has a matching definition in some
+file and that no function is defined twice, then runs the objects'
+code in one namespace, which is where calls across files find their
+callees.
+
+Objects can be saved to object files and linked from those later, and
+a Builder keeps them in a Cache, so that only the files that changed
+since the last build get compiled again.
+"""
+
+import imp
+import marshal
+import os
+from multiprocessing import Pool, cpu_count
+
+from cache import source_key
+from codegen import Codegen
+from lexer import LexerError, lex_stream
+from optimizer import Optimizer
+from parser import *
+
+# Extension of the C files found in directories.
+SOURCE_SUFFIX = ".c"
+
+# Extension of object files.
+OBJECT_SUFFIX = ".cbo"
+
+
+class LinkError(Exception):
+    "Raised when objects don't link, with every reason why in errors."
+
+    def __init__(self, errors):
+        super(LinkError, self).__init__("\n".join(errors))
+        self.errors = errors
+
+
+class Object(object):
+    """A compiled C file.  exports and imports map the names of the
+    functions it defines and of the ones it only declares to their
+    (return type, parameter types) signatures."""
+    __slots__ = ("filename", "code", "exports", "imports")
+
+    def __init__(self, filename, code, exports, imports):
+        self.filename = filename
+        self.code = code
+        self.exports = exports
+        self.imports = imports
+
+    def fields(self):
+        return self.filename, self.code, self.exports, self.imports
+
+    def dumps(self):
+        "Marshal the object, which can't be pickled for its code."
+        return marshal.dumps(self.fields())
+
+    @classmethod
+    def loads(cls, data):
+        return cls(*marshal.loads(data))
+
+    def save(self, path):
+        """Write the object to the object file path.  Like .pyc files,
+        object files start with the interpreter's bytecode magic."""
+        with open(path, "wb") as file_:
+            file_.write(imp.get_magic())
+            file_.write(self.dumps())
+
+    @classmethod
+    def load(cls, path):
+        "Read the object file path, raising a LinkError if it isn't one."
+        with open(path, "rb") as file_:
+            magic = file_.read(len(imp.get_magic()))
+
+            try:
+                fields = marshal.load(file_)
+            except (EOFError, ValueError, TypeError):
+                fields = None
+
+        if magic != imp.get_magic() or not _is_fields(fields):
+            raise LinkError(["{}: not an object file of this Python"
+                             .format(path)])
+
+        return cls(*fields)
+
+
+def _is_fields(value):
+    "Whether value is the fields of an Object."
+    return (isinstance(value, tuple) and len(value) == 4 and
+            isinstance(value[2], dict) and isinstance(value[3], dict))
+
+
+def object_filename(filename):
+    "The name of the object file filename compiles to."
+    return os.path.splitext(filename)[0] + OBJECT_SUFFIX
+
+
+class Declarations(object):
+    """Passes the top-level nodes of parser on, recording the signatures
+    of the functions they define and of the ones they declare."""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.defined = {}
+        self.declared = {}
+
+    def parse(self):
+        for node in self.parser.parse():
+            if node.kind == NFUNDECL:
+                self.defined[node.name] = signature(node)
+            elif node.kind == NFWDDECL:
+                self.declared[node.name] = signature(node)
+
+            yield node
+
+
+def signature(node):
+    "The (return type, parameter types) of the function node declares."
+    return node.type_, tuple(node.parameters.types or ())
+
+
+def sources(paths):
+    """The C and object files named by paths, in order, where a
+    directory names every C file under it in sorted order."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for directory, directories, filenames in os.walk(path):
+            directories.sort()
+
+            for filename in sorted(filenames):
+                if filename.endswith(SOURCE_SUFFIX):
+                    yield os.path.join(directory, filename)
+
+
+def compile_object(filename, backend=Codegen, optimize=False, **settings):
+    """Compile the C file filename into an Object with backend, built
+    with settings.  Lexer and parser errors name the file."""
+    try:
+        with open(filename) as file_:
+            parser = Parser(lex_stream(file_))
+
+            # Whether a function is used depends on the other files.
+            if optimize:
+                parser = Optimizer(parser, module_passes=())
+
+            declarations = Declarations(parser)
+            code = backend(declarations, **settings).gen_code(filename)
+    except (LexerError, ParserError) as e:
+        raise type(e)("{}: {}".format(filename, e))
+
+    imports = dict((name, signature)
+                   for name, signature in declarations.declared.iteritems()
+                   if name not in declarations.defined)
+
+    return Object(filename, code, declarations.defined, imports)
+
+
+def _compile_marshalled(arguments):
+    filename, settings = arguments
+    return compile_object(filename, **settings).dumps()
+
+
+def compile_objects(filenames, jobs=None, **settings):
+    """Compile every file in filenames into an Object, yielded in order,
+    with jobs worker processes (default: one per CPU) when there are
+    several files to share out among them."""
+    filenames = list(filenames)
+    jobs = min(jobs or cpu_count(), len(filenames))
+
+    if jobs <= 1:
+        for filename in filenames:
+            yield compile_object(filename, **settings)
+        return
+
+    # Big enough chunks keep workers from waiting on the parent, small
+    # enough ones keep them all busy until the end.
+    chunksize = max(1, len(filenames) // (4 * jobs))
+    pool = Pool(jobs)
+
+    try:
+        tasks = [(filename, settings) for filename in filenames]
+
+        for data in pool.imap(_compile_marshalled, tasks, chunksize):
+            yield Object.loads(data)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class Builder(object):
+    """Builds the objects of a program's files, compiling them with
+    compile_objects given jobs and settings.  With a cache, objects are
+    kept in it under the hash of their file's source and salts, and only
+    the files that changed since they were last built are compiled.
+
+    The names of the files compiled by the last build are kept in
+    compiled.
+    """
+
+    def __init__(self, jobs=None, cache=None, salts=(), **settings):
+        self.jobs = jobs
+        self.cache = cache
+        self.salts = salts
+        self.settings = settings
+        self.compiled = []
+
+    def key(self, filename):
+        "The cache key for the object filename compiles to."
+        with open(filename) as file_:
+            return source_key(file_, "object", filename, *self.salts)
+
+    def build(self, filenames):
+        """Return the objects of filenames, in order.  Object files are
+        loaded rather than compiled."""
+        objects, keys = [], {}
+
+        for filename in filenames:
+            object_ = None
+
+            if filename.endswith(OBJECT_SUFFIX):
+                object_ = Object.load(filename)
+            elif self.cache is not None:
+                keys[filename] = self.key(filename)
+                fields = self.cache.get(keys[filename])
+
+                if _is_fields(fields):
+                    object_ = Object(*fields)
+
+            objects.append(object_)
+
+        self.compiled = [filename for filename, object_
+                         in zip(filenames, objects) if object_ is None]
+        compiled = iter(list(compile_objects(self.compiled, self.jobs,
+                                             **self.settings)))
+
+        for i, object_ in enumerate(objects):
+            if object_ is None:
+                objects[i] = object_ = next(compiled)
+
+                if self.cache is not None:
+                    self.cache.put(keys[object_.filename], object_.fields())
+
+        return objects
+
+
+def link(objects, namespace, entry="main"):
+    """Check that objects link into a program starting at entry, or
+    into a library if entry is None, and run their code in namespace.
+    Raises a LinkError if they don't."""
+    objects = list(objects)
+    errors = []
+
+    # {name: the object defining it}
+    definitions = {}
+
+    for object_ in objects:
+        for name in sorted(object_.exports):
+            if name in definitions:
+                errors.append(
+                    "{}: multiple definition of '{}', first defined in {}"
+                    .format(object_.filename, name, definitions[name].filename)
+                )
+            else:
+                definitions[name] = object_
+
+    for object_ in objects:
+        for name, signature in sorted(object_.imports.iteritems()):
+            definition = definitions.get(name)
+
+            if definition is None:
+                errors.append("{}: undefined reference to '{}'"
+                              .format(object_.filename, name))
+            elif definition.exports[name] != signature:
+                errors.append(
+                    "{}: conflicting types for '{}', defined in {}"
+                    .format(object_.filename, name, definition.filename)
+                )
+
+    if entry is not None and entry not in definitions:
+        errors.append("undefined reference to '{}'".format(entry))
+
+    if errors:
+        raise LinkError(errors)
+
+    for object_ in objects:
+        exec object_.code in namespace
@@ -0,0 +1,123 @@
+"""Streaming compilation.
+
+A Pipeline compiles a file one top-level function at a time, as soon as
+the parser is done with it, into a code object that defines just that
+function, so a file never has to be held in memory as a whole.  Running
+the code objects in turn in one namespace builds up the module.
+
+Declaring a function, taking in what the functions after it need to
+know about it, has to happen in order, but generating code for it only
+depends on what was declared before it.  So with workers, declaring
+stays with the parser while code generation is handed off to a pool of
+processes, or threads, that overlaps it with parsing the functions that
+come next.  At most window functions are in flight at once.
+"""
+
+import marshal
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from codegen import Codegen
+from lexer import lex_stream
+from optimizer import Optimizer
+from parser import Parser
+
+
+def generate(backend, settings, filename, node, declarations):
+    """Generate the code object for the top-level node with a fresh
+    backend, built with settings, that has learned declarations."""
+    codegen = backend(None, **settings)
+    codegen.learn(declarations)
+    return codegen.gen_unit(node, filename)
+
+
+def _generate_marshalled(task):
+    # Code objects don't pickle, so they leave worker processes
+    # marshalled.
+    return marshal.dumps(generate(*task))
+
+
+def _generate(task):
+    return generate(*task)
+
+
+class Pipeline(object):
+    """Compiles files one function at a time through backend, with the
+    same settings as cobra's.  With workers, code is generated by that
+    many worker processes, or threads if not processes."""
+
+    def __init__(self, backend=Codegen, optimize=False, inline=0, hoist=False,
+                 memoize=None, instrument=False, workers=0, processes=True,
+                 window=None):
+        self.backend = backend
+        self.optimize = optimize
+        self.settings = {"inline": inline, "hoist": hoist, "memoize": memoize,
+                         "instrument": instrument}
+        self.workers = workers
+        self.processes = processes
+        self.window = window or 2 * max(workers, 1)
+
+    def nodes(self, file_):
+        "Parse the top-level nodes of file_ one at a time."
+        nodes = Parser(lex_stream(file_))
+
+        # Whole-module passes would have to see every node first.
+        if self.optimize:
+            nodes = Optimizer(nodes, module_passes=())
+
+        return nodes.parse()
+
+    def tasks(self, file_, filename):
+        """Declare the top-level nodes of file_ in order, yielding the
+        arguments to generate each of them with."""
+        codegen = self.backend(None, **self.settings)
+
+        for node in self.nodes(file_):
+            codegen.declare(node)
+            yield (self.backend, self.settings, filename, node,
+                   codegen.declarations(node))
+
+    def units(self, file_, filename):
+        """Compile file_ into a code object per top-level node, yielded
+        in order.  Nodes that define nothing yield None."""
+        tasks = self.tasks(file_, filename)
+
+        if not self.workers:
+            for task in tasks:
+                yield generate(*task)
+            return
+
+        if self.processes:
+            pool, work = Pool(self.workers), _generate_marshalled
+        else:
+            pool, work = ThreadPool(self.workers), _generate
+
+        pending = deque()
+
+        try:
+            for task in tasks:
+                pending.append(pool.apply_async(work, (task,)))
+
+                if len(pending) >= self.window:
+                    yield self._result(pending.popleft())
+
+            while pending:
+                yield self._result(pending.popleft())
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _result(self, result):
+        code = result.get()
+        return marshal.loads(code) if self.processes else code
+
+    def run(self, file_, filename, namespace, main=True):
+        """Compile file_, installing each function in namespace as soon
+        as it is compiled, then call main if main."""
+        for code in self.units(file_, filename):
+            if code is not None:
+                exec code in namespace
+
+        if main:
+            namespace["main"]()
@@ -0,0 +1,143 @@
+"""Profiling of compiled C programs.
+
+A Profiler traces the functions compiled from the C files it is given
+as they run, counting the calls to each function and the times each
+line of C is run and timing both.  Generated code carries the lines of
+the C it was generated from, so the lines reported are lines of C:
+
+    profiler = Profiler([filename])
+
+    with profiler.profiling():
+        namespace["main"]()
+
+    profiler.report(sys.stderr)
+
+Time is exclusive: the time a line or a function spends waiting for the
+C functions it calls is charged to those.  A function's total time also
+counts its callees, but only once for the outermost of its calls when
+it recurses.  Tracing slows everything down a lot, lines more than
+calls, so times only mean anything relative to each other.
+"""
+
+import linecache
+import sys
+import time
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    # How many of the lines taking the most time are reported.
+    LINES = 20
+
+    def __init__(self, filenames):
+        self.filenames = frozenset(filenames)
+
+        # {code: [calls, total seconds, self seconds]}
+        self.functions = {}
+
+        # {(filename, line): [hits, seconds]}
+        self.lines = {}
+
+        # [code, started, (filename, line), resumed, self seconds] for
+        # every traced call running, innermost last.
+        self.stack = []
+
+        # {code: calls to it running}
+        self.active = {}
+
+    @contextmanager
+    def profiling(self):
+        "Trace the C functions called while the block runs."
+        sys.settrace(self.trace)
+        try:
+            yield
+        finally:
+            sys.settrace(None)
+
+    def trace(self, frame, event, arg):
+        "The global trace function, which only follows C functions."
+        code = frame.f_code
+
+        if event != "call" or code.co_filename not in self.filenames:
+            return None
+
+        now = time.time()
+        stack = self.stack
+
+        if stack:
+            self.charge(stack[-1], now)
+
+        stack.append([code, now, None, now, 0.0])
+        self.active[code] = self.active.get(code, 0) + 1
+
+        if code not in self.functions:
+            self.functions[code] = [0, 0.0, 0.0]
+        self.functions[code][0] += 1
+
+        return self.trace_lines
+
+    def trace_lines(self, frame, event, arg):
+        "The local trace function of C functions."
+        now = time.time()
+        entry = self.stack[-1]
+
+        if event == "line":
+            self.charge(entry, now)
+
+            line = entry[2] = (frame.f_code.co_filename, frame.f_lineno)
+            if line not in self.lines:
+                self.lines[line] = [0, 0.0]
+            self.lines[line][0] += 1
+
+        elif event == "return":
+            self.charge(entry, now)
+            self.stack.pop()
+
+            code = entry[0]
+            function = self.functions[code]
+            function[2] += entry[4]
+
+            self.active[code] -= 1
+            if not self.active[code]:
+                function[1] += now - entry[1]
+
+            # The caller resumes without the time spent in this call.
+            if self.stack:
+                self.stack[-1][3] = now
+
+        return self.trace_lines
+
+    def charge(self, entry, now):
+        "Charge the time since entry last resumed to it and its line."
+        elapsed = now - entry[3]
+        entry[3] = now
+        entry[4] += elapsed
+
+        if entry[2] is not None:
+            self.lines[entry[2]][1] += elapsed
+
+    def report(self, file_):
+        "Write the functions by total time, then the slowest lines, to file_."
+        file_.write("{:>10} {:>10} {:>10}  {}\n".format(
+            "calls", "total", "self", "function"
+        ))
+
+        functions = sorted(self.functions.iteritems(),
+                           key=lambda item: -item[1][1])
+
+        for code, (calls, total, self_) in functions:
+            file_.write("{:>10} {:>10.4f} {:>10.4f}  {} ({}:{})\n".format(
+                calls, total, self_,
+                code.co_name, code.co_filename, code.co_firstlineno
+            ))
+
+        file_.write("\n{:>10} {:>10}  {}\n".format("hits", "seconds", "line"))
+
+        lines = sorted(self.lines.iteritems(),
+                       key=lambda item: -item[1][1])
+
+        for (filename, line), (hits, seconds) in lines[:self.LINES]:
+            file_.write("{:>10} {:>10.4f}  {}:{}: {}\n".format(
+                hits, seconds, filename, line,
+                linecache.getline(filename, line).strip()
+            ))
@@ -0,0 +1,180 @@
+"""Per-phase statistics.
+
+A Stats collects the wall time spent in each phase of a run, the peak
+memory of the process by the end of each and counters like the number
+of tokens lexed.  Phases nest, and time is charged to the innermost
+phase running, so when lexing is driven by parsing, which is driven by
+code generation, the time taken by each shows up under its own name:
+
+    stats = Stats()
+    tokens = stats.timed("lex", lex_stream(file_), "tokens")
+    parser = Timed(Parser(tokens), stats, "parse", "nodes", tree_size)
+
+    with stats.phase("codegen"):
+        code = Codegen(parser).gen_code(filename)
+
+Peak memory is the resident set size reported by getrusage, in KiB on
+Linux, since Python 2 has no tracemalloc.
+"""
+
+import json
+import resource
+import time
+import types
+from contextlib import contextmanager
+
+from parser import walk
+
+
+class Stats(object):
+    def __init__(self):
+        # Phase names in the order they were first paused, which puts
+        # phases that drive others, like codegen driving parsing, after
+        # the ones they drive.
+        self.phases = []
+        self.times = {}
+        self.peaks = {}
+        self.counters = {}
+
+        # The phases running, innermost last, and when the innermost one
+        # was last resumed.
+        self.running = []
+        self.resumed = None
+
+    def enter(self, name):
+        "Start or resume the phase name, pausing the one running."
+        now = time.time()
+
+        if self.running:
+            self.charge(now)
+
+        self.times.setdefault(name, 0.0)
+
+        self.running.append(name)
+        self.resumed = now
+
+    def exit(self, peak=False):
+        """Pause the innermost phase and resume the one it interrupted.
+        Records the peak memory so far for it if peak."""
+        self.charge(time.time())
+        name = self.running.pop()
+
+        if name not in self.peaks:
+            self.phases.append(name)
+            self.peaks[name] = None
+
+        if peak:
+            self.peaks[name] = resource.getrusage(
+                resource.RUSAGE_SELF
+            ).ru_maxrss
+
+    def charge(self, now):
+        "Charge the time since the innermost phase resumed to it."
+        self.times[self.running[-1]] += now - self.resumed
+        self.resumed = now
+
+    @contextmanager
+    def phase(self, name):
+        "Run the block as part of the phase name."
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit(peak=True)
+
+    def timed(self, name, iterable, counter=None, size=None):
+        """Iterate over iterable, charging the time taken to produce each
+        item to the phase name.  With a counter, the items, or the sum of
+        their sizes if given a size function, are counted under it."""
+        iterator = iter(iterable)
+
+        while True:
+            self.enter(name)
+            done = True
+
+            try:
+                item = next(iterator)
+                done = False
+
+                if counter is not None:
+                    self.count(counter, 1 if size is None else size(item))
+            except StopIteration:
+                return
+            finally:
+                self.exit(peak=done)
+
+            yield item
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def as_dict(self):
+        return {
+            "phases": [{
+                "name": name,
+                "seconds": self.times[name],
+                "peak_kib": self.peaks[name],
+            } for name in self.phases],
+            "seconds": sum(self.times.itervalues()),
+            "counters": self.counters,
+        }
+
+    def dump(self, file_):
+        "Write the statistics to file_ as JSON."
+        json.dump(self.as_dict(), file_, indent=2, sort_keys=True)
+        file_.write("\n")
+
+    def report(self, file_):
+        "Write the statistics to file_ as a table."
+        file_.write("{:<10} {:>10} {:>12}\n".format(
+            "phase", "seconds", "peak (KiB)"
+        ))
+
+        for name in self.phases:
+            file_.write("{:<10} {:>10.4f} {:>12}\n".format(
+                name, self.times[name], self.peaks[name] or ""
+            ))
+
+        file_.write("{:<10} {:>10.4f}\n".format(
+            "total", sum(self.times.itervalues())
+        ))
+
+        for counter in sorted(self.counters):
+            file_.write("{}: {}\n".format(counter, self.counters[counter]))
+
+
+class Timed(object):
+    """Stands in for a parser, or an optimizer, charging the time taken
+    by its parse() to a phase of stats and counting what it parses, as
+    Stats.timed does."""
+
+    def __init__(self, parser, stats, name, counter=None, size=None):
+        self.parser = parser
+        self.stats = stats
+        self.name = name
+        self.counter = counter
+        self.size = size
+
+    def parse(self):
+        return self.stats.timed(self.name, self.nodes(),
+                                self.counter, self.size)
+
+    def nodes(self):
+        # Parsers may do work as soon as parse() is called, like an
+        # Optimizer running whole-module passes, so it is only called
+        # once in the phase.
+        for node in self.parser.parse():
+            yield node
+
+
+def tree_size(node):
+    "The number of nodes in the tree under node."
+    return sum(1 for _ in walk(node))
+
+
+def bytecode_size(code):
+    "The size of the bytecode of code and of the code objects in it."
+    return len(code.co_code) + sum(
+        bytecode_size(const) for const in code.co_consts
+        if isinstance(const, types.CodeType)
+    )
@@ -3,7 +3,8 @@ import re
 from collections import namedtuple
 
 
-Token = namedtuple("Token", ["type_", "value"])
+Token = namedtuple("Token", ["type_", "value", "line", "column"])
+Token.__new__.__defaults__ = (None, None)
 
 # Possible token types.
 for T in ("NUMBER", "CHARACTER", "STRING",
@@ -39,15 +40,13 @@ _BINARY_OPERATORS = (
 )
 BINARY_OPERATORS = map(lambda (x, _): x, _BINARY_OPERATORS)
 
+_PRECEDENCE = dict(_BINARY_OPERATORS)
+
 
 def precedence(op):
     """Returns the precendence of the given operator. Returns None when
     the operator couldn't be found."""
-    for operator, precedence in _BINARY_OPERATORS:
-        if operator.replace("\\", "") == op:
-            return precedence
-
-    return None
+    return _PRECEDENCE.get(op)
 
 
 def rassoc(op):
@@ -56,50 +55,176 @@ def rassoc(op):
     return op in ("=", "+=", "-=", "*=", "/=")
 
 
+_TYPES = ("char", "int", "float", "void",)
+_KEYWORDS = ("if", "else if", "else", "for", "while", "return", "const",
+             "break", "continue",)
+_OPERATORS = ("==", "!=", ">=", "<=", "<<", ">>", "-=", "+=", "*=", "/=",
+              "&&", "||", "++", "--", ">", "<", "&", "^", "|",
+              "+", "-", "*", "/", "%", "!", "~", "=", ";", ",", "[",
+              "(", "{", "]", ")", "}",)
+
+# [(group, pattern, token type, converter)]
+#
+# Order matters: the first alternative that matches wins, just like it
+# did with re.Scanner.  A token type of None means the match is skipped.
+_RULES = (
+    # Comments
+    ("COMMENT",    r"/\*.*?\*/|//[^\n]*",             None,        None),
+
+    # Numbers
+    ("FLOAT",      r"(?:[1-9]\d*|0)?\.\d+",           TNUMBER,     float),
+    ("DECIMAL",    r"[1-9]\d*",                       TNUMBER,     int),
+    ("HEX",        r"0[xX][0-9a-fA-F]+",              TNUMBER,     lambda token: int(token, 16)),
+    ("ZERO",       r"0",                              TNUMBER,     int),
+
+    # Characters and strings
+    ("CHARACTER",  r"'(?:\\.|[^'\\])'",               TCHARACTER,  lambda token: token[1:-1]),
+    ("STRING",     r'"(?:\\.|[^"\\])*"',             TSTRING,     lambda token: token[1:-1]),
+
+    # Types
+    ("TYPE",       r"(?:{})\b".format("|".join(_TYPES)),
+                                                      TTYPE,       None),
+
+    # Keywords
+    ("KEYWORD",    r"(?:{})\b".format("|".join(_KEYWORDS)),
+                                                      TKEYWORD,    None),
+
+    # Operators
+    ("OPERATOR",   "|".join(map(re.escape, _OPERATORS)),
+                                                      TOPERATOR,   None),
+
+    # Identifiers
+    ("IDENTIFIER", r"[a-zA-Z_][0-9a-zA-Z_]*",         TIDENTIFIER, None),
+
+    # Whitespace
+    ("WHITESPACE", r"[\r\t\n ]+",                     None,        None),
+)
+
+_PATTERN = re.compile("|".join(
+    "(?P<{}>{})".format(group, pattern) for group, pattern, _, _ in _RULES
+), re.DOTALL)
+
+# {group: (token type, converter)}
+_ACTIONS = dict((group, (type_, convert)) for group, _, type_, convert in _RULES)
+
+# Groups whose matches may span several lines.
+_MULTILINE = frozenset(("COMMENT", "STRING", "WHITESPACE"))
+
+# The number of bytes read from a stream at a time.
+CHUNK_SIZE = 64 * 1024
+
+# The number of characters that must follow a match before it is
+# trusted not to continue into the next chunk of a stream.
+_LOOKAHEAD = 16
+
+
+class LexerError(Exception):
+    "Raised when a stream contains something that can't be lexed."
+
+
 def lex(code):
     """Given an arbitrary piece of code, this returns a tuple containing
     a boolean value representing whether or not lexical analysis succeeded and
-    a list of Tokens."""
+    a list of Tokens.
 
-    types = ("char", "int", "float", "void",)
-    keywords = ("if", "else if", "else", "for", "while", "return", "const",)
-    operators = ("==", "!=", ">=", "<=", "<<", ">>", "\-=", "\+=", "\*=", "/=",
-                 "\&\&", "\|\|", "\+\+", "\-\-", ">", "<", "&", "\^", "\|",
-                 "\+", "-", "\*", "/", "%", "!", "~", "=", ";", ",", "\[",
-                 "\(", "\{", "\]", "\)", "}",)
+    Every Token records the line (starting at 1) and column (starting
+    at 0) of its first character."""
+    tokens = []
+    append = tokens.append
+    match = _PATTERN.match
+    actions = _ACTIONS
+    multiline = _MULTILINE
 
-    tokens, remainder = re.Scanner([
-        # Comments
-        (r"/\*.*?\*/",              None),
-        (r"//.*$",                  None),
+    position, end = 0, len(code)
+    line, line_start = 1, 0
 
-        # Numbers
-        (r"([1-9]\d*|0)?\.\d+",     lambda _, token: Token(TNUMBER, float(token))),
-        (r"([1-9]\d*)",             lambda _, token: Token(TNUMBER, int(token))),
-        (r"0x[0-F]+",               lambda _, token: Token(TNUMBER, int(token, base=16))),
-        (r"0",                      lambda _, token: Token(TNUMBER, int(token))),
+    while position < end:
+        m = match(code, position)
 
-        # Characters and strings
-        (r"'(\'|[^'])'",            lambda _, token: Token(TCHARACTER, token[1:-1])),
-        (r'"(\"|[^"])*?"',          lambda _, token: Token(TSTRING, token[1:-1])),
+        if m is None:
+            return False, "failed to lex: " + code[position:]
 
-        # Types
-        (r"|".join(types),          lambda _, token: Token(TTYPE, token)),
+        group = m.lastgroup
+        start, position = position, m.end()
+        type_, convert = actions[group]
 
-        # Keywords
-        (r"|".join(keywords),       lambda _, token: Token(TKEYWORD, token)),
+        if type_ is not None:
+            token = m.group(group)
 
-        # Operators
-        (r"|".join(operators),      lambda _, token: Token(TOPERATOR, token)),
+            if convert is not None:
+                token = convert(token)
 
-        # Identifiers
-        (r"[a-zA-Z_][0-9a-zA-Z_]*", lambda _, token: Token(TIDENTIFIER, token)),
+            append(Token(type_, token, line, start - line_start))
 
-        # Whitespace
-        (r"[\r\t\n ]*",             None),
-    ], re.DOTALL | re.MULTILINE).scan(code)
+        if group in multiline:
+            newlines = code.count("\n", start, position)
 
-    if remainder:
-        return False, "failed to lex: " + remainder
+            if newlines:
+                line += newlines
+                line_start = code.rindex("\n", start, position) + 1
 
     return True, tokens
+
+
+def lex_stream(source, chunk_size=CHUNK_SIZE):
+    """Given a file-like object (or an mmap), this lazily yields the
+    Tokens it contains, reading chunk_size bytes at a time.  Only the
+    unconsumed tail of the current chunk is held in memory.
+
+    Raises a LexerError when it encounters something it can't lex."""
+    read = source.read
+    match = _PATTERN.match
+    actions = _ACTIONS
+    multiline = _MULTILINE
+
+    code, position, eof = "", 0, False
+    line, line_start = 1, 0
+
+    while True:
+        m = match(code, position)
+
+        # A match that runs up to (or close to) the end of the chunk
+        # might continue into the next one, and a comment that isn't
+        # closed yet would otherwise come out as two operators.
+        if not eof and (m is None or
+                        m.end() + _LOOKAHEAD > len(code) or
+                        (m.lastgroup != "COMMENT" and
+                         code.startswith("/*", position))):
+            chunk = read(chunk_size)
+
+            if chunk:
+                code = code[position:] + chunk
+                line_start -= position
+                position = 0
+            else:
+                eof = True
+
+            continue
+
+        if position == len(code):
+            return
+
+        if m is None:
+            raise LexerError("failed to lex at line {}, column {}: {}".format(
+                line, position - line_start,
+                code[position:].split("\n", 1)[0],
+            ))
+
+        group = m.lastgroup
+        start, position = position, m.end()
+        type_, convert = actions[group]
+
+        if type_ is not None:
+            token = m.group(group)
+
+            if convert is not None:
+                token = convert(token)
+
+            yield Token(type_, token, line, start - line_start)
+
+        if group in multiline:
+            newlines = code.count("\n", start, position)
+
+            if newlines:
+                line += newlines
+                line_start = code.rindex("\n", start, position) + 1
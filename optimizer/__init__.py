@@ -0,0 +1,6 @@
+from .passes import *
+from .callgraph import *
+from .inference import *
+from .purity import *
+from .loops import *
+from .optimizer import *
@@ -0,0 +1,75 @@
+"""Whole-module passes over the call graph.
+
+Unlike the passes in passes.py, these see every top-level node of a
+module at once, since whether a function is used depends on the rest of
+the program.
+"""
+
+from parser import *
+
+
+def call_graph(nodes):
+    """Map the name of every function defined among nodes to the names
+    of the functions its body refers to, by calling them or otherwise."""
+    functions = set(node.name for node in nodes if node.kind == NFUNDECL)
+    graph = {}
+
+    for node in nodes:
+        if node.kind != NFUNDECL:
+            continue
+
+        callees = graph.setdefault(node.name, set())
+
+        for child in walk(node.body):
+            if child.kind == NCALL or child.kind == NIDENTIFIER:
+                if child.name in functions:
+                    callees.add(child.name)
+
+    return graph
+
+
+def reachable(graph, roots):
+    "The names in graph reachable from any of roots, roots included."
+    seen = set()
+    stack = [root for root in roots if root in graph]
+
+    while stack:
+        name = stack.pop()
+
+        if name not in seen:
+            seen.add(name)
+            stack.extend(graph[name] - seen)
+
+    return seen
+
+
+class DeadFunctionElimination(object):
+    """Drops the functions, and their forward declarations, that can't be
+    reached from any of roots.  Modules that define none of roots, like
+    libraries, are left alone, as are forward declarations of functions
+    the module doesn't define, which still type calls to them.
+
+    The names of the functions dropped by the last run, in the order they
+    were defined, are kept in removed.
+    """
+
+    def __init__(self, roots=("main",)):
+        self.roots = roots
+        self.removed = []
+
+    def run(self, nodes):
+        "Return the nodes of the module that are still needed."
+        graph = call_graph(nodes)
+        live = reachable(graph, self.roots)
+
+        if not live:
+            self.removed = []
+            return nodes
+
+        dead = set(graph) - live
+        self.removed = [node.name for node in nodes
+                        if node.kind == NFUNDECL and node.name in dead]
+
+        return [node for node in nodes
+                if node.kind not in (NFUNDECL, NFWDDECL) or
+                node.name not in dead]
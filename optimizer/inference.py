@@ -0,0 +1,166 @@
+"""Type inference.
+
+C types are tracked as the strings the parser records: "int", "float",
+"char" and "void", with a "*" per level of pointer and a trailing "[]"
+for arrays.  Expressions whose type can't be told statically, like
+calls to undeclared functions, get None.
+"""
+
+from parser import *
+
+from .passes import Pass
+
+
+# Operators whose operands are converted to a common arithmetic type.
+_ARITHMETIC_OPERATORS = frozenset(("+", "-", "*", "/", "%"))
+
+# Operators whose result is an int given int operands.
+_INTEGER_OPERATORS = frozenset(("<<", ">>", "&", "|", "^"))
+
+# Operators whose result is always an int truth value.
+_TRUTH_OPERATORS = frozenset(("==", "!=", ">=", "<=", ">", "<", "&&", "||"))
+
+_NUMBERS = frozenset(("int", "float"))
+
+
+def element_type(type_):
+    "The type of the elements of an array or pointer type, or None."
+    if type_ is None:
+        return None
+    if type_.endswith("[]"):
+        type_ = type_[:-2]
+    elif type_.endswith("*"):
+        type_ = type_[:-1]
+    else:
+        return None
+
+    # char arrays are bytearrays, whose elements are ints.
+    return "int" if type_ == "char" else type_
+
+
+def arithmetic_type(left, right):
+    "The type C converts int and float operands to, or None."
+    if left not in _NUMBERS or right not in _NUMBERS:
+        return None
+    if left == "float" or right == "float":
+        return "float"
+    return "int"
+
+
+class TypeInference(Pass):
+    """Types the expressions of the functions it is run on.
+
+    ctypes maps every expression of the last function run to its type,
+    or None when it can't be told.  Types are kept here rather than on
+    the nodes, which would take a slot on every expression of the tree.
+
+    functions maps the name of every function run through the pass so
+    far, forward declarations included, to its (return type, parameter
+    types), so calls to them are typed the way C would see them.  types
+    maps the parameters and locals of the last function run to their
+    declared types; names declared with more than one type map to None.
+    """
+
+    def __init__(self, functions=None):
+        self.functions = {} if functions is None else functions
+        self.types = {}
+        self.ctypes = {}
+
+    def run(self, node):
+        if node.kind in (NFUNDECL, NFWDDECL):
+            parameters = node.parameters
+            self.functions[node.name] = node.type_, parameters.types
+
+        if node.kind == NFUNDECL:
+            self.types = self.declared_types(node)
+            self.ctypes = {}
+
+            # Every node comes after its children when walked backwards,
+            # so expressions are typed after their operands, without
+            # recursing into them however deep they nest.
+            for child in reversed(list(walk(node.body))):
+                visitor = self.VISITORS.get(child.kind)
+
+                if visitor is not None:
+                    visitor(self, child)
+
+        return node
+
+    def declared_types(self, node):
+        parameters = node.parameters
+        types = dict(zip(parameters.names, parameters.types or ()))
+
+        for child in walk(node.body):
+            if child.kind == NDECL:
+                if types.get(child.name, child.type_) != child.type_:
+                    types[child.name] = None
+                else:
+                    types[child.name] = child.type_
+
+        return types
+
+    def visit_call(self, node):
+        function = self.functions.get(node.name)
+        self.ctypes[node] = None if function is None else function[0]
+
+    def visit_lunary(self, node):
+        op, operand = node.op, self.ctypes[node.operand]
+        type_ = None
+
+        if op == "!":
+            type_ = "int"
+        elif op == "~":
+            type_ = "int" if operand == "int" else None
+        elif op == "&":
+            type_ = None if operand is None else operand + "*"
+        elif operand in _NUMBERS:
+            type_ = operand
+
+        self.ctypes[node] = type_
+
+    def visit_runary(self, node):
+        operand = self.ctypes[node.operand]
+        self.ctypes[node] = operand if operand in _NUMBERS else None
+
+    def visit_binary(self, node):
+        op, left, right = node.op, node.left, node.right
+        left, right = self.ctypes[left], self.ctypes[right]
+        type_ = None
+
+        if op in ASSIGNMENT_OPERATORS:
+            type_ = left
+        elif op in _ARITHMETIC_OPERATORS:
+            type_ = arithmetic_type(left, right)
+        elif op in _INTEGER_OPERATORS:
+            type_ = "int" if left == right == "int" else None
+        elif op in _TRUTH_OPERATORS:
+            type_ = "int"
+
+        self.ctypes[node] = type_
+
+    def visit_index(self, node):
+        self.ctypes[node] = element_type(self.ctypes[node.array])
+
+    def visit_identifier(self, node):
+        self.ctypes[node] = self.types.get(node.name)
+
+    def visit_number(self, node):
+        self.ctypes[node] = "float" if isinstance(node.value, float) else "int"
+
+    def visit_character(self, node):
+        self.ctypes[node] = "char"
+
+    def visit_string(self, node):
+        self.ctypes[node] = "char*"
+
+    VISITORS = {
+        NCALL:       visit_call,
+        NLUNARY:     visit_lunary,
+        NRUNARY:     visit_runary,
+        NBINARY:     visit_binary,
+        NINDEX:      visit_index,
+        NIDENTIFIER: visit_identifier,
+        NNUMBER:     visit_number,
+        NCHARACTER:  visit_character,
+        NSTRING:     visit_string,
+    }
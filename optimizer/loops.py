@@ -0,0 +1,366 @@
+"""Loop optimization passes.
+
+Both passes type the functions they run on with TypeInference, and
+declare the locals holding the values they compute ahead of a loop right
+before it, named _cobra_* like the other names cobra makes up.
+"""
+
+from parser import *
+
+from .inference import TypeInference
+from .passes import Pass
+from .purity import Purity
+
+
+def written_names(node):
+    "The names node declares or writes to."
+    names = assigned_names(node)
+    names.update(child.name for child in walk(node) if child.kind == NDECL)
+    return names
+
+
+class LoopPass(Pass):
+    """Base class for passes that rewrite while and for loops.
+
+    Loops are handed to optimize_loop outermost first, which returns the
+    declarations to put before the loop once its children are done.
+    """
+
+    def __init__(self):
+        self.inference = TypeInference()
+        self.count = 0
+
+    def run(self, node):
+        self.inference.run(node)
+
+        if node.kind == NFUNDECL:
+            node.body = self.visit(node.body)
+
+        return node
+
+    def ctype(self, node):
+        "The type of the expression node."
+        return self.inference.ctypes.get(node)
+
+    def use(self, name, type_):
+        "A typed use of the variable name."
+        use = Identifier(name)
+        self.inference.ctypes[use] = type_
+        return use
+
+    def temporary(self, prefix, value, type_):
+        "Declare a new local holding value, returning its name."
+        self.count += 1
+        name = "_cobra_{}{}".format(prefix, self.count)
+        self.declarations.append(Declaration(name, value, type_=type_))
+        return name
+
+    def visit_loop(self, node):
+        declarations = self.optimize_loop(node)
+        node = self.generic_visit(node)
+
+        if not declarations:
+            return node
+        return Block(declarations + [node])
+
+    def optimize_loop(self, node):
+        raise NotImplementedError
+
+    VISITORS = {
+        NWHILE: visit_loop,
+        NFOR:   visit_loop,
+    }
+
+
+class LoopInvariantCodeMotion(LoopPass):
+    """Computes expressions whose value can't change while a loop runs,
+    like `n * 4` or `sq(n)` for a safe sq, once before the loop instead
+    of on every iteration.  Only safe expressions, as told by Purity, are
+    moved, since the loop might have evaluated them any number of times,
+    including never.  Identical expressions share a local.
+    """
+
+    # Kinds of expression worth computing ahead of the loop.
+    MOVABLE = frozenset((NBINARY, NLUNARY, NCALL))
+
+    def __init__(self):
+        super(LoopInvariantCodeMotion, self).__init__()
+        self.purity = Purity(self.inference)
+
+    def run(self, node):
+        node = super(LoopInvariantCodeMotion, self).run(node)
+        self.purity.run(node)
+        return node
+
+    def optimize_loop(self, node):
+        self.written = written_names(node)
+        self.hoisted = {}
+        self.declarations = []
+
+        for name, value in node.fields:
+            if name != "init" and isinstance(value, Node):
+                setattr(node, name, self.hoist(value))
+
+        return self.declarations
+
+    def hoist(self, node):
+        "Replace the invariant expressions in node by their locals."
+        if node.kind in self.MOVABLE and self.is_invariant(node):
+            key = repr(node)
+
+            if key not in self.hoisted:
+                self.hoisted[key] = self.temporary("invariant", node,
+                                                   self.ctype(node))
+
+            return self.use(self.hoisted[key], self.ctype(node))
+
+        if node.kind == NBLOCK:
+            return Block(map(self.hoist, node))
+
+        for name, value in node.fields:
+            if isinstance(value, Node):
+                setattr(node, name, self.hoist(value))
+            elif isinstance(value, tuple):
+                setattr(node, name, tuple(
+                    self.hoist(child) if isinstance(child, Node) else child
+                    for child in value
+                ))
+
+        return node
+
+    def is_invariant(self, node):
+        for child in walk(node):
+            if child.kind == NIDENTIFIER and child.name in self.written:
+                return False
+
+        return self.purity.is_safe(node)
+
+
+class StrengthReduction(LoopPass):
+    """Replaces products of a loop's induction variable and an int that
+    doesn't change in the loop, like `i * 4` or `w * i`, with a local
+    that is kept equal to the product by adding to it whenever the
+    induction variable is stepped.
+
+    Induction variables are ints the loop writes to exactly once, by
+    stepping them by a constant: in the step of a for loop, or in a
+    statement of their own in the body of a while loop.
+    """
+
+    def optimize_loop(self, node):
+        if node.kind == NFOR:
+            name, step = self.match_step(node.step)
+            start = self.match_init(node.init, name)
+        else:
+            name, step = self.match_body_step(node.body)
+            start = None if name is None else self.use(name, "int")
+
+        if start is None or self.writes(node, name) != 1:
+            return []
+
+        self.name = name
+        self.written = written_names(node)
+        self.products = {}
+        self.declarations = []
+
+        for field, value in node.fields:
+            if field not in ("init", "step") and isinstance(value, Node):
+                setattr(node, field, self.reduce(value, start, step))
+
+        if not self.products:
+            return []
+
+        if node.kind == NFOR:
+            node.body = self.update_for(node.body)
+        else:
+            node.body = self.update_while(node.body, name)
+
+        return self.declarations
+
+    def match_step(self, node):
+        """Match a statement that steps an int variable by a constant,
+        returning the variable's name and the step, or (None, None)."""
+        if node is None:
+            return None, None
+
+        kind, step = node.kind, None
+
+        if kind == NLUNARY or kind == NRUNARY:
+            if node.op in ("++", "--"):
+                variable, step = node.operand, 1 if node.op == "++" else -1
+        elif kind == NBINARY and node.op in ("+=", "-=", "="):
+            variable, value = node.left, node.right
+
+            if node.op == "=":
+                if (value.kind != NBINARY or value.op not in ("+", "-") or
+                        value.left.kind != NIDENTIFIER or
+                        variable.kind != NIDENTIFIER or
+                        value.left.name != variable.name):
+                    return None, None
+                op, value = value.op, value.right
+            else:
+                op = node.op[0]
+
+            if value.kind == NNUMBER and type(value.value) in (int, long):
+                step = value.value if op == "+" else -value.value
+
+        if (step is None or variable.kind != NIDENTIFIER or
+                self.ctype(variable) != "int"):
+            return None, None
+
+        return variable.name, step
+
+    def match_body_step(self, body):
+        "Match the first statement of a while loop's body that steps an int."
+        if body is not None and body.kind == NBLOCK:
+            for statement in body:
+                name, step = self.match_step(statement)
+
+                if name is not None:
+                    return name, step
+
+        return None, None
+
+    def match_init(self, node, name):
+        """The expression the for loop initialization node starts name
+        at, if it's simple enough to be evaluated before the loop."""
+        if name is None:
+            return None
+
+        if node is None:
+            return self.use(name, "int")
+
+        if (node.kind == NBINARY and node.op == "=" and
+                node.left.kind == NIDENTIFIER and node.left.name == name):
+            start = node.right
+
+            if start.kind == NNUMBER and type(start.value) in (int, long):
+                return Number(start.value)
+            if (start.kind == NIDENTIFIER and start.name != name and
+                    self.ctype(start) == "int"):
+                return self.use(start.name, "int")
+
+        return None
+
+    def writes(self, node, name):
+        "How many times the loop node writes to name."
+        count = 0
+
+        for child in walk(node):
+            kind = child.kind
+
+            if kind == NDECL and child.name == name:
+                return None
+            if kind == NBINARY and child.op in ASSIGNMENT_OPERATORS:
+                count += child.left.kind == NIDENTIFIER and child.left.name == name
+            elif (kind == NLUNARY or kind == NRUNARY) and child.op in ("++", "--"):
+                count += (child.operand.kind == NIDENTIFIER and
+                          child.operand.name == name)
+
+        if node.kind == NFOR and node.init is not None:
+            count -= self.writes(node.init, name)
+
+        return count
+
+    def reduce(self, node, start, step):
+        "Replace the products of the induction variable in node."
+        factor = self.match_product(node)
+
+        if factor is not None:
+            key = repr(factor)
+
+            if key not in self.products:
+                if start.kind == NNUMBER and start.value == 0:
+                    product = Number(0)
+                elif start.kind == factor.kind == NNUMBER:
+                    product = Number(start.value * factor.value)
+                else:
+                    product = Binary("*", start, factor)
+
+                name = self.temporary("product", product, "int")
+                self.products[key] = name, factor, step
+
+            return self.use(self.products[key][0], "int")
+
+        if node.kind == NBLOCK:
+            return Block(self.reduce(child, start, step) for child in node)
+
+        for name, value in node.fields:
+            if isinstance(value, Node):
+                setattr(node, name, self.reduce(value, start, step))
+            elif isinstance(value, tuple):
+                setattr(node, name, tuple(
+                    self.reduce(child, start, step)
+                    if isinstance(child, Node) else child
+                    for child in value
+                ))
+
+        return node
+
+    def match_product(self, node):
+        "The factor the induction variable is multiplied by in node, or None."
+        if node.kind != NBINARY or node.op != "*":
+            return None
+
+        for variable, factor in ((node.left, node.right), (node.right, node.left)):
+            if variable.kind != NIDENTIFIER or variable.name != self.name:
+                continue
+            if factor.kind == NNUMBER and type(factor.value) in (int, long):
+                return Number(factor.value)
+            if (factor.kind == NIDENTIFIER and
+                    self.ctype(factor) == "int" and
+                    factor.name not in self.written):
+                return self.use(factor.name, "int")
+
+        return None
+
+    def update(self, name, factor, step):
+        "The statement stepping the product name along with its variable."
+        op = "+=" if step > 0 else "-="
+
+        if factor.kind == NNUMBER:
+            delta = Number(factor.value * abs(step))
+        elif abs(step) == 1:
+            delta = factor
+        else:
+            delta = Binary("*", factor, Number(abs(step)))
+
+        return Binary(op, self.use(name, "int"), delta)
+
+    def updates(self):
+        "The statements stepping every product along with its variable."
+        return [self.update(*product) for product in self.products.values()]
+
+    def update_for(self, body):
+        """Step the products at the end of a for loop's body and before
+        every continue of the loop, just before the loop's step runs."""
+        def visit(node):
+            if node is None or node.kind in (NFOR, NWHILE):
+                return node
+            if node.kind == NCONTINUE:
+                return Block(self.updates() + [node])
+            if node.kind == NBLOCK:
+                return Block(map(visit, node))
+
+            for name, value in node.fields:
+                if name in ("body", "orelse"):
+                    setattr(node, name, visit(value))
+
+            return node
+
+        if body is None:
+            return Block(self.updates())
+
+        return Block([visit(body)] + self.updates())
+
+    def update_while(self, body, name):
+        "Step the products right after a while loop's body steps name."
+        statements = []
+
+        for statement in body:
+            statements.append(statement)
+
+            if self.match_step(statement)[0] == name:
+                statements.extend(self.updates())
+
+        return Block(statements)
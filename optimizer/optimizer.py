@@ -0,0 +1,62 @@
+from parser import nesting
+
+from .callgraph import *
+from .loops import *
+from .passes import *
+
+
+# Passes run by default, in order.
+PASSES = (ConstantFolding, AlgebraicSimplification,
+          LoopInvariantCodeMotion, StrengthReduction)
+
+# Whole-module passes run by default, in order, once every top-level
+# node has been through PASSES.
+MODULE_PASSES = (DeadFunctionElimination,)
+
+
+class Optimizer(object):
+    """An optimization stage that sits between a parser and Codegen.
+
+    Optimizer exposes the same parse() method as the parser it wraps,
+    running every top-level node through each of its passes in turn:
+
+        Codegen(Optimizer(Parser(tokens)))
+
+    passes is a sequence of Pass instances and defaults to one of each
+    class in PASSES.  module_passes, which default to one of each class
+    in MODULE_PASSES, get the list of every node of the module and
+    return the list to go on with, so nodes are only produced once the
+    whole module has been parsed if there are any.
+    """
+
+    def __init__(self, parser, passes=None, module_passes=None):
+        if passes is None:
+            passes = [pass_() for pass_ in PASSES]
+        if module_passes is None:
+            module_passes = [pass_() for pass_ in MODULE_PASSES]
+
+        self.parser = parser
+        self.passes = passes
+        self.module_passes = module_passes
+
+    def parse(self):
+        nodes = self.run_passes()
+
+        if not self.module_passes:
+            return nodes
+
+        nodes = list(nodes)
+
+        with nesting():
+            for pass_ in self.module_passes:
+                nodes = pass_.run(nodes)
+
+        return iter(nodes)
+
+    def run_passes(self):
+        for node in self.parser.parse():
+            with nesting():
+                for pass_ in self.passes:
+                    node = pass_.run(node)
+
+            yield node
@@ -0,0 +1,356 @@
+"""Tree rewriting passes.
+
+Each pass walks one top-level node and returns its rewritten form.
+Folding follows Python semantics, since that is what the generated code
+runs with: `/` on two ints is floor division and `&&`/`||` yield one of
+their operands.
+"""
+
+import operator
+
+from parser import *
+
+
+class Pass(object):
+    """Base class for optimization passes.
+
+    Subclasses put {node kind: visitor} entries in VISITORS; every other
+    node is rewritten child by child by generic_visit.  Nodes are updated
+    in place, except for Blocks, which are tuples and get rebuilt.
+    """
+
+    VISITORS = {}
+
+    def run(self, node):
+        "Rewrite the top-level node and return the result."
+        return self.visit(node)
+
+    def visit(self, node):
+        visitor = self.VISITORS.get(node.kind)
+
+        if visitor is None:
+            return self.generic_visit(node)
+        return visitor(self, node)
+
+    def generic_visit(self, node):
+        if node.kind == NBLOCK:
+            return Block(map(self.visit, node))
+
+        # Else ifs chain as long as the C does, so unless the pass visits
+        # them itself, they are rewritten in turn by this loop rather than
+        # by recursing into each from the one before.
+        top, following = node, NELIF not in self.VISITORS
+
+        while node is not None:
+            chained = None
+
+            for name, value in node.fields:
+                if isinstance(value, Node):
+                    if following and name == "orelse" and value.kind == NELIF:
+                        chained = value
+                    else:
+                        setattr(node, name, self.visit(value))
+                elif isinstance(value, tuple):
+                    setattr(node, name, tuple(
+                        self.visit(child) if isinstance(child, Node) else child
+                        for child in value
+                    ))
+
+            node = chained
+
+        return top
+
+
+# Largest shift amount worth folding.  Bigger shifts are left for the
+# program to compute, rather than making the compiler build huge ints.
+_MAX_SHIFT = 256
+
+
+def _shift(shift):
+    def fold(a, b):
+        if not 0 <= b <= _MAX_SHIFT:
+            raise ValueError(b)
+        return shift(a, b)
+    return fold
+
+
+class ConstantFolding(Pass):
+    """Evaluates operators whose operands are number literals and
+    replaces uses of `const` locals initialised to a constant with
+    their value.
+
+    A const local is only propagated if it is declared once and never
+    written to anywhere in its function, so uses are always replaced
+    with the value it actually holds.
+    """
+
+    # {operator: function} for binary operators that can be folded.
+    BINARY = {
+        "+":  operator.add,
+        "-":  operator.sub,
+        "*":  operator.mul,
+        "/":  operator.div,
+        "%":  operator.mod,
+        "&":  operator.and_,
+        "|":  operator.or_,
+        "^":  operator.xor,
+        "<<": _shift(operator.lshift),
+        ">>": _shift(operator.rshift),
+        "==": operator.eq,
+        "!=": operator.ne,
+        ">=": operator.ge,
+        "<=": operator.le,
+        ">":  operator.gt,
+        "<":  operator.lt,
+    }
+
+    UNARY = {
+        "+": operator.pos,
+        "-": operator.neg,
+        "~": operator.invert,
+        "!": operator.not_,
+    }
+
+    def run(self, node):
+        self.constants = {}
+        self.candidates = set()
+        return self.visit(node)
+
+    def visit_function_declaration(self, node):
+        declared, candidates = set(), set()
+
+        for child in walk(node.body):
+            if child.kind != NDECL:
+                continue
+
+            if child.name in declared:
+                candidates.discard(child.name)
+            elif child.const:
+                candidates.add(child.name)
+
+            declared.add(child.name)
+
+        candidates -= assigned_names(node.body)
+        candidates -= set(node.parameters.names)
+
+        self.constants = {}
+        self.candidates = candidates
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_declaration(self, node):
+        if node.size is not None:
+            node.size = self.visit(node.size)
+
+        if node.value is None:
+            return node
+
+        node.value = self.visit(node.value)
+
+        if node.name in self.candidates and node.value.kind == NNUMBER:
+            self.constants[node.name] = node.value.value
+
+        return node
+
+    def visit_identifier(self, node):
+        if node.name in self.constants:
+            return Number(self.constants[node.name])
+        return node
+
+    def visit_lunary(self, node):
+        node.operand = operand = self.visit(node.operand)
+
+        if operand.kind == NNUMBER and node.op in self.UNARY:
+            try:
+                return Number(self.UNARY[node.op](operand.value))
+            except (ArithmeticError, TypeError, ValueError):
+                pass
+
+        return node
+
+    def visit_binary(self, node):
+        op = node.op
+
+        if op in ASSIGNMENT_OPERATORS:
+            node.right = self.visit(node.right)
+            return node
+
+        node.left = left = self.visit(node.left)
+        node.right = right = self.visit(node.right)
+
+        if left.kind != NNUMBER:
+            return node
+
+        if op == "&&":
+            return right if left.value else left
+        if op == "||":
+            return left if left.value else right
+
+        if right.kind == NNUMBER:
+            try:
+                return Number(self.BINARY[op](left.value, right.value))
+            except (ArithmeticError, TypeError, ValueError):
+                pass
+
+        return node
+
+    VISITORS = {
+        NFUNDECL:    visit_function_declaration,
+        NDECL:       visit_declaration,
+        NIDENTIFIER: visit_identifier,
+        NLUNARY:     visit_lunary,
+        NBINARY:     visit_binary,
+    }
+
+
+def _is_int(node, value):
+    return (node.kind == NNUMBER and
+            type(node.value) in (int, long) and
+            node.value == value)
+
+
+# Operators whose result is never a bool, even given bool operands.
+_ARITHMETIC_OPERATORS = frozenset(("+", "-", "*", "/", "%", "<<", ">>"))
+
+
+def _is_arithmetic(node):
+    """Whether node is known to evaluate to a number rather than a bool.
+    Comparisons and `!` give True or False, which print differently from
+    the 1 or 0 an identity like `x + 0` would turn them into."""
+    kind = node.kind
+
+    if kind == NNUMBER:
+        return type(node.value) is not bool
+    if kind == NBINARY:
+        return node.op in _ARITHMETIC_OPERATORS
+    if kind == NLUNARY:
+        return node.op in ("+", "-", "~")
+
+    return False
+
+
+def _numeric_locals(function):
+    """{name: "int" or "float"} for the locals of the function node that
+    only ever hold numbers: declared in its body with one of those types,
+    and only ever assigned arithmetic values or other such locals.  An
+    int can hold a bool, like one a comparison assigned to it or, for a
+    parameter, one a caller passed, which `x + 0` would turn into 1."""
+    types, values = {}, {}
+
+    for child in walk(function.body):
+        if child.kind == NDECL:
+            name = child.name
+
+            if (child.size is None and child.type_ in ("int", "float") and
+                    types.get(name, child.type_) == child.type_):
+                types[name] = child.type_
+            else:
+                types[name] = None
+
+            if child.value is not None:
+                values.setdefault(name, []).append(child.value)
+        elif (child.kind == NBINARY and child.op == "=" and
+                child.left.kind == NIDENTIFIER):
+            values.setdefault(child.left.name, []).append(child.right)
+
+    numbers = dict((name, type_) for name, type_ in types.iteritems()
+                   if type_ is not None and
+                   name not in function.parameters.names)
+
+    # Drop the locals assigned anything else until none are.
+    changed = True
+
+    while changed:
+        changed = False
+
+        for name in numbers.keys():
+            for value in values.get(name, ()):
+                if not (_is_arithmetic(value) or
+                        value.kind == NIDENTIFIER and value.name in numbers):
+                    del numbers[name]
+                    changed = True
+                    break
+
+    return numbers
+
+
+class AlgebraicSimplification(Pass):
+    """Drops operations that leave their operand unchanged, like `x + 0`,
+    `x * 1` or `- -x`.  Only integer identities are used, so a float
+    operand is never turned into an int or vice versa, and only operands
+    known to be numbers are kept, so a bool never escapes where the
+    program would have seen an int: arithmetic, and locals that are only
+    ever assigned numbers.  float locals only lose the identities that
+    hold for every float, which `-0.0 + 0` doesn't.
+    """
+
+    # {operator: (identity, identity on the left too)}
+    IDENTITIES = {
+        "+":  (0, True),
+        "-":  (0, False),
+        "*":  (1, True),
+        "/":  (1, False),
+        "|":  (0, True),
+        "^":  (0, True),
+        "<<": (0, False),
+        ">>": (0, False),
+    }
+
+    # Operators whose identity leaves every float unchanged too.
+    FLOAT_IDENTITIES = frozenset(("-", "*", "/"))
+
+    def __init__(self):
+        # {name: type} for the numeric locals of the function being run.
+        self.numbers = {}
+
+    def run(self, node):
+        if node.kind == NFUNDECL:
+            self.numbers = _numeric_locals(node)
+        else:
+            self.numbers = {}
+
+        return self.visit(node)
+
+    def is_number(self, node, op):
+        """Whether node is known to be a number that applying op and its
+        identity leaves unchanged."""
+        if node.kind != NIDENTIFIER:
+            return _is_arithmetic(node)
+
+        type_ = self.numbers.get(node.name)
+
+        if type_ == "float":
+            return op in self.FLOAT_IDENTITIES
+        return type_ == "int"
+
+    def visit_lunary(self, node):
+        node.operand = operand = self.visit(node.operand)
+
+        if (node.op in ("-", "~") and
+                operand.kind == NLUNARY and operand.op == node.op and
+                self.is_number(operand.operand, node.op)):
+            return operand.operand
+
+        return node
+
+    def visit_binary(self, node):
+        node.left = left = self.visit(node.left)
+        node.right = right = self.visit(node.right)
+
+        if node.op not in self.IDENTITIES:
+            return node
+
+        identity, commutes = self.IDENTITIES[node.op]
+
+        if _is_int(right, identity) and self.is_number(left, node.op):
+            return left
+        if (commutes and _is_int(left, identity) and
+                self.is_number(right, node.op)):
+            return right
+
+        return node
+
+    VISITORS = {
+        NLUNARY: visit_lunary,
+        NBINARY: visit_binary,
+    }
@@ -0,0 +1,232 @@
+"""Purity analysis.
+
+An expression is safe if evaluating it has no side effects, always
+finishes and can't raise, so it may be evaluated earlier, more often or
+less often than the program says without changing what the program
+does.  A function is safe if calling it with safe arguments is: its body
+has no loops, writes nothing but its own locals and only calls functions
+that are safe themselves.
+
+Types come from a TypeInference, which has to be run on functions
+before they are analysed.
+
+Whether a function can be memoized is a weaker property: it may loop,
+raise or recurse, as long as its result only depends on its arguments.
+"""
+
+from parser import *
+
+
+_NUMBERS = frozenset(("int", "float"))
+
+# Operators that can't raise given numeric operands.
+_NUMERIC_OPERATORS = frozenset(("+", "-", "*"))
+
+# Operators that can't raise given int operands.
+_INTEGER_OPERATORS = frozenset(("&", "|", "^"))
+
+# Operators that can't raise whatever their operands.
+_TOTAL_OPERATORS = frozenset(("==", "!=", ">=", "<=", ">", "<", "&&", "||"))
+
+# Largest shift that is considered safe, as it is for the folder.
+_MAX_SHIFT = 256
+
+
+class Purity(object):
+    """Tells safe expressions apart, knowing which of the functions run
+    through it so far are safe.  Since a function can only be safe if
+    everything it calls was found to be safe before it, recursive
+    functions never are.  inference is the TypeInference that types the
+    functions."""
+
+    def __init__(self, inference):
+        self.inference = inference
+
+        # {name: number of parameters} for every safe function.
+        self.functions = {}
+
+    def ctype(self, node):
+        "The type of the expression node."
+        return self.inference.ctypes.get(node)
+
+    def run(self, node):
+        "Record whether the function declared by node is safe."
+        if node.kind != NFUNDECL:
+            return node
+
+        self.functions.pop(node.name, None)
+
+        if self.is_safe_statement(node.body):
+            self.functions[node.name] = len(node.parameters.names)
+
+        return node
+
+    def is_safe_statement(self, node):
+        "Whether running the statement node is safe."
+        if node is None:
+            return True
+
+        kind = node.kind
+
+        if kind == NBLOCK:
+            return all(map(self.is_safe_statement, node))
+        if kind == NDECL:
+            return (node.size is None and
+                    (node.value is None or self.is_safe(node.value)))
+        if kind == NIF or kind == NELIF:
+            return (self.is_safe(node.condition) and
+                    self.is_safe_statement(node.body) and
+                    self.is_safe_statement(node.orelse))
+        if kind == NELSE:
+            return self.is_safe_statement(node.body)
+        if kind == NRETURN:
+            return node.value is None or self.is_safe(node.value)
+        if kind == NBINARY and node.op in ASSIGNMENT_OPERATORS:
+            return self.is_safe_assignment(node)
+        if kind == NLUNARY or kind == NRUNARY:
+            if node.op in ("++", "--"):
+                return (node.operand.kind == NIDENTIFIER and
+                        self.ctype(node.operand) in _NUMBERS)
+
+        return kind not in (NFOR, NWHILE) and self.is_safe(node)
+
+    def is_safe_assignment(self, node):
+        "Whether the assignment statement node only writes a safe local."
+        if node.left.kind != NIDENTIFIER or not self.is_safe(node.right):
+            return False
+        if node.op == "=":
+            return True
+        if node.op == "/=":
+            return self.is_safe_division(node.left, node.right)
+
+        return (self.ctype(node.left) in _NUMBERS and
+                self.ctype(node.right) in _NUMBERS)
+
+    def is_safe(self, node):
+        "Whether evaluating the expression node is safe."
+        kind = node.kind
+
+        if kind in (NNUMBER, NCHARACTER, NSTRING):
+            return True
+
+        # Only declared names are sure to be bound.
+        if kind == NIDENTIFIER:
+            return self.ctype(node) is not None
+
+        if kind == NCALL:
+            return (self.functions.get(node.name) == len(node.arguments) and
+                    all(map(self.is_safe, node.arguments)))
+
+        if kind == NLUNARY:
+            op, operand = node.op, node.operand
+
+            if op == "!":
+                return self.is_safe(operand)
+            if op in ("+", "-"):
+                return (self.ctype(operand) in _NUMBERS and
+                        self.is_safe(operand))
+            if op == "~":
+                return self.ctype(operand) == "int" and self.is_safe(operand)
+
+            return False
+
+        if kind == NBINARY:
+            return self.is_safe_binary(node)
+
+        return False
+
+    def is_safe_binary(self, node):
+        op, left, right = node.op, node.left, node.right
+
+        if not self.is_safe(left) or not self.is_safe(right):
+            return False
+
+        if op in _TOTAL_OPERATORS:
+            return True
+        if op in _NUMERIC_OPERATORS:
+            return (self.ctype(left) in _NUMBERS and
+                    self.ctype(right) in _NUMBERS)
+        if op in _INTEGER_OPERATORS:
+            return self.ctype(left) == self.ctype(right) == "int"
+        if op in ("/", "%"):
+            return self.is_safe_division(left, right)
+        if op in ("<<", ">>"):
+            return (self.ctype(left) == "int" and right.kind == NNUMBER and
+                    type(right.value) in (int, long) and
+                    0 <= right.value <= _MAX_SHIFT)
+
+        return False
+
+    def is_safe_division(self, left, right):
+        "Whether dividing left by right can't raise."
+        return (self.ctype(left) in _NUMBERS and right.kind == NNUMBER and
+                type(right.value) is not bool and right.value != 0)
+
+
+def memoizable(nodes, known=()):
+    """The names of the functions among nodes whose result only depends
+    on their arguments, so calls with the same arguments can share it.
+    These are the int functions of int parameters that only read their
+    own parameters and locals, use no arrays and only call each other,
+    recursively or not, or the functions named in known, which are
+    memoizable already."""
+    counts = {}
+    for node in nodes:
+        if node.kind == NFUNDECL:
+            counts[node.name] = counts.get(node.name, 0) + 1
+
+    # {name: names of the functions it calls} for every candidate.
+    candidates = {}
+
+    for node in nodes:
+        if node.kind != NFUNDECL or counts[node.name] > 1:
+            continue
+
+        calls = _pure_calls(node)
+        if calls is not None:
+            candidates[node.name] = calls
+
+    # Drop the candidates that call anything else until none do.
+    known = set(known)
+    changed = True
+
+    while changed:
+        changed = False
+
+        for name, calls in candidates.items():
+            if not calls <= known.union(candidates):
+                del candidates[name]
+                changed = True
+
+    return set(candidates)
+
+
+def _pure_calls(node):
+    """The names of the functions the function node calls, or None if it
+    can't be memoized whatever those do."""
+    parameters = node.parameters
+    types = parameters.types or ()
+
+    if (node.type_ != "int" or len(types) != len(parameters.names) or
+            any(type_ != "int" for type_ in types)):
+        return None
+
+    local = set(parameters.names)
+    local.update(child.name for child in walk(node.body) if child.kind == NDECL)
+    calls = set()
+
+    for child in walk(node.body):
+        kind = child.kind
+
+        if kind == NCALL:
+            calls.add(child.name)
+        elif kind == NIDENTIFIER:
+            if child.name not in local:
+                return None
+        elif kind == NINDEX:
+            return None
+        elif kind == NDECL:
+            if child.size is not None:
+                return None
+
+    return calls
@@ -1,32 +1,22 @@
-from lexer import *
+from contextlib import contextmanager
 
+from lexer import *
 
-# Possible node types.
-for N in ("FUNDECL", "FWDDECL", "PLIST", "BLOCK", "DECL",
-          "IF", "ELIF", "ELSE", "FOR", "WHILE", "RETURN",
-          "CALL", "LUNARY", "RUNARY", "BINARY"):
-    locals()["N" + N] = N
+from .nodes import *
 
 
 def print_tree(node, indentation=0):
     "Pretty-prints a given AST."
 
-    if isinstance(node, tuple):
-        type_, children = node[0], list(node[1:])
-    else:
-        type_, children = str(node), []
-
-    if isinstance(type_, tuple):
-        map(lambda n: print_tree(n, indentation), node)
-    else:
-        print " " * indentation + type_
+    if isinstance(node, Node):
+        print " " * indentation + NODES[node.kind]
 
-        for child in children:
+        for _, child in node.fields:
             print_tree(child, indentation + 1)
-
-
-class Continue(Exception):
-    "Raised when an alternative parser should be skipped."
+    elif isinstance(node, tuple):
+        map(lambda n: print_tree(n, indentation), node)
+    elif node is not None:
+        print " " * indentation + str(node)
 
 
 class ParserError(Exception):
@@ -37,17 +27,80 @@ class UnexpectedToken(ParserError):
     "Raised when an unexpected token was encountered."
 
 
+class NestingError(ParserError):
+    "Raised when a program nests deeper than it can be compiled."
+
+
+@contextmanager
+def nesting():
+    """Report running out of recursion in the block, on a program that
+    nests deeper than the parts of compiling it that recurse can follow,
+    as a NestingError rather than a RuntimeError."""
+    try:
+        yield
+    except RuntimeError as e:
+        if "recursion" not in str(e):
+            raise
+        raise NestingError("nested too deeply to compile")
+
+
+class TokenStream(object):
+    """A list-like view over an iterable of Tokens.  Tokens are pulled
+    from the iterable as they are indexed and only a small window of
+    them is kept around for backtracking, so a stream produced by
+    lex_stream can be parsed in constant memory."""
+
+    def __init__(self, tokens, window=32):
+        self.tokens = iter(tokens)
+        self.window = window
+        self.buffer = []
+        self.offset = 0
+
+    def __getitem__(self, index):
+        buffer, position = self.buffer, index - self.offset
+
+        if position < 0:
+            raise ParserError("token {} is no longer buffered".format(index))
+
+        while position >= len(buffer):
+            try:
+                buffer.append(next(self.tokens))
+            except StopIteration:
+                raise IndexError(index)
+
+        if position > 2 * self.window:
+            del buffer[:position - self.window]
+            self.offset += position - self.window
+            position = self.window
+
+        return buffer[position]
+
+
 class StandardParser(object):
-    """A grouping of methods that aids with parsing Token lists."""
+    """A grouping of methods that aids with parsing Token lists.
+
+    Tokens are never modified: parsing only ever moves the cursor."""
 
     def __init__(self, tokens):
+        if isinstance(tokens, list):
+            tokens = tuple(tokens)
+        elif not hasattr(tokens, "__getitem__"):
+            tokens = TokenStream(tokens)
+
         self.cursor = 0
         self.tokens = tokens
 
     @property
     def rest(self):
-        "The rest of the tokens."
-        return self.tokens[self.cursor:]
+        "An iterator over the rest of the tokens."
+        tokens, index = self.tokens, self.cursor
+
+        try:
+            while True:
+                yield tokens[index]
+                index += 1
+        except IndexError:
+            pass
 
     @property
     def token(self):
@@ -68,22 +121,21 @@ class StandardParser(object):
         "Moves the cursor by the given amount."
         self.cursor += by
 
-    def drop(self, l, r):
-        "Drops tokens from the list."
-        del self.tokens[self.cursor - l:self.cursor + r]
-
     def isa(self, type_, value=None):
         "Checks if the current token has the given type and value."
+        token = self.tokens[self.cursor]
+
         if value is not None:
-            return (self.type_ == type_ and
-                    self.value == value)
+            return (token.type_ == type_ and
+                    token.value == value)
 
-        return self.type_ == type_
+        return token.type_ == type_
 
     def isin(self, type_, values):
         """Checks if the current token has the given type and if its
         value is in the given list."""
-        return any(map(lambda value: self.isa(type_, value), values))
+        token = self.tokens[self.cursor]
+        return token.type_ == type_ and token.value in values
 
     def consume(self, type_, value=None):
         """Consumes the current token, raising an UnexpectedToken
@@ -111,19 +163,6 @@ class StandardParser(object):
 
         return None
 
-    def alternative(self, alternatives):
-        """Given a list functions, it calls each function in sequence
-        until one of them succeeds."""
-        for parser in alternatives:
-            try:
-                return parser()
-            except Continue:
-                pass
-
-        raise UnexpectedToken("unexpected {} {}".format(
-            self.type_, self.value
-        ))
-
     def parse_toplevel(self):
         """This is the parser's entry point. All subclasses must
         override this."""
@@ -133,6 +172,8 @@ class StandardParser(object):
         "Parses every top-level statement it finds."
         try:
             while True:
-                yield self.parse_toplevel()
+                with nesting():
+                    node = self.parse_toplevel()
+                yield node
         except IndexError:
             pass
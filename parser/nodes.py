@@ -0,0 +1,378 @@
+"""AST nodes.
+
+Every node is a small __slots__ object whose class carries an integer
+kind code, so nodes have no per-instance __dict__ and consumers can
+dispatch on node.kind with a list or dict lookup.
+
+Statements made by the parser also know where they start in the source,
+with the line and column of their first token.  Expressions don't: they
+take the line of their statement, and leaving positions out keeps the
+bulk of any tree, its leaves and operators, two slots smaller.  The
+expressions the parser finds used as statements, calls, unary operators
+and assignments, are made as the statement forms below, which do have
+one.
+"""
+
+# Possible node kinds, in kind-code order.
+NODES = ("FUNDECL", "FWDDECL", "PLIST", "BLOCK", "DECL",
+         "IF", "ELIF", "ELSE", "FOR", "WHILE", "RETURN", "BREAK", "CONTINUE",
+         "CALL", "LUNARY", "RUNARY", "BINARY", "INDEX",
+         "IDENTIFIER", "NUMBER", "CHARACTER", "STRING")
+
+for N in NODES:
+    locals()["N" + N] = NODES.index(N)
+
+# Slots that annotate nodes rather than being among their fields.
+ANNOTATIONS = frozenset(("line", "column"))
+
+
+class Node(object):
+    "Base class for AST nodes.  Fields are the node's __slots__."
+    __slots__ = ()
+    kind = None
+
+    @property
+    def fields(self):
+        "The (name, value) pairs of this node's fields."
+        return [(name, getattr(self, name))
+                for class_ in reversed(type(self).__mro__)
+                for name in getattr(class_, "__slots__", ())
+                if name not in ANNOTATIONS]
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(
+            repr(value) for _, value in self.fields
+        ))
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't set, like the position
+        # of a node that has none.
+        if name in ANNOTATIONS:
+            return None
+
+        raise AttributeError(name)
+
+
+class Located(Node):
+    """Base class for statements, which have a position: the 1-based line
+    and 0-based column they start at, or None for statements that weren't
+    parsed, like the ones made by optimizations.  The position of any
+    other node is None."""
+    __slots__ = ("line", "column")
+
+
+def located(source, node):
+    "Give node the position of source, a token or node, and return node."
+    node.line, node.column = source.line, source.column
+    return node
+
+
+class FunctionDeclaration(Located):
+    __slots__ = ("type_", "name", "parameters", "body")
+    kind = NFUNDECL
+
+    def __init__(self, type_, name, parameters, body):
+        self.type_ = type_
+        self.name = name
+        self.parameters = parameters
+        self.body = body
+
+
+class ForwardDeclaration(Located):
+    __slots__ = ("type_", "name", "parameters")
+    kind = NFWDDECL
+
+    def __init__(self, type_, name, parameters):
+        self.type_ = type_
+        self.name = name
+        self.parameters = parameters
+
+
+class ParameterList(Node):
+    "A function's parameter names and their declared types."
+    __slots__ = ("names", "types")
+    kind = NPLIST
+
+    def __init__(self, names, types=None):
+        self.names = names
+        self.types = types
+
+
+class Block(Node, tuple):
+    """A sequence of statements.  Blocks are tuples of their statements,
+    which saves holding on to a separate tuple for every block."""
+    __slots__ = ()
+    kind = NBLOCK
+
+    def __new__(cls, statements):
+        return tuple.__new__(cls, statements)
+
+    @property
+    def statements(self):
+        return self
+
+    @property
+    def fields(self):
+        return [("statements", tuple(self))]
+
+
+class Declaration(Located):
+    """A local variable declaration.  const is True for `const` locals
+    and type_ is the declared type, with a "*" per level of pointer and
+    a trailing "[]" for arrays, whose size is an expression."""
+    __slots__ = ("name", "value", "const", "type_", "size")
+    kind = NDECL
+
+    def __init__(self, name, value=None, const=False, type_=None, size=None):
+        self.name = name
+        self.value = value
+        self.const = const
+        self.type_ = type_
+        self.size = size
+
+
+class If(Located):
+    "An if statement.  body is None for `if (...);`."
+    __slots__ = ("condition", "body", "orelse")
+    kind = NIF
+
+    def __init__(self, condition, body=None, orelse=None):
+        self.condition = condition
+        self.body = body
+        self.orelse = orelse
+
+
+class ElseIf(If):
+    __slots__ = ()
+    kind = NELIF
+
+
+class Else(Located):
+    __slots__ = ("body",)
+    kind = NELSE
+
+    def __init__(self, body):
+        self.body = body
+
+
+class For(Located):
+    "A for loop.  Any of its parts may be None."
+    __slots__ = ("init", "condition", "step", "body")
+    kind = NFOR
+
+    def __init__(self, init, condition, step, body=None):
+        self.init = init
+        self.condition = condition
+        self.step = step
+        self.body = body
+
+
+class While(Located):
+    __slots__ = ("condition", "body")
+    kind = NWHILE
+
+    def __init__(self, condition, body=None):
+        self.condition = condition
+        self.body = body
+
+
+class Return(Located):
+    __slots__ = ("value",)
+    kind = NRETURN
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+class BreakStatement(Located):
+    __slots__ = ()
+    kind = NBREAK
+
+
+class ContinueStatement(Located):
+    __slots__ = ()
+    kind = NCONTINUE
+
+
+class Expression(Node):
+    """Base class for expression nodes.  The C types they evaluate to are
+    kept by TypeInference, in its ctypes, rather than on the nodes."""
+    __slots__ = ()
+
+
+class Call(Expression):
+    __slots__ = ("name", "arguments")
+    kind = NCALL
+
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = arguments
+
+
+class LUnary(Expression):
+    __slots__ = ("op", "operand")
+    kind = NLUNARY
+
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+
+class RUnary(Expression):
+    __slots__ = ("op", "operand")
+    kind = NRUNARY
+
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+
+class Binary(Expression):
+    __slots__ = ("op", "left", "right")
+    kind = NBINARY
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class CallStatement(Call):
+    "A Call used as a statement, which has a position like a Located node."
+    __slots__ = ("line", "column")
+
+
+class LUnaryStatement(LUnary):
+    "An LUnary used as a statement, like `++i;`, with a position."
+    __slots__ = ("line", "column")
+
+
+class RUnaryStatement(RUnary):
+    "An RUnary used as a statement, like `i++;`, with a position."
+    __slots__ = ("line", "column")
+
+
+class Assignment(Binary):
+    """A Binary whose op is one of the ASSIGNMENT_OPERATORS, which has a
+    position like a Located node.  Assignments are only ever statements,
+    and the parser makes one for every assignment; passes may make plain
+    Binary nodes for them."""
+    __slots__ = ("line", "column")
+
+
+# {expression class: its statement form}
+STATEMENT_FORMS = {
+    Call:   CallStatement,
+    LUnary: LUnaryStatement,
+    RUnary: RUnaryStatement,
+}
+
+
+def as_statement(source, node):
+    """The expression node as a statement with the position of source, a
+    token or node: node itself if it has no statement form."""
+    form = STATEMENT_FORMS.get(type(node))
+
+    if form is None:
+        return node
+
+    return located(source, form(*[value for _, value in node.fields]))
+
+
+class Index(Expression):
+    "An array subscript, `array[index]`."
+    __slots__ = ("array", "index")
+    kind = NINDEX
+
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+
+class Identifier(Expression):
+    __slots__ = ("name",)
+    kind = NIDENTIFIER
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Number(Expression):
+    __slots__ = ("value",)
+    kind = NNUMBER
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Character(Expression):
+    __slots__ = ("value",)
+    kind = NCHARACTER
+
+    def __init__(self, value):
+        self.value = value
+
+
+class String(Expression):
+    __slots__ = ("value",)
+    kind = NSTRING
+
+    def __init__(self, value):
+        self.value = value
+
+
+# Operators that write to their left operand.
+ASSIGNMENT_OPERATORS = frozenset(("=", "+=", "-=", "*=", "/="))
+
+
+def walk(node):
+    "Yield node and every node below it."
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+        yield node
+
+        if node.kind == NBLOCK:
+            stack.extend(node)
+            continue
+
+        for _, value in node.fields:
+            if isinstance(value, Node):
+                stack.append(value)
+            elif isinstance(value, tuple):
+                stack.extend(child for child in value if isinstance(child, Node))
+
+
+def assigned_names(node):
+    "The names of every variable node writes to."
+    names = set()
+
+    for child in walk(node):
+        kind = child.kind
+
+        if kind == NBINARY:
+            if child.op in ASSIGNMENT_OPERATORS and child.left.kind == NIDENTIFIER:
+                names.add(child.left.name)
+        elif kind == NLUNARY or kind == NRUNARY:
+            if child.op in ("++", "--") and child.operand.kind == NIDENTIFIER:
+                names.add(child.operand.name)
+
+    return names
+
+
+def is_pure(node, functions=()):
+    """Whether evaluating node can neither write a variable nor call a
+    function, other than the pure functions named in functions."""
+    for child in walk(node):
+        kind = child.kind
+
+        if kind == NCALL:
+            if child.name not in functions:
+                return False
+        if kind == NBINARY and child.op in ASSIGNMENT_OPERATORS:
+            return False
+        if (kind == NLUNARY or kind == NRUNARY) and child.op in ("++", "--"):
+            return False
+
+    return True
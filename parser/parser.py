@@ -1,6 +1,10 @@
 from .core import *
 
 
+# Kinds of statements that aren't terminated by a semicolon.
+COMPOUND_STATEMENTS = frozenset((NIF, NELIF, NELSE, NFOR, NWHILE))
+
+
 class Parser(StandardParser):
     def parse_paren_expression(self):
         self.consume(TOPERATOR, "(")
@@ -8,125 +12,215 @@ class Parser(StandardParser):
         self.consume(TOPERATOR, ")")
         return e
 
-    def parse_expression(self):
-        def require(type_, value=None, move=0):
-            self.move(move)
+    def parse_term(self):
+        token = self.token
+        self.move(1)
+        return self.TERMS[token.type_](token.value)
 
-            if not self.isa(type_, value):
-                self.move(-move)
-                raise Continue()
+    def parse_name(self):
+        name = self.consume(TIDENTIFIER)
 
-        def term(type_):
-            def parser():
-                require(type_)
-                return (type_, self.consume(type_))
-            return parser
+        if self.isa(TOPERATOR, "("):
+            return self.parse_call(name)
 
-        def lunary(value):
-            def parser():
-                require(TOPERATOR, value)
-                self.consume(TOPERATOR)
-                return (NLUNARY, value, primary())
-            return parser
+        e = Identifier(name)
 
-        def runary(value):
-            def parser():
-                require(TOPERATOR, value, 1)
+        while self.isa(TOPERATOR, "["):
+            e = self.parse_index(e)
 
-                self.drop(0, 1)
-                self.move(-1)
+        if self.isin(TOPERATOR, ("++", "--")):
+            return RUnary(self.consume(TOPERATOR), e)
 
-                return (NRUNARY, value, primary())
-            return parser
+        return e
 
-        def paren():
-            require(TOPERATOR, "(")
-            return self.parse_paren_expression()
+    def parse_index(self, array):
+        self.consume(TOPERATOR, "[")
+        index = self.parse_expression()
+        self.consume(TOPERATOR, "]")
 
-        def funcall():
-            require(TIDENTIFIER)
-            require(TOPERATOR, "(", 1)
-            self.move(-1)
-            fun = self.consume(TIDENTIFIER)
-            self.consume(TOPERATOR, "(")
+        return Index(array, index)
 
-            parameters = []
+    def parse_call(self, name):
+        self.consume(TOPERATOR, "(")
 
-            while not self.isa(TOPERATOR, ")"):
-                parameters.append(self.parse_expression())
-                self.ignore(TOPERATOR, ",")
+        parameters = []
 
-            self.consume(TOPERATOR, ")")
+        while not self.isa(TOPERATOR, ")"):
+            parameters.append(self.parse_expression())
+            self.ignore(TOPERATOR, ",")
+
+        self.consume(TOPERATOR, ")")
 
-            return tuple([NCALL, fun] + parameters)
-
-        def primary():
-            # Highest precedence at the top.
-            return self.alternative((
-                paren,
-                funcall,
-                runary("--"),
-                runary("++"),
-                lunary("!"),
-                lunary("~"),
-                lunary("&"),
-                lunary("+"),
-                lunary("-"),
-                lunary("--"),
-                lunary("++"),
-                term(TIDENTIFIER),
-                term(TNUMBER),
-                term(TCHARACTER),
-                term(TSTRING),
+        return Call(name, tuple(parameters))
+
+    # {token type: node class} for tokens that are expressions on their own.
+    TERMS = {
+        TIDENTIFIER: Identifier,
+        TNUMBER:     Number,
+        TCHARACTER:  Character,
+        TSTRING:     String,
+    }
+
+    # {token type: parser} for tokens that start a primary expression.
+    PREFIX = {
+        TIDENTIFIER: parse_name,
+        TNUMBER:     parse_term,
+        TCHARACTER:  parse_term,
+        TSTRING:     parse_term,
+    }
+
+    # Operators that can start an operand: unary operators, which bind
+    # tighter than any binary one, and open parentheses.
+    PREFIX_OPERATORS = frozenset(("(", "!", "~", "&", "+", "-", "--", "++"))
+
+    # {operator: (precedence, right-associative)}
+    INFIX = dict((op, (precedence(op), rassoc(op))) for op in BINARY_OPERATORS)
+
+    def parse_primary(self):
+        token = self.token
+        parser = self.PREFIX.get(token.type_)
+
+        if parser is None:
+            raise UnexpectedToken("unexpected {} {}".format(
+                token.type_, token.value
             ))
 
-        def binary(e1, mp):
-            "Simple precedence climbing."
+        return parser(self)
+
+    def parse_expression(self, statement=False):
+        """Operator precedence parsing over the INFIX table, with stacks of
+        their own for operands and operators so that neither parentheses
+        nor chains of operators recurse, however deep they nest.
+        Assignments aren't expressions, so only a statement, one of the
+        expressions of a for loop's header that aren't its condition, may
+        be one.  Statements are made in their statement form, which has
+        a position."""
+        start = self.token
+        infix = self.INFIX
+
+        # The left operands of the binary operators waiting for their
+        # right one, and the operators waiting for their operand: (token,
+        # precedence) pairs, with a precedence of None for unary operators
+        # and open parentheses.
+        operands, operators = [], []
+        depth = 0
 
-            while self.isin(TOPERATOR, BINARY_OPERATORS) and precedence(self.value) >= mp:
-                op, e2 = self.consume(TOPERATOR), primary()
+        while True:
+            while self.isin(TOPERATOR, self.PREFIX_OPERATORS):
+                if self.value == "(":
+                    depth += 1
 
-                while self.isa(TOPERATOR) and \
-                    ((precedence(self.value) > precedence(op)) or
-                     (rassoc(op) and precedence(self.value) == precedence(op))):
-                    e2 = binary(e2, precedence(self.value))
+                operators.append((self.token, None))
+                self.move(1)
 
-                e1 = (NBINARY, op, e1, e2)
+            e = self.parse_primary()
 
-            return e1
+            while True:
+                while operators and operators[-1][1] is None:
+                    token = operators[-1][0]
+
+                    if token.value == "(":
+                        break
+
+                    operators.pop()
+                    e = LUnary(token.value, e)
+
+                if not depth or not self.isa(TOPERATOR, ")"):
+                    break
+
+                # A parenthesized expression is done, and is an operand.
+                e = self.reduce(start, e, operands, operators, 0)
+                operators.pop()
+                depth -= 1
+                self.move(1)
+
+            token = self.token
+
+            if token.type_ != TOPERATOR or token.value not in infix:
+                break
+
+            level, right = infix[token.value]
+            e = self.reduce(start, e, operands, operators,
+                            level + 1 if right else level)
+
+            if token.value in ASSIGNMENT_OPERATORS and (
+                    not statement or depth or operators):
+                raise ParserError("assignment used as a value")
+
+            operands.append(e)
+            operators.append((token, level))
+            self.move(1)
+
+        if depth:
+            self.consume(TOPERATOR, ")")
 
-        return binary(primary(), 0)
+        e = self.reduce(start, e, operands, operators, 0)
+        return as_statement(start, e) if statement else e
+
+    def reduce(self, start, e, operands, operators, mp):
+        """Apply the binary operators on top of operators that bind at
+        least as tight as mp to e, their last right operand, up to the
+        first open parenthesis.  Assignments start at start."""
+        while operators and operators[-1][1] is not None and (
+                operators[-1][1] >= mp):
+            op = operators.pop()[0].value
+
+            if op in ASSIGNMENT_OPERATORS:
+                e = located(start, Assignment(op, operands.pop(), e))
+            else:
+                e = Binary(op, operands.pop(), e)
+
+        return e
 
     def parse_if(self):
-        kind = self.consume(TKEYWORD)
-        cond = self.parse_paren_expression()
+        """Parse an if statement and the chain of else ifs after it, with
+        a loop rather than recursion, however long the chain is."""
+        # [(token, class, condition, body)] for the if and every else if.
+        links = []
+        orelse = None
 
-        if kind == "else":
-            kind = NELSE
-        else:
-            kind = NELIF
+        while True:
+            token = self.token
 
-        if self.isa(TOPERATOR, ";"):
-            return (NIF, cond)
+            if self.consume(TKEYWORD) == "else if":
+                class_ = ElseIf
+            else:
+                class_ = If
 
-        block = self.parse_block()
+            cond = self.parse_paren_expression()
 
-        if self.isa(TKEYWORD, "else if"):
-            return (kind, cond, block, self.parse_if())
+            if self.isa(TOPERATOR, ";"):
+                links.append((token, class_, cond, None))
+                break
 
-        if self.ignore(TKEYWORD, "else"):
-            return (kind, cond, block, (NELSE, self.parse_block()))
+            links.append((token, class_, cond, self.parse_block()))
 
-        return (kind, cond, block)
+            if self.isa(TKEYWORD, "else if"):
+                continue
+
+            token = self.token
+
+            if self.ignore(TKEYWORD, "else"):
+                orelse = located(token, Else(self.parse_block()))
+            break
+
+        for token, class_, cond, block in reversed(links):
+            if block is None:
+                orelse = located(token, class_(cond))
+            else:
+                orelse = located(token, class_(cond, block, orelse))
+
+        return orelse
 
     def parse_for(self):
+        token = self.token
         self.consume(TKEYWORD, "for")
         self.consume(TOPERATOR, "(")
 
         e1, e2, e3 = None, None, None
 
         if not self.isa(TOPERATOR, ";"):
-            e1 = self.parse_expression()
+            e1 = self.parse_expression(statement=True)
 
         self.consume(TOPERATOR, ";")
 
@@ -136,91 +230,104 @@ class Parser(StandardParser):
         self.consume(TOPERATOR, ";")
 
         if not self.isa(TOPERATOR, ")"):
-            e3 = self.parse_expression()
+            e3 = self.parse_expression(statement=True)
 
         self.consume(TOPERATOR, ")")
 
-        if self.isa(TOPERATOR, ";"):
-            return (NFOR, e1, e2, e3)
+        if self.ignore(TOPERATOR, ";"):
+            return located(token, For(e1, e2, e3))
 
-        return (NFOR, e1, e2, e3, self.parse_block())
+        return located(token, For(e1, e2, e3, self.parse_block()))
 
     def parse_while(self):
+        token = self.token
         self.consume(TKEYWORD, "while")
         self.consume(TOPERATOR, "(")
         condition = self.parse_expression()
         self.consume(TOPERATOR, ")")
 
         if self.ignore(TOPERATOR, ";"):
-            return (NWHILE, condition)
-        return (NWHILE, condition, self.parse_block())
+            return located(token, While(condition))
+        return located(token, While(condition, self.parse_block()))
 
     def parse_return(self):
+        token = self.token
         self.consume(TKEYWORD, "return")
-        done = self.ignore(TOPERATOR, ";")
-
-        if done:
-            return (NRETURN,)
 
-        return (NRETURN, self.parse_expression())
+        if self.isa(TOPERATOR, ";"):
+            return located(token, Return())
+
+        return located(token, Return(self.parse_expression()))
+
+    def parse_break(self):
+        token = self.token
+        self.consume(TKEYWORD, "break")
+        return located(token, BreakStatement())
+
+    def parse_continue(self):
+        token = self.token
+        self.consume(TKEYWORD, "continue")
+        return located(token, ContinueStatement())
+
+    # {keyword: parser} for keywords that start a statement.
+    STATEMENTS = {
+        "if":       parse_if,
+        "for":      parse_for,
+        "while":    parse_while,
+        "return":   parse_return,
+        "break":    parse_break,
+        "continue": parse_continue,
+    }
 
     def parse_variable(self):
+        """Returns a (type, name, size) triple.  size is None unless the
+        variable is an array, and may be None for arrays too when it is
+        left out, like in `int a[]`."""
         self.ignore(TKEYWORD, "const")
-        self.consume(TTYPE)
+        type_ = self.consume(TTYPE)
+        size = None
 
         while self.isa(TOPERATOR, "*"):
-            self.consume(TOPERATOR, "*")
+            type_ += self.consume(TOPERATOR, "*")
 
         variable = self.consume(TIDENTIFIER)
 
-        if self.isa(TOPERATOR, "["):
-            self.consume(TOPERATOR, "[")
-            self.consume(TNUMBER)
-            self.consume(TOPERATOR, "]")
+        if self.ignore(TOPERATOR, "["):
+            type_ += "[]"
 
-        return variable
+            if not self.isa(TOPERATOR, "]"):
+                size = self.parse_expression()
 
-    def parse_declaration(self):
-        variable = self.parse_variable()
+            self.consume(TOPERATOR, "]")
 
-        if self.isa(TOPERATOR, "="):
-            self.move(-1)
+        return type_, variable, size
 
-            if self.isa(TOPERATOR, "]"):
-                self.drop(2, 1)
-                self.move(-3)
+    def parse_declaration(self):
+        token = self.token
+        const = self.ignore(TKEYWORD, "const") is not None
+        type_, variable, size = self.parse_variable()
 
-            return (NDECL, variable), self.parse_expression()
+        if self.ignore(TOPERATOR, "="):
+            return located(token, Declaration(
+                variable, self.parse_expression(), const, type_, size
+            ))
 
-        return (NDECL, variable)
+        return located(token, Declaration(variable, None, const, type_, size))
 
     def parse_statement(self):
-        def declaration():
-            if not self.isa(TTYPE):
-                raise Continue()
-            return self.parse_declaration()
-
-        def keyword():
-            if not self.isa(TKEYWORD):
-                raise Continue()
-
-            try:
-                return {
-                    "if": self.parse_if,
-                    "for": self.parse_for,
-                    "while": self.parse_while,
-                    "return": self.parse_return,
-                }[self.value]()
-            except KeyError:
+        if self.isa(TTYPE) or self.isa(TKEYWORD, "const"):
+            result = self.parse_declaration()
+        elif self.isa(TKEYWORD):
+            parser = self.STATEMENTS.get(self.value)
+
+            if parser is None:
                 raise UnexpectedToken("unexpected KEYWORD " + self.value)
 
-        result = self.alternative((
-            declaration,
-            keyword,
-            self.parse_expression,
-        ))
+            result = parser(self)
+        else:
+            result = self.parse_expression(statement=True)
 
-        if result[0] not in (NIF, NELIF, NELSE, NFOR, NWHILE):
+        if result.kind not in COMPOUND_STATEMENTS:
             self.consume(TOPERATOR, ";")
 
         return result
@@ -229,7 +336,7 @@ class Parser(StandardParser):
         statements = []
 
         if not self.isa(TOPERATOR, "{"):
-            return (NBLOCK, self.parse_statement())
+            return Block((self.parse_statement(),))
 
         self.consume(TOPERATOR, "{")
 
@@ -238,7 +345,7 @@ class Parser(StandardParser):
 
         self.consume(TOPERATOR, "}")
 
-        return tuple([NBLOCK] + statements)
+        return Block(tuple(statements))
 
     def parse_parameter_list(self):
         parameters = []
@@ -251,13 +358,18 @@ class Parser(StandardParser):
 
         self.consume(TOPERATOR, ")")
 
-        return tuple([NPLIST] + parameters)
+        types = tuple(type_ for type_, _, _ in parameters)
+        names = tuple(name for _, name, _ in parameters)
+        return ParameterList(names, types)
 
     def parse_toplevel(self):
+        token = self.token
         type_ = self.consume(TTYPE)
         identifier = self.consume(TIDENTIFIER)
         parameters = self.parse_parameter_list()
 
         if self.ignore(TOPERATOR, ";"):
-            return (NFWDDECL, type_, identifier, parameters)
-        return (NFUNDECL, type_, identifier, parameters, self.parse_block())
+            return located(token, ForwardDeclaration(type_, identifier,
+                                                     parameters))
+        return located(token, FunctionDeclaration(type_, identifier, parameters,
+                                                  self.parse_block()))
@@ -0,0 +1,2 @@
+from .memoize import *
+from .counters import *
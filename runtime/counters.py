@@ -0,0 +1,100 @@
+"""Counters of instrumented code.
+
+Modules generated with instrumentation allocate their counters with
+counters, one element of a list per counting site, and increment the
+elements by index.  A list allocated up front takes fewer instructions
+to count into than a dict keyed by site, and fewer allocations than an
+array.array, whose elements are boxed again on every read.  The counts
+of every instrumented module are written to stderr when the program
+exits: how many times each function was called, each loop body ran and
+each if statement ran, with how often each of its branches was taken.
+"""
+
+import atexit
+import sys
+
+# The counters of every instrumented module so far, in order.
+_COUNTERS = []
+
+
+class Counters(object):
+    """The counts of the sites of an instrumented module, in a list with
+    an element per site.  Sites are (kind, function, line, parent)
+    tuples, where kind is "call", "loop", "if", "branch" or "none", the
+    missing else of an if, and parent is the index of the if statement
+    of a branch or none.  If statements run as many times as their
+    branches and none are taken together, so their own counts stay 0."""
+    __slots__ = ("filename", "sites", "counts")
+
+    def __init__(self, filename, sites):
+        self.filename = filename
+        self.sites = sites
+        self.counts = [0] * len(sites)
+
+    def calls(self):
+        "{function: number of calls}"
+        return dict((function, self.counts[index])
+                    for index, (kind, function, _, _)
+                    in enumerate(self.sites) if kind == "call")
+
+    def lines(self):
+        "The report of every site, a line each."
+        # {if statement: [(branch, times taken)]}
+        branches = {}
+
+        for index, (kind, _, line, parent) in enumerate(self.sites):
+            if kind == "branch" or kind == "none":
+                branch = "line {}".format(line) if kind == "branch" else kind
+                branches.setdefault(parent, []).append(
+                    (branch, self.counts[index])
+                )
+
+        for index, (kind, function, line, _) in enumerate(self.sites):
+            count = self.counts[index]
+            where = "{}:{} in {}".format(self.filename, line, function)
+
+            if kind == "call":
+                yield "{}: {} calls".format(where, count)
+            elif kind == "loop":
+                yield "{}: loop body ran {} times".format(where, count)
+            elif kind == "if":
+                taken = branches.get(index, [])
+                runs = sum(hits for _, hits in taken)
+                ratios = ("{} {}".format(branch, _ratio(hits, runs))
+                          for branch, hits in taken)
+
+                yield "{}: if ran {} times, took {}".format(
+                    where, runs, ", ".join(ratios)
+                )
+
+
+def _ratio(hits, count):
+    return "{} times ({:.1f}%)".format(
+        hits, 100.0 * hits / count if count else 0.0
+    )
+
+
+def instrumented():
+    "The Counters of every instrumented module so far, in order."
+    return list(_COUNTERS)
+
+
+def report_counters(file_=None):
+    "Write the counts of every instrumented module to file_ or stderr."
+    file_ = file_ or sys.stderr
+
+    for module in _COUNTERS:
+        for line in module.lines():
+            file_.write("counters: {}\n".format(line))
+
+
+def counters(sites):
+    """The list counting the sites of the calling module, whose report
+    names the file it was compiled from."""
+    module = Counters(sys._getframe(1).f_code.co_filename, sites)
+
+    if not _COUNTERS:
+        atexit.register(report_counters)
+    _COUNTERS.append(module)
+
+    return module.counts
@@ -0,0 +1,139 @@
+"""Memoization of pure functions.
+
+Generated modules decorate the functions codegen proved pure with
+memoize, which keeps their results in a bounded least recently used
+cache and counts hits and misses.  The counts of every memoized function
+are written to stderr when the program exits.
+"""
+
+import atexit
+import sys
+
+# Number of results kept per function unless told otherwise.
+MEMOIZE_SIZE = 4096
+
+# The statistics of every function memoized so far, in order.
+_STATISTICS = []
+
+# Indices into the links of a cache's list, ordered from least to most
+# recently used.
+_PREVIOUS, _NEXT, _KEY, _RESULT = range(4)
+
+
+class Statistics(object):
+    "Hit and miss counts of a memoized function."
+    __slots__ = ("name", "hits", "misses", "size")
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+
+    def __str__(self):
+        calls = self.hits + self.misses
+        rate = 100.0 * self.hits / calls if calls else 0.0
+
+        return "{}: {} hits, {} misses ({:.1f}% hit rate), {} cached".format(
+            self.name, self.hits, self.misses, rate, self.size
+        )
+
+
+def report(file_=None):
+    "Write the statistics of every memoized function to file_ or stderr."
+    file_ = file_ or sys.stderr
+
+    for statistics in _STATISTICS:
+        file_.write("memoize: {}\n".format(statistics))
+
+
+def memoize(name, size=MEMOIZE_SIZE):
+    """Decorate a function of hashable arguments so it remembers the
+    results of its size latest calls, or of all of them if size is 0.
+    Calls that raise are not remembered.
+
+    Arguments are told apart by type as well as value, so a call with
+    True or 1.0 doesn't get the result of a call with 1, which may print
+    differently."""
+    statistics = Statistics(name)
+
+    if not _STATISTICS:
+        atexit.register(report)
+    _STATISTICS.append(statistics)
+
+    def decorate(function):
+        if size:
+            return _bounded(function, size, statistics)
+        return _unbounded(function, statistics)
+
+    return decorate
+
+
+def _unbounded(function, statistics):
+    cache = {}
+
+    def memoized(*args):
+        key = args + tuple(map(type, args))
+
+        try:
+            result = cache[key]
+        except KeyError:
+            result = cache[key] = function(*args)
+            statistics.misses += 1
+            statistics.size += 1
+            return result
+
+        statistics.hits += 1
+        return result
+
+    memoized.__name__ = function.__name__
+    return memoized
+
+
+def _bounded(function, size, statistics):
+    # {arguments: link} and a circular list of [previous, next, key,
+    # result] links through root, the least recently used link first.
+    cache = {}
+    root = []
+    root[:] = [root, root, None, None]
+
+    def memoized(*args):
+        key = args + tuple(map(type, args))
+        link = cache.get(key)
+
+        if link is not None:
+            # Move the link to the most recently used end.
+            previous, next_ = link[_PREVIOUS], link[_NEXT]
+            previous[_NEXT], next_[_PREVIOUS] = next_, previous
+
+            last = root[_PREVIOUS]
+            last[_NEXT] = root[_PREVIOUS] = link
+            link[_PREVIOUS], link[_NEXT] = last, root
+
+            statistics.hits += 1
+            return link[_RESULT]
+
+        result = function(*args)
+        statistics.misses += 1
+
+        if key in cache:
+            # A recursive call got there first.
+            return result
+
+        if statistics.size < size:
+            statistics.size += 1
+        else:
+            # Evict the least recently used result.
+            oldest = root[_NEXT]
+            root[_NEXT] = oldest[_NEXT]
+            oldest[_NEXT][_PREVIOUS] = root
+            del cache[oldest[_KEY]]
+
+        last = root[_PREVIOUS]
+        link = [last, root, key, result]
+        last[_NEXT] = root[_PREVIOUS] = cache[key] = link
+
+        return result
+
+    memoized.__name__ = function.__name__
+    return memoized
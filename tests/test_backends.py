@@ -0,0 +1,295 @@
+"""Tests that both code generators compile programs the same way, run
+with `python -m unittest discover tests` from the top of the
+repository."""
+
+import os
+import sys
+import unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from codegen import BytecodeCodegen, Codegen
+from lexer import lex
+from parser import NestingError, Parser, ParserError
+
+BACKENDS = (Codegen, BytecodeCodegen)
+
+
+def compile_f(backend, source, **settings):
+    "Compile source with backend, built with settings, and return its f."
+    success, tokens = lex(source)
+    assert success, tokens
+
+    namespace = {}
+    exec backend(Parser(tokens), **settings).gen_code("<test>") in namespace
+    return namespace["f"]
+
+
+def run(backend, source, *args):
+    "Compile source with backend and call its f with args."
+    return compile_f(backend, source)(*args)
+
+
+def output(backend, source, *args):
+    "Run source like run, returning its result and what it printed."
+    stdout, sys.stdout = sys.stdout, StringIO()
+
+    try:
+        return run(backend, source, *args), sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+
+class AssignmentTest(unittest.TestCase):
+    def test_statements(self):
+        source = """
+        int f(int n) {
+            int a[2];
+            int i;
+            int s = 0;
+            for (i = 0; i < n; i += 1) {
+                s = s + i;
+                a[i % 2] = s;
+                s *= 2;
+            }
+            return s + a[0] + a[1];
+        }
+        """
+        for backend in BACKENDS:
+            self.assertEqual(run(backend, source, 5), 89, backend.__name__)
+
+    def test_truncation(self):
+        # Ints updated with floats are truncated back to ints, and the
+        # index of a subscript is still only evaluated once.
+        source = """
+        int g(int i) { print(i); return i; }
+        int f(int n) {
+            int a[4];
+            int i = 1;
+            a[2] = 1;
+            a[3] = 1;
+            a[2] += 1.5;
+            a[g(3)] *= 2.5;
+            a[i + 2] -= 0.5;
+            i += 0.75;
+            return a[2] * 100 + a[3] * 10 + i;
+        }
+        """
+        for backend in BACKENDS:
+            self.assertEqual(output(backend, source, 0), (211, "3\n"),
+                             backend.__name__)
+
+    def test_values(self):
+        # Assignments used as values are rejected whichever backend
+        # compiles them.
+        for value in ("a = b = 3", "if ((a = 2)) b = 1", "print(a += 2)",
+                      "while ((a = a - 1) > 0) b++", "int c = a = 2",
+                      "b = 1 + (a = 2)"):
+            source = "int f() { int a = 1; int b = 0; %s; return b; }" % value
+
+            for backend in BACKENDS:
+                with self.assertRaises(ParserError):
+                    run(backend, source)
+
+
+class NestingTest(unittest.TestCase):
+    def test_else_if(self):
+        branches = "".join(" else if (n == %d) return %d;" % (i, i * 2)
+                           for i in range(1, 3000))
+        source = ("int f(int n) { if (n == 0) return -1;%s else return 0; }"
+                  % branches)
+
+        for backend in BACKENDS:
+            self.assertEqual(run(backend, source, 2999), 5998,
+                             backend.__name__)
+            self.assertEqual(run(backend, source, 3000), 0,
+                             backend.__name__)
+
+    def test_expressions(self):
+        for value, expected in (("(" * 2000 + "n" + " + 1)" * 2000, 2002),
+                                ("n" + " - 1" * 2000, -1998),
+                                ("- " * 2000 + "n", 2),
+                                ("n > 0 && " * 2000 + "n", 2)):
+            source = "int f(int n) { return %s; }" % value
+
+            for backend in BACKENDS:
+                self.assertEqual(run(backend, source, 2), expected,
+                                 backend.__name__)
+
+    def test_too_deep(self):
+        # Calls still nest by recursion, which gets reported as an error
+        # rather than crashing.
+        source = "int f(int n) { return %sn%s; }" % ("f(" * 5000, ")" * 5000)
+
+        for backend in BACKENDS:
+            with self.assertRaises(NestingError):
+                run(backend, source, 0)
+
+
+class RangeForTest(unittest.TestCase):
+    # Loops of the form `for (i = a; i < b; i++)` run as Python for loops
+    # over a range, or over a tuple for up to 16 known values, and must
+    # still leave i where C does.
+
+    def test_completed(self):
+        for header, expected in (("i = 0; i < n; i++", (10, 45)),
+                                 ("i = 0; i <= n; i++", (11, 55)),
+                                 ("i = n; i > 0; i--", (0, 55)),
+                                 ("i = n; i >= 0; i--", (-1, 55)),
+                                 ("i = 0; i < 3; i++", (3, 3)),
+                                 ("i = 10; i < n; i++", (10, 0)),
+                                 ("i = 0; i < 100; i++", (100, 4950))):
+            source = """
+            int f(int n) {
+                int i;
+                int s = 0;
+                for (%s) s += i;
+                return i * 10000 + s;
+            }
+            """ % header
+
+            for backend in BACKENDS:
+                self.assertEqual(run(backend, source, 10),
+                                 expected[0] * 10000 + expected[1],
+                                 (header, backend.__name__))
+
+    def test_break(self):
+        # A loop left by break leaves i where it broke.
+        for bound in ("n", "12"):
+            source = """
+            int f(int n) {
+                int i;
+                for (i = 0; i < %s; i++)
+                    if (i * i > 20) break;
+                return i;
+            }
+            """ % bound
+
+            for backend in BACKENDS:
+                self.assertEqual(run(backend, source, 12), 5,
+                                 (bound, backend.__name__))
+                self.assertEqual(run(backend, source, 3), 3 if bound == "n"
+                                 else 5, (bound, backend.__name__))
+
+    def test_continue(self):
+        for bound in ("n", "8"):
+            source = """
+            int f(int n) {
+                int i;
+                int s = 0;
+                for (i = 0; i < %s; i++) {
+                    if (i %% 2) continue;
+                    s += i;
+                }
+                return i * 100 + s;
+            }
+            """ % bound
+
+            for backend in BACKENDS:
+                self.assertEqual(run(backend, source, 8), 812,
+                                 (bound, backend.__name__))
+
+
+class TailCallTest(unittest.TestCase):
+    # Self tail calls jump back to the top of the function instead of
+    # calling it again.
+
+    def test_deep(self):
+        source = """
+        int f(int n, int s) {
+            if (n == 0) return s;
+            return f(n - 1, s + n);
+        }
+        """
+        for backend in BACKENDS:
+            self.assertEqual(run(backend, source, 100000, 0), 5000050000,
+                             backend.__name__)
+
+    def test_shuffled_arguments(self):
+        # Every argument is evaluated before any parameter is rebound.
+        for source, args, expected in (
+                ("int f(int a, int b) { if (b == 0) return a;"
+                 " return f(b, a % b); }", (1071, 462), 21),
+                ("int f(int a, int b, int n) { if (n == 0) return a * 10 + b;"
+                 " return f(b, a, n - 1); }", (1, 2, 3), 21),
+                ("int f(int a, int b, int c) { if (a > 50) return a + b + c;"
+                 " return f(b + c, a, b); }", (1, 2, 3), 125)):
+            for backend in BACKENDS:
+                self.assertEqual(run(backend, source, *args), expected,
+                                 backend.__name__)
+
+    def test_conversions(self):
+        # Arguments are converted to their parameters' types, as in a call.
+        source = """
+        int f(int a, int n) {
+            if (n == 0) return a;
+            return f(a * 1.5, n - 1);
+        }
+        """
+        for backend in BACKENDS:
+            self.assertEqual(run(backend, source, 2, 3), 6, backend.__name__)
+
+
+class InlineTest(unittest.TestCase):
+    # Calls to small functions that return an expression of their
+    # parameters, possibly picked by an if, are replaced by it.
+
+    def test_inlined(self):
+        source = """
+        int sign(int x) { if (x > 0) return 1; return -1; }
+        float half(int x) { return x / 2.0; }
+        int f(int n) { return sign(n) * 10 + half(n) + half(n + 1); }
+        """
+        for backend in BACKENDS:
+            f = compile_f(backend, source, inline=24)
+
+            self.assertEqual(f(4), 14, backend.__name__)
+            self.assertEqual(f(-3), -12, backend.__name__)
+            self.assertNotIn("sign", f.__code__.co_names, backend.__name__)
+            self.assertNotIn("half", f.__code__.co_names, backend.__name__)
+
+    def test_not_inlined(self):
+        # Functions with more than one early return, recursive functions
+        # and the functions that call them are called as they are.
+        source = """
+        int sign(int x) {
+            if (x > 0) return 1;
+            if (x < 0) return -1;
+            return 0;
+        }
+        int fact(int n) { if (n < 2) return 1; return n * fact(n - 1); }
+        int twice(int n) { return fact(n) * 2; }
+        int f(int n) { return sign(n) * 1000 + twice(n); }
+        """
+        for backend in BACKENDS:
+            f = compile_f(backend, source, inline=24)
+
+            self.assertEqual(f(5), 1240, backend.__name__)
+            self.assertEqual(f(0), 2, backend.__name__)
+            self.assertEqual(f(-2), -998, backend.__name__)
+
+            for name in ("sign", "twice"):
+                self.assertIn(name, f.__code__.co_names, backend.__name__)
+
+    def test_arguments(self):
+        # Arguments that aren't cheap and pure are still evaluated once.
+        source = """
+        int g(int x) { print(x); return x; }
+        int twice(int x) { return x + x; }
+        int f(int n) { return twice(g(n)) + twice(n * 2); }
+        """
+        for backend in BACKENDS:
+            f = compile_f(backend, source, inline=24)
+            stdout, sys.stdout = sys.stdout, StringIO()
+
+            try:
+                self.assertEqual(f(3), 18, backend.__name__)
+                self.assertEqual(sys.stdout.getvalue(), "3\n",
+                                 backend.__name__)
+            finally:
+                sys.stdout = stdout
+
+
+if __name__ == "__main__":
+    unittest.main()
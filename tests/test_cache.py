@@ -0,0 +1,101 @@
+"""Tests of the code object cache, run with `python -m unittest discover
+tests` from the top of the repository."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cache import Cache, source_key
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        # Nothing here may touch the user's own cache.
+        self.path = tempfile.mkdtemp()
+        self.environ = os.environ.get("COBRA_CACHE")
+        os.environ["COBRA_CACHE"] = self.path
+
+    def tearDown(self):
+        if self.environ is None:
+            del os.environ["COBRA_CACHE"]
+        else:
+            os.environ["COBRA_CACHE"] = self.environ
+
+        shutil.rmtree(self.path)
+
+    def code(self, value):
+        return compile("x = {!r}".format(value), "<test>", "exec")
+
+    def test_put_get(self):
+        cache = Cache(self.path)
+        code = self.code(1)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertTrue(cache.put("a", code))
+        self.assertEqual(cache.get("a"), code)
+
+        # Entries are written whole under another name and renamed into
+        # place, so none is left behind.
+        self.assertTrue(cache.put("a", self.code(2)))
+        self.assertEqual(cache.get("a"), self.code(2))
+        self.assertEqual(os.listdir(self.path), ["a.cbc"])
+
+    def test_corrupt(self):
+        # A partial entry is a miss, and gets removed.
+        cache = Cache(self.path)
+        cache.put("a", self.code(1))
+
+        with open(cache.entry("a"), "r+b") as file_:
+            file_.truncate(10)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertFalse(os.path.exists(cache.entry("a")))
+
+    def test_eviction(self):
+        cache = Cache(self.path)
+        cache.put("a", self.code(1))
+        size = os.path.getsize(cache.entry("a"))
+        cache.max_size = 2 * size
+        cache.put("b", self.code(2))
+
+        # a is older than b, until reading it makes it the most recently
+        # used entry.
+        os.utime(cache.entry("a"), (1000, 1000))
+        os.utime(cache.entry("b"), (2000, 2000))
+        cache.get("a")
+        cache.put("c", self.code(3))
+
+        self.assertEqual(sorted(os.listdir(self.path)), ["a.cbc", "c.cbc"])
+
+        cache.clear()
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_unwritable(self):
+        # A cache that can't be written to misses rather than raising.
+        path = os.path.join(self.path, "file")
+        open(path, "w").close()
+        cache = Cache(path)
+
+        self.assertFalse(cache.put("a", self.code(1)))
+        self.assertIsNone(cache.get("a"))
+
+    def test_salts(self):
+        key = source_key(StringIO("int main() {}"), "ast", 1)
+
+        self.assertEqual(source_key(StringIO("int main() {}"), "ast", 1), key)
+        self.assertNotEqual(source_key(StringIO("int main() {}"), "ast", 2),
+                            key)
+        self.assertNotEqual(source_key(StringIO("int main() {}"), "ast"), key)
+        self.assertNotEqual(source_key(StringIO("int main() { }"), "ast", 1),
+                            key)
+        self.assertNotEqual(source_key(StringIO(""), "ab"),
+                            source_key(StringIO(""), "a", "b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
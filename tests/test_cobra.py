@@ -0,0 +1,101 @@
+"""Tests of the cobra command line, run with `python -m unittest
+discover tests` from the top of the repository."""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+COBRA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "..", "cobra")
+
+FIB = """
+int fib(int n) {
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}
+
+int main() {
+    print(fib(20));
+    return 0;
+}
+"""
+
+# Functions named after the ones of the cobra script itself.
+RUNNING = """
+int running(int n) {
+    return n + 1;
+}
+
+int main() {
+    print(running(41));
+    return 0;
+}
+"""
+
+
+class CobraTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source):
+        "Write source to the file name in the test's directory."
+        filename = os.path.join(self.directory, name)
+
+        with open(filename, "w") as file_:
+            file_.write(source)
+
+        return filename
+
+    def cobra(self, *args):
+        "Run cobra with args, returning its status, stdout and stderr."
+        environment = dict(os.environ, COBRA_CACHE=self.directory)
+        process = subprocess.Popen(
+            [sys.executable, COBRA] + list(args), env=environment,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = process.communicate()
+        return process.returncode, stdout, stderr
+
+    def test_memoize_before_filename(self):
+        filename = self.write("prog.c", FIB)
+        status, stdout, stderr = self.cobra("--memoize", filename)
+
+        self.assertEqual(status, 0, stderr)
+        self.assertEqual(stdout, "6765\n")
+        self.assertIn("memoize: fib:", stderr)
+
+    def test_memoize_size(self):
+        filename = self.write("prog.c", FIB)
+        status, stdout, stderr = self.cobra("--memoize-size", "0", filename)
+
+        self.assertEqual(status, 0, stderr)
+        self.assertEqual(stdout, "6765\n")
+        self.assertIn("memoize: fib:", stderr)
+
+    def test_program_namespace(self):
+        filename = self.write("prog.c", RUNNING)
+
+        for args in [(), ("--stream",), ("--no-cache",)]:
+            status, stdout, stderr = self.cobra(*(args + (filename,)))
+            self.assertEqual(status, 0, stderr)
+            self.assertEqual(stdout, "42\n", args)
+
+    def test_linked_namespace(self):
+        running, main = RUNNING.split("int main")
+        filenames = [self.write("running.c", running),
+                     self.write("main.c", "int running(int n);\nint main" +
+                                main)]
+        status, stdout, stderr = self.cobra(*filenames)
+
+        self.assertEqual(status, 0, stderr)
+        self.assertEqual(stdout, "42\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""Tests of separate compilation, building and linking, run with `python -m
+unittest discover tests` from the top of the repository."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cache import Cache
+from codegen import BytecodeCodegen, Codegen
+from driver import (Builder, LinkError, Object, compile_objects, link,
+                    object_filename)
+
+BACKENDS = (Codegen, BytecodeCodegen)
+
+SQUARE = """
+int square(int n) {
+    return n * n;
+}
+"""
+
+MAIN = """
+int square(int n);
+
+int main() {
+    return square(7) + 1;
+}
+"""
+
+
+class DriverTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source):
+        "Write source to the file name in the test's directory."
+        filename = os.path.join(self.directory, name)
+
+        with open(filename, "w") as file_:
+            file_.write(source)
+
+        return filename
+
+
+class LinkTest(DriverTest):
+    def link(self, sources, backend=Codegen, entry="main"):
+        """Compile and link the files of sources, a list of (name, source)
+        pairs, returning the namespace they were linked in."""
+        filenames = [self.write(name, source) for name, source in sources]
+        namespace = {}
+        link(compile_objects(filenames, jobs=1, backend=backend), namespace,
+             entry)
+        return namespace
+
+    def errors(self, sources, entry="main"):
+        "The errors linking the files of sources raises."
+        with self.assertRaises(LinkError) as context:
+            self.link(sources, entry=entry)
+
+        return context.exception.errors
+
+    def test_program(self):
+        for backend in BACKENDS:
+            namespace = self.link([("square.c", SQUARE), ("main.c", MAIN)],
+                                  backend)
+            self.assertEqual(namespace["main"](), 50, backend.__name__)
+
+    def test_multiple_definitions(self):
+        errors = self.errors([("square.c", SQUARE), ("main.c", MAIN),
+                              ("again.c", SQUARE)])
+
+        self.assertEqual(len(errors), 1, errors)
+        self.assertIn("again.c: multiple definition of 'square', first "
+                      "defined in ", errors[0])
+        self.assertIn("square.c", errors[0])
+
+    def test_undefined_callee(self):
+        errors = self.errors([("main.c", MAIN)])
+
+        self.assertEqual(len(errors), 1, errors)
+        self.assertIn("main.c: undefined reference to 'square'", errors[0])
+
+    def test_conflicting_types(self):
+        errors = self.errors([("square.c", SQUARE.replace("int n", "float n")),
+                              ("main.c", MAIN)])
+
+        self.assertEqual(len(errors), 1, errors)
+        self.assertIn("main.c: conflicting types for 'square'", errors[0])
+
+    def test_missing_main(self):
+        self.assertEqual(self.errors([("square.c", SQUARE)]),
+                         ["undefined reference to 'main'"])
+
+        # Libraries have no entry point.
+        namespace = self.link([("square.c", SQUARE)], entry=None)
+        self.assertEqual(namespace["square"](3), 9)
+
+    def test_every_error(self):
+        errors = self.errors([("main.c", MAIN), ("a.c", SQUARE),
+                              ("b.c", SQUARE), ("c.c", "int f(int n);\n"
+                                                "int g() { return 1; }")],
+                             entry="start")
+
+        self.assertEqual(len(errors), 3, errors)
+        self.assertIn("undefined reference to 'f'", errors[1])
+        self.assertEqual(errors[2], "undefined reference to 'start'")
+
+
+class BuildTest(DriverTest):
+    def setUp(self):
+        super(BuildTest, self).setUp()
+        self.cache = Cache(os.path.join(self.directory, "cache"))
+        self.filenames = [self.write("square.c", SQUARE),
+                          self.write("main.c", MAIN)]
+
+    def main(self, objects):
+        "Link objects and run their main."
+        namespace = {}
+        link(objects, namespace)
+        return namespace["main"]()
+
+    def test_incremental(self):
+        builder = Builder(jobs=1, cache=self.cache)
+        self.assertEqual(self.main(builder.build(self.filenames)), 50)
+        self.assertEqual(builder.compiled, self.filenames)
+
+        # Only the files that changed since the last build are compiled.
+        builder.build(self.filenames)
+        self.assertEqual(builder.compiled, [])
+
+        self.write("main.c", MAIN.replace("+ 1", "+ 2"))
+        self.assertEqual(self.main(builder.build(self.filenames)), 51)
+        self.assertEqual(builder.compiled, self.filenames[1:])
+
+        # As are all of them, when built differently.
+        builder = Builder(jobs=1, cache=self.cache, salts=("-O",),
+                          optimize=True)
+        self.assertEqual(self.main(builder.build(self.filenames)), 51)
+        self.assertEqual(builder.compiled, self.filenames)
+
+    def test_object_files(self):
+        for object_ in Builder(jobs=1).build(self.filenames):
+            object_.save(object_filename(object_.filename))
+
+        # Object files are loaded rather than compiled, and link with
+        # sources.
+        paths = [object_filename(filename) for filename in self.filenames]
+        builder = Builder(jobs=1)
+        self.assertEqual(self.main(builder.build(paths)), 50)
+        self.assertEqual(builder.compiled, [])
+
+        self.assertEqual(
+            self.main(builder.build([paths[0], self.filenames[1]])), 50
+        )
+        self.assertEqual(builder.compiled, self.filenames[1:])
+
+    def test_bad_object_file(self):
+        path = self.write("main.cbo", "not an object")
+
+        with self.assertRaises(LinkError) as context:
+            Object.load(path)
+
+        self.assertEqual(context.exception.errors,
+                         ["{}: not an object file of this Python"
+                          .format(path)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Tests of the lexer, run with `python -m unittest discover tests` from
+the top of the repository."""
+
+import os
+import sys
+import unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from lexer import LexerError, lex, lex_stream
+
+SOURCE = """\
+/* A comment that runs on
+   for a good many characters, over two lines. */
+int f(int a, float b) {
+    // A line comment that is longer than the lookahead.
+    char *s = "a string longer than the lookahead, with \\"quotes\\"";
+    if (a >= 10 && b != 0.25) a = a << 1;
+    else if (a <= -1 || !a) a -= 0x1F;
+    else   if (a == 'c') a += 1;
+    else a++;
+    return a >> 2;
+}
+"""
+
+
+class StreamTest(unittest.TestCase):
+    def test_chunks(self):
+        # Tokens come out the same however the source is split into
+        # chunks, even inside strings, comments and operators.
+        success, tokens = lex(SOURCE)
+        self.assertTrue(success, tokens)
+        self.assertIn(("KEYWORD", "else if"),
+                      [(token.type_, token.value) for token in tokens])
+
+        for chunk_size in (1, 2, 17):
+            self.assertEqual(
+                list(lex_stream(StringIO(SOURCE), chunk_size)), tokens,
+                chunk_size
+            )
+
+    def test_error(self):
+        for chunk_size in (1, 2, 17):
+            with self.assertRaises(LexerError):
+                list(lex_stream(StringIO("int a = 1;\n$"), chunk_size))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests of the optimizer passes, run with `python -m unittest discover
+tests` from the top of the repository."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from codegen import Codegen
+from lexer import lex
+from optimizer import AlgebraicSimplification, Optimizer, StrengthReduction
+from parser import *
+
+
+def optimize(source, passes):
+    "The top-level nodes of source, run through passes."
+    success, tokens = lex(source)
+    assert success, tokens
+
+    return list(Optimizer(Parser(tokens), passes, module_passes=()).parse())
+
+
+def run(source, passes, name, *args):
+    "Call the function name of source, run through passes, with args."
+    success, tokens = lex(source)
+    assert success, tokens
+
+    namespace = {}
+    parser = Optimizer(Parser(tokens), passes, module_passes=())
+    exec Codegen(parser).gen_code("<test>") in namespace
+    return namespace[name](*args)
+
+
+def printed(function):
+    "The arguments of the print call ending the body of function."
+    return function.body[-2].arguments
+
+
+class AlgebraicSimplificationTest(unittest.TestCase):
+    def simplify(self, source):
+        nodes = optimize(source, [AlgebraicSimplification()])
+        return [NODES[node.kind] for node in printed(nodes[0])]
+
+    def test_int_locals(self):
+        kinds = self.simplify("""
+        int f(int n) {
+            int x = n * 2;
+            x = x + 1;
+            print(x + 0, 0 + x, x * 1, x << 0, x | 0, - -x, ~~x);
+            return 0;
+        }
+        """)
+        self.assertEqual(kinds, [NODES[NIDENTIFIER]] * 7)
+
+    def test_float_locals(self):
+        # -0.0 + 0 is 0.0, so adding 0 to a float has to stay.
+        kinds = self.simplify("""
+        int f(float q) {
+            float y = q * 2;
+            print(y - 0, y * 1, y / 1, - -y, y + 0);
+            return 0;
+        }
+        """)
+        self.assertEqual(kinds, [NODES[NIDENTIFIER]] * 4 + [NODES[NBINARY]])
+
+    def test_maybe_bool(self):
+        # A comparison assigned to an int, or passed to a parameter,
+        # prints as True where x + 0 prints 1.
+        kinds = self.simplify("""
+        int f(int p) {
+            int b = p < 3;
+            int c;
+            c = b;
+            print(b + 0, c * 1, p + 0);
+            return 0;
+        }
+        """)
+        self.assertEqual(kinds, [NODES[NBINARY]] * 3)
+
+
+class StrengthReductionTest(unittest.TestCase):
+    def test_empty_for_body(self):
+        source = """
+        int f(int n) {
+            int i;
+            for (i = 0; i * 4 < n; i++);
+            return i;
+        }
+        """
+        function = optimize(source, [StrengthReduction()])[0]
+        loop, = [node for node in walk(function) if node.kind == NFOR]
+
+        self.assertEqual(loop.condition.left.kind, NIDENTIFIER)
+        self.assertEqual(run(source, [StrengthReduction()], "f", 10), 3)
+        self.assertEqual(run(source, [], "f", 10), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
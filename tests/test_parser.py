@@ -0,0 +1,51 @@
+"""Tests of the parser, run with `python -m unittest discover tests` from
+the top of the repository."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from lexer import lex
+from parser import Parser, walk
+
+
+def parse(source):
+    success, tokens = lex(source)
+    assert success, tokens
+    return Parser(tokens).parse()
+
+
+class PositionTest(unittest.TestCase):
+    def test_statements(self):
+        function, = parse("int f(int a) {\n"
+                          "    int b = a;\n"
+                          "    b += a * 2;\n"
+                          "    g(b);\n"
+                          "      b++;\n"
+                          "    return g(b);\n"
+                          "}\n")
+        declaration, assignment, call, increment, return_ = function.body
+
+        self.assertEqual((function.line, function.column), (1, 0))
+        self.assertEqual((declaration.line, declaration.column), (2, 4))
+        self.assertEqual((assignment.line, assignment.column), (3, 4))
+        self.assertEqual((call.line, call.column), (4, 4))
+        self.assertEqual((increment.line, increment.column), (5, 6))
+        self.assertEqual((return_.line, return_.column), (6, 4))
+
+        # The call returned is an expression, which has no position.
+        self.assertIsNone(return_.value.line)
+
+    def test_expressions(self):
+        # Only the expressions used as statements have positions.
+        function, = parse("int f(int a) { return -a * 2 + g(a++); }")
+
+        for node in walk(function.body[0].value):
+            self.assertIsNone(node.line)
+            self.assertIsNone(node.column)
+
+
+if __name__ == "__main__":
+    unittest.main()